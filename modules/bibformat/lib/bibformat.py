@@ -48,7 +48,9 @@ from invenio.config import \
      CFG_SITE_URL, \
      CFG_BIBFORMAT_HIDDEN_TAGS, \
      CFG_SITE_RECORD, \
-     CFG_BIBFORMAT_DISABLE_I18N_FOR_CACHED_FORMATS
+     CFG_BIBFORMAT_DISABLE_I18N_FOR_CACHED_FORMATS, \
+     CFG_BIBUPLOAD_SERIALIZE_RECORD_STRUCTURE
+from invenio.dbquery import deserialize_via_marshal
 from invenio.bibformat_config import \
      CFG_BIBFORMAT_USE_OLD_BIBFORMAT
 from invenio.access_control_engine import acc_authorize_action
@@ -59,7 +61,8 @@ import sys
 ##
 
 def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
-                  xml_record=None, user_info=None, on_the_fly=False):
+                  xml_record=None, user_info=None, on_the_fly=False,
+                  prefetched=None):
     """
     Format a record in given output format.
 
@@ -97,10 +100,14 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
     @param user_info: the information of the user who will view the formatted page (if applicable)
     @param on_the_fly: if False, try to return an already preformatted version of the record in the database
     @type on_the_fly: boolean
+    @param prefetched: the data of the record fetched beforehand, along with the ones of other records, by L{get_prefetched_records_data}
+    @type prefetched: dict
     @return: formatted record
     @rtype: string
     """
     from invenio.search_engine import record_exists
+    if prefetched is None:
+        prefetched = {}
     if search_pattern is None:
         search_pattern = []
 
@@ -114,12 +121,13 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
     if CFG_BIBFORMAT_USE_OLD_BIBFORMAT and CFG_PATH_PHP:
         return bibformat_engine.call_old_bibformat(recID, of=of, on_the_fly=on_the_fly)
     ############################# END ##################################
-    if not on_the_fly and \
-       (ln == CFG_SITE_LANG or \
-        of.lower() == 'xm' or \
-        CFG_BIBFORMAT_USE_OLD_BIBFORMAT or \
-        (of.lower() in CFG_BIBFORMAT_DISABLE_I18N_FOR_CACHED_FORMATS)) and \
-        record_exists(recID) != -1:
+    use_preformatted_p = use_preformatted_record_p(of, ln, on_the_fly)
+    if use_preformatted_p:
+        if prefetched.has_key('exists'):
+            use_preformatted_p = prefetched['exists'] != -1
+        else:
+            use_preformatted_p = record_exists(recID) != -1
+    if use_preformatted_p:
         # Try to fetch preformatted record. Only possible for records
         # formatted in CFG_SITE_LANG language (other are never
         # stored), or of='xm' which does not depend on language.
@@ -128,7 +136,10 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
         # always served from the same cache for any language.  Also,
         # do not fetch from DB when record has been deleted: we want
         # to return an "empty" record in that case
-        res = bibformat_dblayer.get_preformatted_record(recID, of)
+        if prefetched.has_key('preformatted'):
+            res = prefetched['preformatted']
+        else:
+            res = bibformat_dblayer.get_preformatted_record(recID, of)
         if res is not None:
             # record 'recID' is formatted in 'of', so return it
             if verbose == 9:
@@ -170,7 +181,8 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
                                               verbose=verbose,
                                               search_pattern=search_pattern,
                                               xml_record=xml_record,
-                                              user_info=user_info)
+                                              user_info=user_info,
+                                              record=prefetched.get('record'))
         if of.lower() == 'xm':
             out = filter_hidden_fields(out, user_info)
         return out
@@ -202,6 +214,77 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
                                                                  recID = recID,
                                                                  )
 
+def use_preformatted_record_p(of, ln=CFG_SITE_LANG, on_the_fly=False):
+    """
+    Tells if records formatted in given output format and language
+    can be fetched from their preformatted version in the database.
+
+    Only possible for records formatted in CFG_SITE_LANG language
+    (other are never stored), or of='xm' which does not depend on
+    language.  Exceptions are made for output formats defined in
+    CFG_BIBFORMAT_DISABLE_I18N_FOR_CACHED_FORMATS, which are always
+    served from the same cache for any language.
+
+    @param of: an output format code
+    @param ln: the language to use to format the records
+    @param on_the_fly: if True, records are always formatted on the fly
+    @return: True if preformatted records can be used
+    """
+    return not on_the_fly and \
+           (ln == CFG_SITE_LANG or \
+            of.lower() == 'xm' or \
+            CFG_BIBFORMAT_USE_OLD_BIBFORMAT or \
+            (of.lower() in CFG_BIBFORMAT_DISABLE_I18N_FOR_CACHED_FORMATS))
+
+def get_prefetched_records_data(recIDs, of, ln=CFG_SITE_LANG, on_the_fly=False):
+    """
+    Fetches at once, for all the given records, the data that
+    L{format_record} would otherwise fetch with several queries per
+    record: whether the record exists, its preformatted version in
+    given output format if it can be used, and, for the records to be
+    formatted on the fly, their record structure.
+
+    The data of a record is to be given to L{format_record} (or
+    search_engine.print_record) as 'prefetched' parameter.
+
+    @param recIDs: a list of record IDs
+    @param of: an output format code
+    @param ln: the language to use to format the records
+    @param on_the_fly: if True, records are always formatted on the fly
+    @return: dictionary {recID: prefetched data}
+    """
+    from invenio.search_engine import records_exist
+    out = {}
+    recIDs = [recID for recID in recIDs if isinstance(recID, (int, long))]
+    if not recIDs:
+        return out
+    existence = records_exist(recIDs)
+    for recID in recIDs:
+        out[recID] = {'exists': existence[recID]}
+
+    to_format = recIDs
+    if use_preformatted_record_p(of, ln, on_the_fly):
+        # Deleted records are never served from the preformatted ones
+        preformatted = bibformat_dblayer.get_preformatted_records(
+            [recID for recID in recIDs if existence[recID] != -1], of)
+        for recID in recIDs:
+            if existence[recID] != -1:
+                out[recID]['preformatted'] = preformatted.get(recID)
+        to_format = [recID for recID in recIDs
+                     if out[recID].get('preformatted') is None]
+
+    if CFG_BIBUPLOAD_SERIALIZE_RECORD_STRUCTURE and to_format:
+        recstructs = bibformat_dblayer.get_preformatted_records(to_format,
+                                                                'recstruct',
+                                                                decompress=str)
+        for recID, value in recstructs.iteritems():
+            try:
+                out[recID]['record'] = deserialize_via_marshal(value)
+            except:
+                # In case of corruption, let BibFormatObject rebuild it
+                pass
+    return out
+
 def record_get_xml(recID, format='xm', decompress=zlib.decompress):
     """
     Returns an XML string of the record given by recID.
@@ -301,8 +384,11 @@ def format_records(recIDs, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
     #Fill one of the lists with Nones
     if xml_records is not None:
         recIDs = map(lambda x:None, xml_records)
+        prefetched = {}
     else:
         xml_records = map(lambda x:None, recIDs)
+        # Fetch the data of all records at once
+        prefetched = get_prefetched_records_data(recIDs, of, ln, on_the_fly)
 
     total_rec = len(recIDs)
     last_iteration = False
@@ -325,7 +411,8 @@ def format_records(recIDs, of, ln=CFG_SITE_LANG, verbose=0, search_pattern=None,
         #Print formatted record
         formatted_record = format_record(recIDs[i], of, ln, verbose, \
                                          search_pattern, xml_records[i],\
-                                         user_info, on_the_fly)
+                                         user_info, on_the_fly,
+                                         prefetched.get(recIDs[i]))
         formatted_records += formatted_record
         if req is not None:
             req.write(formatted_record)
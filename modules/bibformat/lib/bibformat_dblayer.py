@@ -471,6 +471,35 @@ def get_preformatted_record(recID, of, decompress=zlib.decompress):
     else:
         return None
 
+def get_preformatted_records(recIDs, of, decompress=zlib.decompress):
+    """
+    Returns the preformatted records with ids 'recIDs' and format
+    'of', fetched with one query.
+
+    Records that are not formatted in given output format are not
+    part of the returned dictionary.
+
+    @param recIDs: the list of ids of the records to fetch
+    @param of: the output format code
+    @param decompress: the method used to decompress the preformatted records in database
+    @return: dictionary {recID: formatted record}
+    """
+    if not recIDs:
+        return {}
+    # Decide whether to use DB slave:
+    if of in ('xm', 'recstruct'):
+        run_on_slave = False # for master formats, use DB master
+    else:
+        run_on_slave = True # for other formats, we can use DB slave
+    query = "SELECT id_bibrec, value FROM bibfmt WHERE format=%%s AND id_bibrec IN (%s)" % \
+            ','.join(['%s'] * len(recIDs))
+    params = (of,) + tuple(recIDs)
+    res = run_sql(query, params, run_on_slave=run_on_slave)
+    out = {}
+    for recID, value in res:
+        out[recID] = decompress(value)
+    return out
+
 def get_preformatted_record_date(recID, of):
     """
     Returns the date of the last update of the cache for the considered
@@ -497,6 +526,36 @@ def get_preformatted_record_date(recID, of):
     else:
         return None
 
+def get_format_elements_cache(recID, decompress=zlib.decompress):
+    """
+    Returns the cached outputs of the format elements for record 'recID'
+
+    @param recID: the id of the record
+    @param decompress: the method used to decompress the cached outputs in database
+    @return: dictionary {cache key: (version, output)}
+    """
+    query = """SELECT cache_key, version, value FROM bibfmtELEMENTCACHE
+               WHERE id_bibrec=%s"""
+    res = run_sql(query, (recID,))
+    return dict([(cache_key, (version, decompress(value)))
+                 for cache_key, version, value in res])
+
+def set_format_element_cache(recID, cache_key, version, value,
+                             compress=zlib.compress):
+    """
+    Stores the output 'value' of a format element for record 'recID'
+
+    @param recID: the id of the record
+    @param cache_key: the key of the element output (element, parameters, etc.)
+    @param version: the version of the data the output depends on
+    @param value: the output of the element
+    @param compress: the method used to compress the output in database
+    """
+    query = """REPLACE LOW_PRIORITY INTO bibfmtELEMENTCACHE
+               (id_bibrec, cache_key, version, value)
+               VALUES (%s, %s, %s, %s)"""
+    run_sql(query, (recID, cache_key, version, compress(value)))
+
 ## def keep_formats_in_db(output_formats):
 ##     """
 ##     Remove from db formats that are not in the list
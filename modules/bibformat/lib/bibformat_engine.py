@@ -47,11 +47,16 @@ import inspect
 import traceback
 import zlib
 import cgi
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
 
 from invenio.config import \
      CFG_PATH_PHP, \
      CFG_BINDIR, \
-     CFG_SITE_LANG
+     CFG_SITE_LANG, \
+     CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS
 from invenio.errorlib import \
      register_exception
 from invenio.bibrecord import \
@@ -95,6 +100,7 @@ if CFG_PATH_PHP: #Remove when call_old_bibformat is removed
 format_templates_cache = {}
 format_elements_cache = {}
 format_outputs_cache = {}
+compiled_format_templates_cache = {} # (filename, ln) -> (mtime, compiled template)
 
 html_field = '<!--HTML-->' # String indicating that field should be
                            # treated as HTML (and therefore no escaping of
@@ -291,7 +297,8 @@ def call_old_bibformat(recID, of="HD", on_the_fly=False, verbose=0):
         return out
 
 def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0,
-                  search_pattern=None, xml_record=None, user_info=None):
+                  search_pattern=None, xml_record=None, user_info=None,
+                  record=None):
     """
     Formats a record given output format. Main entry function of
     bibformat engine.
@@ -318,6 +325,7 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0,
     @param search_pattern: list of strings representing the user request in web interface
     @param xml_record: an xml string representing the record to format
     @param user_info: the information of the user who will view the formatted page
+    @param record: the record structure of record recID, if already fetched
     @return: formatted record
     """
     if search_pattern is None:
@@ -333,7 +341,8 @@ def format_record(recID, of, ln=CFG_SITE_LANG, verbose=0,
     # But if format not found for new BibFormat, then call old BibFormat
 
     #Create a BibFormat Object to pass that contain record and context
-    bfo = BibFormatObject(recID, ln, search_pattern, xml_record, user_info, of)
+    bfo = BibFormatObject(recID, ln, search_pattern, xml_record, user_info, of,
+                          record)
 
     if of.lower() != 'xm' and \
            (not bfo.get_record() or len(bfo.get_record()) <= 1):
@@ -448,31 +457,25 @@ def format_with_format_template(format_template_filename, bfo,
                                                        9: errors and warnings, stop if error (debug mode ))
     @return: formatted text
     """
-    _ = gettext_set_language(bfo.lang)
-
-    def translate(match):
-        """
-        Translate matching values
-        """
-        word = match.group("word")
-        translated_word = _(word)
-        return translated_word
-
-    if format_template_code is not None:
-        format_content = str(format_template_code)
-    else:
-        format_content = get_format_template(format_template_filename)['code']
-
     if format_template_filename is None or \
            format_template_filename.endswith("."+CFG_BIBFORMAT_FORMAT_TEMPLATE_EXTENSION):
         # .bft
-        filtered_format = filter_languages(format_content, bfo.lang)
-        localized_format = translation_pattern.sub(translate, filtered_format)
+        if format_template_code is not None:
+            compiled_format = compile_format_template(str(format_template_code),
+                                                      bfo.lang, verbose)
+        else:
+            compiled_format = get_compiled_format_template(format_template_filename,
+                                                           bfo.lang, verbose)
 
-        evaluated_format = eval_format_template_elements(localized_format,
+        evaluated_format = eval_compiled_format_template(compiled_format,
                                                          bfo,
                                                          verbose)
     else:
+        if format_template_code is not None:
+            format_content = str(format_template_code)
+        else:
+            format_content = get_format_template(format_template_filename)['code']
+
         #.xsl
         if bfo.xml_record:
             # bfo was initialized with a custom MARCXML
@@ -505,57 +508,188 @@ def eval_format_template_elements(format_template, bfo, verbose=0):
                     9: errors and warnings, stop if error (debug mode ))
     @return: tuple (result, errors)
     """
-    _ = gettext_set_language(bfo.lang)
-    # First define insert_element_code(match), used in re.sub() function
-    def insert_element_code(match):
-        """
-        Analyses 'match', interpret the corresponding code, and return the result of the evaluation.
+    compiled_format = compile_format_template_elements(format_template, verbose)
+    return eval_compiled_format_template(compiled_format, bfo, verbose)
 
-        Called by substitution in 'eval_format_template_elements(...)'
+def compile_format_template_elements(format_template, verbose=0):
+    """
+    Parses the special tags of the given template code, once and for
+    all, so that it can be evaluated for many records with
+    L{eval_compiled_format_template}.
 
-        @param match: a match object corresponding to the special tag that must be interpreted
-        """
+    The template is compiled into the ordered list of its literal
+    chunks, left as strings, and of its special tags
+    <BFE_format_element_name [param="value"]* />, as tuples
+    (element name, format element structure as returned by
+    get_format_element or None if it could not be loaded, dict of
+    parameters).
+
+    @param format_template: the format template code
+    @param verbose: the level of verbosity from 0 to 9 (O: silent,
+                    5: errors, 7: errors and warnings,
+                    9: errors and warnings, stop if error (debug mode ))
+    @return: the compiled template
+    """
+    compiled_format = []
+    last_end = 0
+    for match in pattern_tag.finditer(format_template):
+        if match.start() > last_end:
+            compiled_format.append(format_template[last_end:match.start()])
+        last_end = match.end()
 
         function_name = match.group("function_name")
         try:
             format_element = get_format_element(function_name, verbose)
-        except Exception, e:
+        except Exception:
+            # Reported when evaluating the template
             format_element = None
-            if verbose >= 5:
-                return '<b><span style="color: rgb(255, 0, 0);">' + \
-                       cgi.escape(str(e)).replace('\n', '<br/>') + \
-                       '</span>'
+
+        params = {}
+        # Look for function parameters given in format template code
+        all_params = match.group('params')
+        if all_params is not None:
+            function_params_iterator = pattern_function_params.finditer(all_params)
+            for param_match in function_params_iterator:
+                name = param_match.group('param')
+                value = param_match.group('value')
+                params[name] = value
+
+        compiled_format.append((function_name, format_element, params))
+
+    if last_end < len(format_template):
+        compiled_format.append(format_template[last_end:])
+    return compiled_format
+
+def compile_format_template(format_template, ln=CFG_SITE_LANG, verbose=0):
+    """
+    Compiles the given template code for the given language: filters
+    out the other languages, translates the _(text)_ strings and parses
+    the special tags (see L{compile_format_template_elements}).
+
+    @param format_template: the format template code
+    @param ln: the language of the compiled template
+    @param verbose: the level of verbosity from 0 to 9 (O: silent,
+                    5: errors, 7: errors and warnings,
+                    9: errors and warnings, stop if error (debug mode ))
+    @return: the compiled template
+    """
+    _ = gettext_set_language(ln)
+
+    def translate(match):
+        """
+        Translate matching values
+        """
+        word = match.group("word")
+        translated_word = _(word)
+        return translated_word
+
+    filtered_format = filter_languages(format_template, ln)
+    localized_format = translation_pattern.sub(translate, filtered_format)
+    return compile_format_template_elements(localized_format, verbose)
+
+def get_compiled_format_template(filename, ln=CFG_SITE_LANG, verbose=0):
+    """
+    Returns the given format template compiled for the given language
+    (see L{compile_format_template}).
+
+    Compiled templates are cached, and compiled again when the
+    template file is modified.
+
+    @param filename: the filename of a format template
+    @param ln: the language of the compiled template
+    @param verbose: the level of verbosity from 0 to 9 (O: silent,
+                    5: errors, 7: errors and warnings,
+                    9: errors and warnings, stop if error (debug mode ))
+    @return: the compiled template
+    """
+    path = "%s%s%s" % (CFG_BIBFORMAT_TEMPLATES_PATH, os.sep, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    cached = compiled_format_templates_cache.get((filename, ln))
+    if cached is not None and mtime is not None and cached[0] == mtime:
+        return cached[1]
+
+    format_template = get_format_template(filename)
+    if format_template is None:
+        return []
+    compiled_format = compile_format_template(format_template['code'],
+                                              ln, verbose)
+    if mtime is not None:
+        compiled_format_templates_cache[(filename, ln)] = (mtime, compiled_format)
+    return compiled_format
+
+def eval_compiled_format_template(compiled_format, bfo, verbose=0):
+    """
+    Evaluates the format elements of the given compiled template (see
+    L{compile_format_template}) with the given L{BibFormatObject}, and
+    returns the formatted text.
+
+    @param compiled_format: a compiled format template
+    @param bfo: the object containing parameters for the current formatting
+    @param verbose: the level of verbosity from 0 to 9 (O: silent,
+                    5: errors, 7: errors and warnings,
+                    9: errors and warnings, stop if error (debug mode ))
+    @return: formatted text
+    """
+    out = []
+    for chunk in compiled_format:
+        if isinstance(chunk, str):
+            out.append(chunk)
+            continue
+        function_name, format_element, params = chunk
         if format_element is None:
-            try:
-                raise InvenioBibFormatError(_('Could not find format element named %s.') % function_name)
-            except InvenioBibFormatError, exc:
-                register_exception(req=bfo.req)
+            # Could not be loaded when compiling the template: try
+            # again, and report the error
+            format_element = get_format_element_or_error(function_name,
+                                                         bfo, verbose)
+            if isinstance(format_element, str):
+                out.append(format_element)
+                continue
+        # Evaluate element with params (Do not return errors)
+        (result, dummy) = eval_format_element(format_element,
+                                               bfo,
+                                               params,
+                                               verbose)
+        out.append(result)
+    return ''.join(out)
+
+def get_format_element_or_error(function_name, bfo, verbose=0):
+    """
+    Returns the format element structure of the given element name,
+    as returned by get_format_element, or the error message to be
+    output instead of it when it cannot be loaded ('' if verbose is
+    lower than 5).
 
-            if verbose >= 5:
-                return '<b><span style="color: rgb(255, 0, 0);">' + \
-                       str(exc.message)+'</span></b>'
-        else:
-            params = {}
-            # Look for function parameters given in format template code
-            all_params = match.group('params')
-            if all_params is not None:
-                function_params_iterator = pattern_function_params.finditer(all_params)
-                for param_match in function_params_iterator:
-                    name = param_match.group('param')
-                    value = param_match.group('value')
-                    params[name] = value
-
-            # Evaluate element with params and return (Do not return errors)
-            (result, dummy) = eval_format_element(format_element,
-                                                   bfo,
-                                                   params,
-                                                   verbose)
-            return result
-
-    # Substitute special tags in the format by our own text.
-    # Special tags have the form <BNE_format_element_name [param="value"]* />
-    format = pattern_tag.sub(insert_element_code, format_template)
-    return format
+    @param function_name: the name of the format element
+    @param bfo: the object containing parameters for the current formatting
+    @param verbose: the level of verbosity from 0 to 9 (O: silent,
+                    5: errors, 7: errors and warnings,
+                    9: errors and warnings, stop if error (debug mode ))
+    @return: a format element structure, or an error message
+    """
+    _ = gettext_set_language(bfo.lang)
+    try:
+        format_element = get_format_element(function_name, verbose)
+    except Exception, e:
+        format_element = None
+        if verbose >= 5:
+            return '<b><span style="color: rgb(255, 0, 0);">' + \
+                   cgi.escape(str(e)).replace('\n', '<br/>') + \
+                   '</span>'
+    if format_element is None:
+        try:
+            raise InvenioBibFormatError(_('Could not find format element named %s.') % function_name)
+        except InvenioBibFormatError, exc:
+            register_exception(req=bfo.req)
+
+        if verbose >= 5:
+            return '<b><span style="color: rgb(255, 0, 0);">' + \
+                   str(exc.message)+'</span></b>'
+        return ''
+    return format_element
 
 
 def eval_format_element(format_element, bfo, parameters=None, verbose=0):
@@ -585,6 +719,14 @@ def eval_format_element(format_element, bfo, parameters=None, verbose=0):
     escape = parameters.get('escape', "")
     output_text = ''
 
+    # Output of elements not depending on the user may be cached
+    (cache_key, cache_version) = get_format_element_cache_key(format_element,
+                                                              bfo, parameters)
+    if cache_key is not None:
+        output_text = bfo.get_cached_element_output(cache_key, cache_version)
+        if output_text is not None:
+            return (output_text, errors)
+
     # 3 possible cases:
     # a) format element file is found: we execute it
     # b) format element file is not found, but exist in tag table (e.g. bfe_isbn)
@@ -687,6 +829,10 @@ def eval_format_element(format_element, bfo, parameters=None, verbose=0):
         if output_text == "":
             output_text = default_value
 
+        if cache_key is not None and not errors and \
+               isinstance(output_text, str):
+            bfo.cache_element_output(cache_key, cache_version, output_text)
+
         return (output_text, errors)
 
     elif format_element is not None and format_element['type'] == "field":
@@ -776,6 +922,62 @@ def eval_format_element(format_element, bfo, parameters=None, verbose=0):
                     str(exc.message)+'</span></b>', errors)
 
 
+# Data other than the record the output of cached elements can depend
+# on, with the function returning their version for a given bfo.
+# 'search_pattern' has no version: outputs depending on it are only
+# cached when there is no search pattern.
+CFG_BIBFORMAT_ELEMENT_CACHE_DEPENDENCIES = {
+    'search_pattern': None,
+    }
+
+def get_format_element_cache_key(format_element, bfo, parameters):
+    """
+    Returns the key under which the output of the given format
+    element, for the given L{BibFormatObject} and parameters, can be
+    cached, and the version of the data it depends on.
+
+    The output can be cached if the element has a 'cache_output()'
+    function returning True, or the list of the data other than the
+    record the output depends on (see
+    CFG_BIBFORMAT_ELEMENT_CACHE_DEPENDENCIES).
+
+    @param format_element: a format element structure as returned by get_format_element
+    @param bfo: a L{BibFormatObject} used for formatting
+    @param parameters: a dict of parameters to be used for formatting
+    @return: tuple (cache key, version), or (None, None) if the output cannot be cached
+    """
+    if not CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS or format_element is None or \
+           format_element.get('cache_function') is None or \
+           bfo.xml_record is not None or not bfo.recID:
+        return (None, None)
+    try:
+        dependencies = apply(format_element['cache_function'], (), {'bfo': bfo})
+    except Exception:
+        register_exception(req=bfo.req)
+        return (None, None)
+    if not dependencies:
+        return (None, None)
+    if dependencies is True:
+        dependencies = ()
+    versions = []
+    for dependency in dependencies:
+        if not CFG_BIBFORMAT_ELEMENT_CACHE_DEPENDENCIES.has_key(dependency):
+            # unknown dependency: we do not know when to invalidate it
+            return (None, None)
+        get_version = CFG_BIBFORMAT_ELEMENT_CACHE_DEPENDENCIES[dependency]
+        if get_version is None:
+            if dependency == 'search_pattern' and bfo.search_pattern:
+                return (None, None)
+        else:
+            versions.append((dependency, get_version(bfo)))
+    parameters = parameters or {}
+    cache_key = md5(repr((format_element['attrs']['name'],
+                          sorted(parameters.items()),
+                          bfo.lang,
+                          bfo.output_format))).hexdigest()
+    version = md5(repr(versions)).hexdigest()
+    return (cache_key, version)
+
 def filter_languages(format_template, ln='en'):
     """
     Filters the language tags that do not correspond to the specified language.
@@ -979,7 +1181,8 @@ def get_format_element(element_name, verbose=0, with_built_in_params=False):
       {'attrs': {some attributes in dict. See get_format_element_attrs_from_*}
       'code': the_function_code,
       'type':"field" or "python" depending if element is defined in file or table,
-      'escape_function': the function to call to know if element output must be escaped}
+      'escape_function': the function to call to know if element output must be escaped,
+      'cache_function': the function to call to know if element output can be cached}
 
     @param element_name: the name of the format element to load
     @param verbose: the level of verbosity from 0 to 9 (O: silent,
@@ -1017,6 +1220,7 @@ def get_format_element(element_name, verbose=0, with_built_in_params=False):
                 with_built_in_params),
                               'code':None,
                               'escape_function':None,
+                              'cache_function':None,
                               'type':"field"}
             # Cache and returns
             format_elements_cache[name] = format_element
@@ -1101,6 +1305,12 @@ def get_format_element(element_name, verbose=0, with_built_in_params=False):
                                    None)
         format_element['escape_function'] = function_escape
 
+        # Load function 'cache_output()' inside element
+        function_cache = getattr(module.__dict__[module_name],
+                                 'cache_output',
+                                 None)
+        format_element['cache_function'] = function_cache
+
         # Prepare, cache and return
         format_element['attrs'] = get_format_element_attrs_from_function( \
                 function_format,
@@ -1725,10 +1935,12 @@ def clear_caches():
 
     @return: None
     """
-    global format_templates_cache, format_elements_cache, format_outputs_cache
+    global format_templates_cache, format_elements_cache, format_outputs_cache, \
+           compiled_format_templates_cache
     format_templates_cache = {}
     format_elements_cache = {}
     format_outputs_cache = {}
+    compiled_format_templates_cache = {}
 
 class BibFormatObject:
     """
@@ -1764,7 +1976,8 @@ class BibFormatObject:
     req = None # DEPRECATED: use bfo.user_info instead. Used by WebJournal.
 
     def __init__(self, recID, ln=CFG_SITE_LANG, search_pattern=None,
-                 xml_record=None, user_info=None, output_format=''):
+                 xml_record=None, user_info=None, output_format='',
+                 record=None):
         """
         Creates a new bibformat object, with given record.
 
@@ -1794,6 +2007,7 @@ class BibFormatObject:
         @param xml_record: a xml string of the record to format
         @param user_info: the information of the user who will view the formatted page
         @param output_format: the output_format used for formatting this record
+        @param record: the record structure of record recID, if already fetched
         """
         self.xml_record = None # *Must* remain empty if recid is given
         if xml_record is not None:
@@ -1801,6 +2015,9 @@ class BibFormatObject:
             self.xml_record = xml_record
             self.record = create_record(xml_record)[0]
             recID = record_get_field_value(self.record, "001")
+        elif record is not None:
+            # Record structure already fetched, e.g. by format_records
+            self.record = record
 
         self.lang = wash_language(ln)
         if search_pattern is None:
@@ -1811,6 +2028,39 @@ class BibFormatObject:
         self.user_info = user_info
         if self.user_info is None:
             self.user_info = collect_user_info(None)
+        self.element_cache = None
+
+    def get_cached_element_output(self, cache_key, version):
+        """
+        Returns the cached output of a format element for the record of
+        this L{BibFormatObject} instance, or None if not cached.  All the
+        cached outputs of the record are loaded at once.
+
+        @param cache_key: the key of the output, see get_format_element_cache_key()
+        @param version: the version of the data the output depends on
+        @return: the output of the element, or None
+        """
+        if self.element_cache is None:
+            self.element_cache = \
+                bibformat_dblayer.get_format_elements_cache(self.recID)
+        cached = self.element_cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def cache_element_output(self, cache_key, version, value):
+        """
+        Caches the output of a format element for the record of this
+        L{BibFormatObject} instance.
+
+        @param cache_key: the key of the output, see get_format_element_cache_key()
+        @param version: the version of the data the output depends on
+        @param value: the output of the element
+        """
+        bibformat_dblayer.set_format_element_cache(self.recID, cache_key,
+                                                   version, value)
+        if self.element_cache is not None:
+            self.element_cache[cache_key] = (version, value)
 
     def get_record(self):
         """
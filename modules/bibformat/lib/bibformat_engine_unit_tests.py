@@ -614,6 +614,50 @@ class MiscTest(unittest.TestCase):
             parsed_tag = bibformat_utils.parse_tag(tags_and_parsed_tags[i])
             self.assertEqual(parsed_tag, tags_and_parsed_tags[i+1])
 
+    def test_format_element_cache_key(self):
+        """ bibformat - key of the cached output of format elements"""
+        class FakeBibFormatObject:
+            recID = 10
+            xml_record = None
+            lang = 'en'
+            output_format = 'hb'
+            search_pattern = []
+            req = None
+        bfo = FakeBibFormatObject()
+        format_element = {'attrs': {'name': 'TITLE'},
+                          'cache_function': lambda bfo: ['search_pattern']}
+        old_cache_format_elements = bibformat_engine.CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS
+        try:
+            # not cached when the cache is disabled
+            bibformat_engine.CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS = 0
+            self.assertEqual(bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {}), (None, None))
+            bibformat_engine.CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS = 1
+            key, version = bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {'separator': ' ; '})
+            self.assertEqual(len(key), 32)
+            self.assertEqual(len(version), 32)
+            # the key depends on the parameters and the language
+            self.assertEqual(bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {'separator': ' ; '}), (key, version))
+            self.assertNotEqual(bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {'separator': ', '})[0], key)
+            bfo.lang = 'fr'
+            self.assertNotEqual(bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {'separator': ' ; '})[0], key)
+            # not cached when highlighting a search pattern
+            bfo.search_pattern = ['ellis']
+            self.assertEqual(bibformat_engine.get_format_element_cache_key(
+                format_element, bfo, {}), (None, None))
+            # not cached when the element does not say it can be
+            for cache_function in (None, lambda bfo: False,
+                                   lambda bfo: ['unknown dependency']):
+                format_element['cache_function'] = cache_function
+                self.assertEqual(bibformat_engine.get_format_element_cache_key(
+                    format_element, bfo, {}), (None, None))
+        finally:
+            bibformat_engine.CFG_BIBFORMAT_CACHE_FORMAT_ELEMENTS = old_cache_format_elements
+
 class FormatTest(unittest.TestCase):
     """ bibformat - generic tests on function that do the formatting. Main functions"""
 
@@ -794,6 +838,34 @@ class FormatTest(unittest.TestCase):
 
         self.assertEqual(result,'''<h1>hi</h1> this is my template\ntest<bfe_non_existing_element must disappear/><test_1  non prefixed element must stay as any normal tag/>tfrgarbage\n<br/>test me!&lt;b&gt;ok&lt;/b&gt;a default valueeditor\n<br/>test me!<b>ok</b>a default valueeditor\n<br/>test me!&lt;b&gt;ok&lt;/b&gt;a default valueeditor\n99999''')
 
+    def test_compiled_format_template(self):
+        """ bibformat - compilation and caching of format templates"""
+        compiled_fr = bibformat_engine.get_compiled_format_template("Test3.bft", 'fr')
+        compiled_en = bibformat_engine.get_compiled_format_template("Test3.bft", 'en')
+        self.assert_('tfrgarbage\n' in compiled_fr[2])
+        self.assert_('tengarbage\n' in compiled_en[2])
+        self.assertEqual([chunk[0] for chunk in compiled_fr
+                          if not isinstance(chunk, str)],
+                         ['test_1', 'test_5', 'test_5', 'test_5',
+                          'additional_report_number'])
+        self.assertEqual(compiled_fr[3][2], {'param1': 'test me!',
+                                             'param2': '<b>ok</b>',
+                                             'prefix': '<br/>'})
+        # compiled once per language, until the template is modified
+        self.assert_(bibformat_engine.get_compiled_format_template("Test3.bft", 'fr') \
+                     is compiled_fr)
+        path = os.path.join(CFG_BIBFORMAT_TEMPLATES_PATH, "Test3.bft")
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime + 10, mtime + 10))
+        try:
+            self.assert_(bibformat_engine.get_compiled_format_template("Test3.bft", 'fr') \
+                         is not compiled_fr)
+        finally:
+            os.utime(path, (mtime, mtime))
+        result = bibformat_engine.eval_compiled_format_template(compiled_fr,
+                                                                self.bfo_3)
+        self.assertEqual(result,'''<h1>hi</h1> this is my template\ntest<bfe_non_existing_element must disappear/><test_1  non prefixed element must stay as any normal tag/>tfrgarbage\n<br/>test me!&lt;b&gt;ok&lt;/b&gt;a default valueeditor\n<br/>test me!<b>ok</b>a default valueeditor\n<br/>test me!&lt;b&gt;ok&lt;/b&gt;a default valueeditor\n''')
+
 
 class MarcFilteringTest(unittest.TestCase):
     """ bibformat - MARC tag filtering tests"""
@@ -27,7 +27,8 @@ from invenio.config import CFG_SITE_URL, CFG_SITE_LANG, CFG_SITE_RECORD
 from invenio.testutils import make_test_suite, \
                               run_test_suite, \
                               test_web_page_content
-from invenio.bibformat import format_record
+from invenio.bibformat import format_record, format_records, \
+     get_prefetched_records_data
 from invenio.bibformat_engine import BibFormatObject
 
 class BibFormatAPITest(unittest.TestCase):
@@ -48,6 +49,26 @@ class BibFormatAPITest(unittest.TestCase):
         result = test_web_page_content(pageurl,
                                        expected_text=result)
 
+    def test_format_records(self):
+        """bibformat - Checking formatting of several records at once"""
+        recids = [10, 73, 1000000, 74]
+        for of in ('hb', 'hx', 'xm'):
+            for on_the_fly in (False, True):
+                expected = '\n'.join([format_record(recid, of,
+                                                    on_the_fly=on_the_fly)
+                                      for recid in recids])
+                self.assertEqual(format_records(recids, of,
+                                                record_separator='\n',
+                                                on_the_fly=on_the_fly),
+                                 expected)
+
+    def test_prefetched_records_data(self):
+        """bibformat - Checking data of records fetched at once"""
+        prefetched = get_prefetched_records_data([10, 1000000], 'hb')
+        self.assertEqual(prefetched[10]['exists'], 1)
+        self.assertEqual(prefetched[1000000]['exists'], 0)
+        self.assertEqual(prefetched[1000000].get('record'), None)
+
 class BibFormatObjectAPITest(unittest.TestCase):
     """Check BibFormatObject (bfo) APIs"""
 
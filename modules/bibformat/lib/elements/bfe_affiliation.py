@@ -39,3 +39,10 @@ def escape_values(bfo):
     should be escaped.
     """
     return 0
+
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.
+    """
+    return True
@@ -161,3 +161,11 @@ def escape_values(bfo):
     should be escaped.
     """
     return 0
+
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.  The output is highlighted according to the
+    search pattern, so it can only be cached when there is none.
+    """
+    return ['search_pattern']
@@ -43,3 +43,10 @@ def format_element(bfo, date_format='%d %B %Y'):
             return date
     else:
         return date
+
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.
+    """
+    return True
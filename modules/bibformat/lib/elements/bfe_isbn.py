@@ -36,5 +36,9 @@ def escape_values(bfo):
     """
     return 0
 
-
-
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.
+    """
+    return True
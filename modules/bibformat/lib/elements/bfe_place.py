@@ -30,6 +30,9 @@ def format_element(bfo):
     if place != "sine loco":
         return place
 
-
-
-
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.
+    """
+    return True
@@ -31,3 +31,10 @@ def format_element(bfo):
 
     if publisher != "sine nomine":
         return publisher
+
+def cache_output(bfo):
+    """
+    Called by BibFormat in order to check if output of this element
+    can be cached.
+    """
+    return True
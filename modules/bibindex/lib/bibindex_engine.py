@@ -56,12 +56,12 @@ from invenio.websubmit_file_converter import convert_file, get_file_converter_lo
 from invenio.search_engine import perform_request_search, \
      get_index_stemming_language, \
      get_synonym_terms
-from invenio.dbquery import run_sql, DatabaseError, serialize_via_marshal, \
-     deserialize_via_marshal, wash_table_column_name
+from invenio.dbquery import run_sql, run_sql_many, DatabaseError, \
+     serialize_via_marshal, deserialize_via_marshal, wash_table_column_name
 from invenio.bibindex_engine_washer import wash_index_term
 from invenio.bibtask import task_init, write_message, get_datetime, \
     task_set_option, task_get_option, task_get_task_param, \
-    task_update_progress, task_sleep_now_if_required
+    task_update_progress, task_sleep_now_if_required, task_run_in_workers
 from invenio.intbitset import intbitset
 from invenio.errorlib import register_exception
 from invenio.htmlutils import get_links_in_html_page
@@ -411,6 +411,7 @@ def init_temporary_reindex_tables(index_id, reindex_prefix="tmp_"):
                         id mediumint(9) unsigned NOT NULL auto_increment,
                         term varchar(50) default NULL,
                         hitlist longblob,
+                        df mediumint(9) unsigned default NULL,
                         PRIMARY KEY  (id),
                         UNIQUE KEY term (term)
                         ) ENGINE=MyISAM""" % (reindex_prefix, index_id))
@@ -428,6 +429,7 @@ def init_temporary_reindex_tables(index_id, reindex_prefix="tmp_"):
                         id mediumint(9) unsigned NOT NULL auto_increment,
                         term varchar(100) default NULL,
                         hitlist longblob,
+                        df mediumint(9) unsigned default NULL,
                         PRIMARY KEY  (id),
                         UNIQUE KEY term (term)
                         ) ENGINE=MyISAM""" % (reindex_prefix, index_id))
@@ -445,6 +447,7 @@ def init_temporary_reindex_tables(index_id, reindex_prefix="tmp_"):
                         id mediumint(9) unsigned NOT NULL auto_increment,
                         term text default NULL,
                         hitlist longblob,
+                        df mediumint(9) unsigned default NULL,
                         PRIMARY KEY  (id),
                         KEY term (term(50))
                         ) ENGINE=MyISAM""" % (reindex_prefix, index_id))
@@ -759,15 +762,30 @@ class WordTable:
                 run_sql(query, (group[0], group[1]))
 
         nb_words_total = len(self.value)
-        nb_words_report = int(nb_words_total / 10.0)
-        nb_words_done = 0
-        for word in self.value.keys():
-            self.put_word_into_db(word)
-            nb_words_done += 1
-            if nb_words_report != 0 and ((nb_words_done % nb_words_report) == 0):
-                write_message('......processed %d/%d words' % (nb_words_done, nb_words_total))
+        flush_batch_size = task_get_option("flush_batch_size")
+        if flush_batch_size:
+            ## batched mode: flush many words per database round trip
+            words = self.value.keys()
+            nb_batches_total = (nb_words_total + flush_batch_size - 1) / flush_batch_size
+            nb_words_done = 0
+            for nb_batches_done in range(1, nb_batches_total + 1):
+                batch = words[nb_words_done:nb_words_done + flush_batch_size]
+                self.put_words_into_db(batch)
+                nb_words_done += len(batch)
+                write_message('......processed batch %d/%d (%d/%d words)' % \
+                              (nb_batches_done, nb_batches_total, nb_words_done, nb_words_total))
                 percentage_display = get_percentage_completed(nb_words_done, nb_words_total)
                 task_update_progress("(%s:%s) flushed %d/%d words %s" % (self.tablename, self.humanname, nb_words_done, nb_words_total, percentage_display))
+        else:
+            nb_words_report = int(nb_words_total / 10.0)
+            nb_words_done = 0
+            for word in self.value.keys():
+                self.put_word_into_db(word)
+                nb_words_done += 1
+                if nb_words_report != 0 and ((nb_words_done % nb_words_report) == 0):
+                    write_message('......processed %d/%d words' % (nb_words_done, nb_words_total))
+                    percentage_display = get_percentage_completed(nb_words_done, nb_words_total)
+                    task_update_progress("(%s:%s) flushed %d/%d words %s" % (self.tablename, self.humanname, nb_words_done, nb_words_total, percentage_display))
         write_message('...updating %d words into %s ended' % \
                       (nb_words_total, self.tablename))
 
@@ -825,7 +843,9 @@ class WordTable:
         return set != oldset
 
     def put_word_into_db(self, word):
-        """Flush a single word to the database and delete it from memory"""
+        """Flush a single word to the database and delete it from memory.
+        The number of records the word is found in is stored along
+        with its hitlist, so that searchers can read it cheaply."""
 
         set = self.load_old_recIDs(word)
         if set is not None: # merge the word recIDs found in memory:
@@ -836,13 +856,13 @@ class WordTable:
             else:
                 # yes there were some new words:
                 write_message("......... updating hitlist for ``%s''" % word, verbose=9)
-                run_sql("UPDATE %s SET hitlist=%%s WHERE term=%%s" % wash_table_column_name(self.tablename), (set.fastdump(), word)) # kwalitee: disable=sql
+                run_sql("UPDATE %s SET hitlist=%%s, df=%%s WHERE term=%%s" % wash_table_column_name(self.tablename), (set.fastdump(), len(set), word)) # kwalitee: disable=sql
 
         else: # the word is new, will create new set:
             write_message("......... inserting hitlist for ``%s''" % word, verbose=9)
             set = intbitset(self.value[word].keys())
             try:
-                run_sql("INSERT INTO %s (term, hitlist) VALUES (%%s, %%s)" % wash_table_column_name(self.tablename), (word, set.fastdump())) # kwalitee: disable=sql
+                run_sql("INSERT INTO %s (term, hitlist, df) VALUES (%%s, %%s, %%s)" % wash_table_column_name(self.tablename), (word, set.fastdump(), len(set))) # kwalitee: disable=sql
             except Exception, e:
                 ## We send this exception to the admin only when is not
                 ## already reparing the problem.
@@ -853,6 +873,60 @@ class WordTable:
 
         del self.value[word]
 
+    def put_words_into_db(self, words):
+        """Flush a batch of words to the database and delete them from memory.
+
+        Old hitlists of all the words are fetched with a single query,
+        merged in memory and written back with multi-row statements.
+        Words that could not be inserted because the database already
+        holds a term equal to them under the table collation are
+        flushed one by one via put_word_into_db(), which is safe since
+        merging the in-memory signs is idempotent.
+        """
+        if not words:
+            return
+        tablename = wash_table_column_name(self.tablename)
+        format_strings = ', '.join(['%s'] * len(words))
+        res = run_sql("SELECT term, hitlist FROM %s WHERE term IN (%s)" % (tablename, format_strings), tuple(words)) # kwalitee: disable=sql
+        old_hitlists = dict(res)
+
+        words_to_update = []
+        words_to_insert = []
+        words_to_delete = []
+        for word in words:
+            if word in old_hitlists:
+                hitlist = intbitset(old_hitlists[word])
+                if not self.merge_with_old_recIDs(word, hitlist):
+                    write_message("......... unchanged hitlist for ``%s''" % word, verbose=9)
+                elif hitlist:
+                    write_message("......... updating hitlist for ``%s''" % word, verbose=9)
+                    words_to_update.append((word, hitlist.fastdump(), len(hitlist)))
+                if not hitlist: # never store empty words
+                    words_to_delete.append(word)
+            else:
+                hitlist = intbitset(self.value[word].keys())
+                if hitlist:
+                    write_message("......... inserting hitlist for ``%s''" % word, verbose=9)
+                    words_to_insert.append((word, hitlist.fastdump(), len(hitlist)))
+
+        if words_to_update:
+            run_sql_many("INSERT INTO %s (term, hitlist, df) VALUES (%%s, %%s, %%s) ON DUPLICATE KEY UPDATE hitlist=VALUES(hitlist), df=VALUES(df)" % tablename, words_to_update) # kwalitee: disable=sql
+        if words_to_delete:
+            run_sql("DELETE FROM %s WHERE term IN (%s)" % (tablename, ', '.join(['%s'] * len(words_to_delete))), tuple(words_to_delete)) # kwalitee: disable=sql
+        words_to_retry = set()
+        if words_to_insert:
+            nb_inserted = run_sql_many("INSERT IGNORE INTO %s (term, hitlist, df) VALUES (%%s, %%s, %%s)" % tablename, words_to_insert) # kwalitee: disable=sql
+            if nb_inserted != len(words_to_insert):
+                write_message("......... %d new words clashed with existing terms, flushing them one by one" % \
+                              (len(words_to_insert) - nb_inserted), verbose=9)
+                words_to_retry = set([word for word, dummy_hitlist, dummy_df in words_to_insert])
+
+        for word in words:
+            if word not in words_to_retry:
+                del self.value[word]
+        for word in words_to_retry:
+            self.put_word_into_db(word)
+
     def display(self):
         "Displays the word table."
         keys = self.value.keys()
@@ -1365,6 +1439,8 @@ def main():
   -w, --windex=w1[,w2]\tword/phrase indexes to consider (all)
   -M, --maxmem=XXX\tmaximum memory usage in kB (no limit)
   -f, --flush=NNN\t\tfull consistent table flush after NNN records (10000)
+  --flush-batch-size=NNN\tflush NNN words per database query (0, word by word)
+  --parallel=N\t\tindex up to N indexes at a time in worker processes (1)
 """,
             version=__revision__,
             specific_params=("adi:m:c:w:krRM:f:", [
@@ -1379,6 +1455,8 @@ def main():
                 "reindex",
                 "maxmem=",
                 "flush=",
+                "flush-batch-size=",
+                "parallel=",
             ]),
             task_stop_helper_fnc=task_stop_table_close_fnc,
             task_submit_elaborate_specific_parameter_fnc=task_submit_elaborate_specific_parameter,
@@ -1431,6 +1509,14 @@ def task_submit_elaborate_specific_parameter(key, value, opts, args):
                 (base_process_size + 1000))
     elif key in ("-f", "--flush"):
         task_set_option("flush", int(value))
+    elif key in ("--flush-batch-size",):
+        task_set_option("flush_batch_size", int(value))
+        if task_get_option("flush_batch_size") < 0:
+            raise StandardError("Flush batch size should not be negative")
+    elif key in ("--parallel",):
+        task_set_option("parallel", int(value))
+        if task_get_option("parallel") < 1:
+            raise StandardError("Number of worker processes should be at least 1")
     else:
         return False
     return True
@@ -1507,222 +1593,249 @@ def task_run_core():
 
     # Let's work on single words!
     wordTables = get_word_tables(task_get_option("windex"))
+    nb_workers = task_get_option("parallel", 1)
+    if nb_workers > 1 and len(wordTables) > 1:
+        jobs = []
+        for index_id, index_name, index_tags in wordTables:
+            def job(index_id=index_id, index_name=index_name, index_tags=index_tags):
+                return task_run_core_for_index(index_id, index_name, index_tags)
+            jobs.append(job)
+        write_message("Indexing %s indexes in %s worker processes" % \
+                      (len(jobs), nb_workers))
+        results = task_run_in_workers(jobs, nb_workers)
+        for idx_job in xrange(len(wordTables)):
+            if not results[idx_job]:
+                write_message("Indexing of %s failed" % wordTables[idx_job][1],
+                              stream=sys.stderr)
+        return False not in results
     for index_id, index_name, index_tags in wordTables:
-        is_fulltext_index = index_name == 'fulltext'
-        reindex_prefix = ""
-        if task_get_option("reindex"):
-            reindex_prefix = "tmp_"
-            init_temporary_reindex_tables(index_id, reindex_prefix)
-        if index_name == 'year' and CFG_INSPIRE_SITE:
-            fnc_get_words_from_phrase = get_words_from_date_tag
-        elif index_name in ('author', 'firstauthor') and \
-                 CFG_BIBINDEX_AUTHOR_WORD_INDEX_EXCLUDE_FIRST_NAMES:
-            fnc_get_words_from_phrase = get_author_family_name_words_from_phrase
-        else:
-            fnc_get_words_from_phrase = get_words_from_phrase
-        wordTable = WordTable(index_name=index_name,
-                              index_id=index_id,
-                              fields_to_index=index_tags,
-                              table_name_pattern=reindex_prefix + 'idxWORD%02dF',
-                              default_get_words_fnc=fnc_get_words_from_phrase,
-                              tag_to_words_fnc_map={'8564_u': get_words_from_fulltext},
-                              is_fulltext_index=is_fulltext_index,
-                              wash_index_terms=50)
-        _last_word_table = wordTable
-        wordTable.report_on_table_consistency()
-        try:
-            if task_get_option("cmd") == "del":
-                if task_get_option("id"):
-                    wordTable.del_recIDs(task_get_option("id"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.del_recIDs(recIDs_range)
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    error_message = "Missing IDs of records to delete from " \
-                            "index %s." % wordTable.tablename
-                    write_message(error_message, stream=sys.stderr)
-                    raise StandardError(error_message)
-            elif task_get_option("cmd") == "add":
-                if task_get_option("id"):
-                    wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
-                    ## here we used to update last_updated info, if run via automatic mode;
-                    ## but do not update here anymore, since idxPHRASE will be acted upon later
-                    task_sleep_now_if_required(can_stop_too=True)
-            elif task_get_option("cmd") == "repair":
-                wordTable.repair(task_get_option("flush"))
+        task_run_core_for_index(index_id, index_name, index_tags)
+
+    _last_word_table = None
+    return True
+
+def task_run_core_for_index(index_id, index_name, index_tags):
+    """Run the indexing command on the word, pair and phrase tables of
+    index INDEX_ID.  Called by task_run_core(), either directly or in
+    worker processes when running with --parallel.
+    Return True in case of success."""
+    global _last_word_table
+
+    is_fulltext_index = index_name == 'fulltext'
+    reindex_prefix = ""
+    if task_get_option("reindex"):
+        reindex_prefix = "tmp_"
+        init_temporary_reindex_tables(index_id, reindex_prefix)
+    if index_name == 'year' and CFG_INSPIRE_SITE:
+        fnc_get_words_from_phrase = get_words_from_date_tag
+    elif index_name in ('author', 'firstauthor') and \
+             CFG_BIBINDEX_AUTHOR_WORD_INDEX_EXCLUDE_FIRST_NAMES:
+        fnc_get_words_from_phrase = get_author_family_name_words_from_phrase
+    else:
+        fnc_get_words_from_phrase = get_words_from_phrase
+    wordTable = WordTable(index_name=index_name,
+                          index_id=index_id,
+                          fields_to_index=index_tags,
+                          table_name_pattern=reindex_prefix + 'idxWORD%02dF',
+                          default_get_words_fnc=fnc_get_words_from_phrase,
+                          tag_to_words_fnc_map={'8564_u': get_words_from_fulltext},
+                          is_fulltext_index=is_fulltext_index,
+                          wash_index_terms=50)
+    _last_word_table = wordTable
+    wordTable.report_on_table_consistency()
+    try:
+        if task_get_option("cmd") == "del":
+            if task_get_option("id"):
+                wordTable.del_recIDs(task_get_option("id"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.del_recIDs(recIDs_range)
                 task_sleep_now_if_required(can_stop_too=True)
             else:
-                error_message = "Invalid command found processing %s" % \
-                    wordTable.tablename
+                error_message = "Missing IDs of records to delete from " \
+                        "index %s." % wordTable.tablename
                 write_message(error_message, stream=sys.stderr)
                 raise StandardError(error_message)
-        except StandardError, e:
-            write_message("Exception caught: %s" % e, sys.stderr)
-            register_exception(alert_admin=True)
-            if _last_word_table:
-                _last_word_table.put_into_db()
-            raise
-
-        wordTable.report_on_table_consistency()
-        task_sleep_now_if_required(can_stop_too=True)
-
-        # Let's work on pairs now
-        if index_name in ('author', 'firstauthor') and \
-               CFG_BIBINDEX_AUTHOR_WORD_INDEX_EXCLUDE_FIRST_NAMES:
-            fnc_get_pairs_from_phrase = get_pairs_from_phrase # FIXME
+        elif task_get_option("cmd") == "add":
+            if task_get_option("id"):
+                wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            else:
+                wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
+                ## here we used to update last_updated info, if run via automatic mode;
+                ## but do not update here anymore, since idxPHRASE will be acted upon later
+                task_sleep_now_if_required(can_stop_too=True)
+        elif task_get_option("cmd") == "repair":
+            wordTable.repair(task_get_option("flush"))
+            task_sleep_now_if_required(can_stop_too=True)
         else:
-            fnc_get_pairs_from_phrase = get_pairs_from_phrase
-        wordTable = WordTable(index_name=index_name,
-                              index_id=index_id,
-                              fields_to_index=index_tags,
-                              table_name_pattern=reindex_prefix + 'idxPAIR%02dF',
-                              default_get_words_fnc=fnc_get_pairs_from_phrase,
-                              tag_to_words_fnc_map={'8564_u': get_nothing_from_phrase},
-                              wash_index_terms=100)
-        _last_word_table = wordTable
-        wordTable.report_on_table_consistency()
-        try:
-            if task_get_option("cmd") == "del":
-                if task_get_option("id"):
-                    wordTable.del_recIDs(task_get_option("id"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.del_recIDs(recIDs_range)
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    error_message = "Missing IDs of records to delete from " \
-                            "index %s." % wordTable.tablename
-                    write_message(error_message, stream=sys.stderr)
-                    raise StandardError(error_message)
-            elif task_get_option("cmd") == "add":
-                if task_get_option("id"):
-                    wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
-                    # let us update last_updated timestamp info, if run via automatic mode:
-                    task_sleep_now_if_required(can_stop_too=True)
-            elif task_get_option("cmd") == "repair":
-                wordTable.repair(task_get_option("flush"))
+            error_message = "Invalid command found processing %s" % \
+                wordTable.tablename
+            write_message(error_message, stream=sys.stderr)
+            raise StandardError(error_message)
+    except StandardError, e:
+        write_message("Exception caught: %s" % e, sys.stderr)
+        register_exception(alert_admin=True)
+        if _last_word_table:
+            _last_word_table.put_into_db()
+        raise
+
+    wordTable.report_on_table_consistency()
+    task_sleep_now_if_required(can_stop_too=True)
+
+    # Let's work on pairs now
+    if index_name in ('author', 'firstauthor') and \
+           CFG_BIBINDEX_AUTHOR_WORD_INDEX_EXCLUDE_FIRST_NAMES:
+        fnc_get_pairs_from_phrase = get_pairs_from_phrase # FIXME
+    else:
+        fnc_get_pairs_from_phrase = get_pairs_from_phrase
+    wordTable = WordTable(index_name=index_name,
+                          index_id=index_id,
+                          fields_to_index=index_tags,
+                          table_name_pattern=reindex_prefix + 'idxPAIR%02dF',
+                          default_get_words_fnc=fnc_get_pairs_from_phrase,
+                          tag_to_words_fnc_map={'8564_u': get_nothing_from_phrase},
+                          wash_index_terms=100)
+    _last_word_table = wordTable
+    wordTable.report_on_table_consistency()
+    try:
+        if task_get_option("cmd") == "del":
+            if task_get_option("id"):
+                wordTable.del_recIDs(task_get_option("id"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.del_recIDs(recIDs_range)
                 task_sleep_now_if_required(can_stop_too=True)
             else:
-                error_message = "Invalid command found processing %s" % \
-                        wordTable.tablename
+                error_message = "Missing IDs of records to delete from " \
+                        "index %s." % wordTable.tablename
                 write_message(error_message, stream=sys.stderr)
                 raise StandardError(error_message)
-        except StandardError, e:
-            write_message("Exception caught: %s" % e, sys.stderr)
-            register_exception()
-            if _last_word_table:
-                _last_word_table.put_into_db()
-            raise
-
-        wordTable.report_on_table_consistency()
-        task_sleep_now_if_required(can_stop_too=True)
-
-        # Let's work on phrases now
-        if index_name in ('author', 'firstauthor'):
-            fnc_get_phrases_from_phrase = get_fuzzy_authors_from_phrase
-        elif index_name in ('exactauthor', 'exactfirstauthor'):
-            fnc_get_phrases_from_phrase = get_exact_authors_from_phrase
+        elif task_get_option("cmd") == "add":
+            if task_get_option("id"):
+                wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            else:
+                wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
+                # let us update last_updated timestamp info, if run via automatic mode:
+                task_sleep_now_if_required(can_stop_too=True)
+        elif task_get_option("cmd") == "repair":
+            wordTable.repair(task_get_option("flush"))
+            task_sleep_now_if_required(can_stop_too=True)
         else:
-            fnc_get_phrases_from_phrase = get_phrases_from_phrase
-        wordTable = WordTable(index_name=index_name,
-                              index_id=index_id,
-                              fields_to_index=index_tags,
-                              table_name_pattern=reindex_prefix + 'idxPHRASE%02dF',
-                              default_get_words_fnc=fnc_get_phrases_from_phrase,
-                              tag_to_words_fnc_map={'8564_u': get_nothing_from_phrase},
-                              wash_index_terms=0)
-        _last_word_table = wordTable
-        wordTable.report_on_table_consistency()
-        try:
-            if task_get_option("cmd") == "del":
-                if task_get_option("id"):
-                    wordTable.del_recIDs(task_get_option("id"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.del_recIDs(recIDs_range)
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    error_message = "Missing IDs of records to delete from " \
-                            "index %s." % wordTable.tablename
-                    write_message(error_message, stream=sys.stderr)
-                    raise StandardError(error_message)
-            elif task_get_option("cmd") == "add":
-                if task_get_option("id"):
-                    wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                elif task_get_option("collection"):
-                    l_of_colls = task_get_option("collection").split(",")
-                    recIDs = perform_request_search(c=l_of_colls)
-                    recIDs_range = []
-                    for recID in recIDs:
-                        recIDs_range.append([recID, recID])
-                    wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
-                    task_sleep_now_if_required(can_stop_too=True)
-                else:
-                    wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
-                    # let us update last_updated timestamp info, if run via automatic mode:
-                    update_index_last_updated(index_id, task_get_task_param('task_starting_time'))
-                    task_sleep_now_if_required(can_stop_too=True)
-            elif task_get_option("cmd") == "repair":
-                wordTable.repair(task_get_option("flush"))
+            error_message = "Invalid command found processing %s" % \
+                    wordTable.tablename
+            write_message(error_message, stream=sys.stderr)
+            raise StandardError(error_message)
+    except StandardError, e:
+        write_message("Exception caught: %s" % e, sys.stderr)
+        register_exception()
+        if _last_word_table:
+            _last_word_table.put_into_db()
+        raise
+
+    wordTable.report_on_table_consistency()
+    task_sleep_now_if_required(can_stop_too=True)
+
+    # Let's work on phrases now
+    if index_name in ('author', 'firstauthor'):
+        fnc_get_phrases_from_phrase = get_fuzzy_authors_from_phrase
+    elif index_name in ('exactauthor', 'exactfirstauthor'):
+        fnc_get_phrases_from_phrase = get_exact_authors_from_phrase
+    else:
+        fnc_get_phrases_from_phrase = get_phrases_from_phrase
+    wordTable = WordTable(index_name=index_name,
+                          index_id=index_id,
+                          fields_to_index=index_tags,
+                          table_name_pattern=reindex_prefix + 'idxPHRASE%02dF',
+                          default_get_words_fnc=fnc_get_phrases_from_phrase,
+                          tag_to_words_fnc_map={'8564_u': get_nothing_from_phrase},
+                          wash_index_terms=0)
+    _last_word_table = wordTable
+    wordTable.report_on_table_consistency()
+    try:
+        if task_get_option("cmd") == "del":
+            if task_get_option("id"):
+                wordTable.del_recIDs(task_get_option("id"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.del_recIDs(recIDs_range)
                 task_sleep_now_if_required(can_stop_too=True)
             else:
-                error_message = "Invalid command found processing %s" % \
-                        wordTable.tablename
+                error_message = "Missing IDs of records to delete from " \
+                        "index %s." % wordTable.tablename
                 write_message(error_message, stream=sys.stderr)
                 raise StandardError(error_message)
-        except StandardError, e:
-            write_message("Exception caught: %s" % e, sys.stderr)
-            register_exception()
-            if _last_word_table:
-                _last_word_table.put_into_db()
-            raise
-
-        wordTable.report_on_table_consistency()
-        task_sleep_now_if_required(can_stop_too=True)
-
-        if task_get_option("reindex"):
-            swap_temporary_reindex_tables(index_id, reindex_prefix)
-            update_index_last_updated(index_id, task_get_task_param('task_starting_time'))
-        task_sleep_now_if_required(can_stop_too=True)
+        elif task_get_option("cmd") == "add":
+            if task_get_option("id"):
+                wordTable.add_recIDs(task_get_option("id"), task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            elif task_get_option("collection"):
+                l_of_colls = task_get_option("collection").split(",")
+                recIDs = perform_request_search(c=l_of_colls)
+                recIDs_range = []
+                for recID in recIDs:
+                    recIDs_range.append([recID, recID])
+                wordTable.add_recIDs(recIDs_range, task_get_option("flush"))
+                task_sleep_now_if_required(can_stop_too=True)
+            else:
+                wordTable.add_recIDs_by_date(task_get_option("modified"), task_get_option("flush"))
+                # let us update last_updated timestamp info, if run via automatic mode:
+                update_index_last_updated(index_id, task_get_task_param('task_starting_time'))
+                task_sleep_now_if_required(can_stop_too=True)
+        elif task_get_option("cmd") == "repair":
+            wordTable.repair(task_get_option("flush"))
+            task_sleep_now_if_required(can_stop_too=True)
+        else:
+            error_message = "Invalid command found processing %s" % \
+                    wordTable.tablename
+            write_message(error_message, stream=sys.stderr)
+            raise StandardError(error_message)
+    except StandardError, e:
+        write_message("Exception caught: %s" % e, sys.stderr)
+        register_exception()
+        if _last_word_table:
+            _last_word_table.put_into_db()
+        raise
+
+    wordTable.report_on_table_consistency()
+    task_sleep_now_if_required(can_stop_too=True)
+
+    if task_get_option("reindex"):
+        swap_temporary_reindex_tables(index_id, reindex_prefix)
+        update_index_last_updated(index_id, task_get_task_param('task_starting_time'))
+    task_sleep_now_if_required(can_stop_too=True)
 
     _last_word_table = None
     return True
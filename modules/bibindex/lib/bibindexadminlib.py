@@ -1562,6 +1562,7 @@ def add_idx(idxNAME):
                             id mediumint(9) unsigned NOT NULL auto_increment,
                             term varchar(50) default NULL,
                             hitlist longblob,
+                            df mediumint(9) unsigned default NULL,
                             PRIMARY KEY  (id),
                             UNIQUE KEY term (term)
                             ) ENGINE=MyISAM""" % idxID)
@@ -1577,6 +1578,7 @@ def add_idx(idxNAME):
                             id mediumint(9) unsigned NOT NULL auto_increment,
                             term varchar(100) default NULL,
                             hitlist longblob,
+                            df mediumint(9) unsigned default NULL,
                             PRIMARY KEY  (id),
                             UNIQUE KEY term (term)
                             ) ENGINE=MyISAM""" % idxID)
@@ -1592,6 +1594,7 @@ def add_idx(idxNAME):
                             id mediumint(9) unsigned NOT NULL auto_increment,
                             term text default NULL,
                             hitlist longblob,
+                            df mediumint(9) unsigned default NULL,
                             PRIMARY KEY  (id),
                             KEY term (term(50))
                             ) ENGINE=MyISAM""" % idxID)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Compact citation graph.
+
+Stores a citation dictionary {recid -> [list of recids]} in compressed
+sparse row form: two arrays of 32-bit integers, the neighbours of all
+the records one after the other, and for every record ID the offset of
+its neighbours.  The graph can be saved to a binary file that is
+memory-mapped when NumPy is available, so that all the processes of a
+machine share the same pages instead of each holding its own copy.
+"""
+
+__revision__ = "$Id$"
+
+import os
+import struct
+import tempfile
+from array import array
+
+try:
+    ## import optional module:
+    import numpy
+    CFG_NUMPY_IMPORTABLE = True
+except ImportError:
+    CFG_NUMPY_IMPORTABLE = False
+
+from invenio.intbitset import intbitset
+
+# array type code of 32-bit integers:
+CFG_INT32_TYPECODE = [typecode for typecode in 'ilh'
+                      if array(typecode).itemsize == 4][0]
+
+# file header: magic, timestamp, number of offsets, of neighbours, of keys
+CFG_CITATION_GRAPH_FILE_MAGIC = 'INVCSR01'
+CFG_CITATION_GRAPH_FILE_HEADER = '=8s20siii'
+CFG_CITATION_GRAPH_FILE_HEADER_SIZE = struct.calcsize(CFG_CITATION_GRAPH_FILE_HEADER)
+
+class CitationGraph:
+    """
+    Citation dictionary {recid -> [list of recids]} in compressed
+    sparse row form.  The neighbours of RECID are
+    neighbours[offsets[recid]:offsets[recid+1]], unless RECID is in
+    the (small) dictionary of changes {recid -> list of recids, or
+    None if removed} applied on top of the arrays, which can thus be
+    shared by all the processes even after some changes.
+
+    Offers the read-only part of the dictionary interface, so that it
+    can be used in place of the citation dictionaries of old.
+    """
+
+    def __init__(self, offsets=None, neighbours=None, nb_keys=0, changes=None):
+        """Initialise.
+        @param offsets: array of len(max recid) + 2 offsets
+        @param neighbours: array of neighbours of all records
+        @param nb_keys: number of records having some neighbours in the
+               arrays
+        @param changes: dictionary of the changes applied on top of the
+               arrays, see update_citation_graph()
+        """
+        if offsets is None:
+            offsets = array(CFG_INT32_TYPECODE, [0])
+        if neighbours is None:
+            neighbours = array(CFG_INT32_TYPECODE)
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.nb_keys = nb_keys
+        self.changes = changes or {}
+        self.nb_keys_with_changes = nb_keys
+        for recid, recids in self.changes.iteritems():
+            if recids and not self._get_base_count(recid):
+                self.nb_keys_with_changes += 1
+            elif not recids and self._get_base_count(recid):
+                self.nb_keys_with_changes -= 1
+
+    def __len__(self):
+        return self.nb_keys_with_changes
+
+    def _get_base_count(self, recid):
+        """Return number of neighbours of RECID in the arrays."""
+        if 0 <= recid < len(self.offsets) - 1:
+            return int(self.offsets[recid + 1] - self.offsets[recid])
+        return 0
+
+    def get_count(self, recid):
+        """Return number of neighbours of RECID."""
+        if recid in self.changes:
+            return len(self.changes[recid] or [])
+        return self._get_base_count(recid)
+
+    def get(self, recid, default=None):
+        """Return list of neighbours of RECID, or DEFAULT if none."""
+        if recid in self.changes:
+            return list(self.changes[recid] or []) or default
+        if 0 <= recid < len(self.offsets) - 1:
+            start = self.offsets[recid]
+            end = self.offsets[recid + 1]
+            if start < end:
+                return self.neighbours[start:end].tolist()
+        return default
+
+    def __getitem__(self, recid):
+        neighbours = self.get(recid)
+        if neighbours is None:
+            raise KeyError(recid)
+        return neighbours
+
+    def has_key(self, recid):
+        return self.get_count(recid) > 0
+
+    def __contains__(self, recid):
+        return self.has_key(recid)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """Return list of record IDs having some neighbours."""
+        if CFG_NUMPY_IMPORTABLE and isinstance(self.offsets, numpy.ndarray):
+            keys = numpy.nonzero(numpy.diff(self.offsets))[0].tolist()
+        else:
+            offsets = self.offsets
+            keys = [recid for recid in xrange(len(offsets) - 1)
+                    if offsets[recid] < offsets[recid + 1]]
+        if self.changes:
+            keys = intbitset(keys)
+            for recid, recids in self.changes.iteritems():
+                if recids:
+                    keys.add(recid)
+                else:
+                    keys.discard(recid)
+            keys = keys.tolist()
+        return keys
+
+    def iteritems(self):
+        for recid in self.keys():
+            yield recid, self.get(recid)
+
+    def get_keys_with_count(self, low, high=None):
+        """Return intbitset of record IDs having at least LOW and at
+        most HIGH neighbours (no upper limit if HIGH is None).  LOW
+        should be at least 1."""
+        if CFG_NUMPY_IMPORTABLE and isinstance(self.offsets, numpy.ndarray):
+            counts = numpy.diff(self.offsets)
+            selected = counts >= low
+            if high is not None:
+                selected &= counts <= high
+            out = intbitset(numpy.nonzero(selected)[0].tolist())
+        else:
+            offsets = self.offsets
+            out = intbitset()
+            for recid in xrange(len(offsets) - 1):
+                count = offsets[recid + 1] - offsets[recid]
+                if count >= low and (high is None or count <= high):
+                    out.add(recid)
+        for recid, recids in self.changes.iteritems():
+            count = len(recids or [])
+            if count >= low and (high is None or count <= high):
+                out.add(recid)
+            else:
+                out.discard(recid)
+        return out
+
+    def get_neighbours_hitset(self, hitset):
+        """Return intbitset of all the neighbours of the records of
+        HITSET."""
+        slices = []
+        changed = intbitset()
+        max_recid = len(self.offsets) - 2
+        for recid in hitset:
+            if recid in self.changes:
+                changed |= intbitset(self.changes[recid] or [])
+                continue
+            if recid > max_recid:
+                if not self.changes:
+                    break
+                continue
+            start = self.offsets[recid]
+            end = self.offsets[recid + 1]
+            if start < end:
+                slices.append(self.neighbours[start:end])
+        if not slices:
+            return changed
+        if CFG_NUMPY_IMPORTABLE and isinstance(self.neighbours, numpy.ndarray):
+            return intbitset(numpy.concatenate(slices).tolist()) | changed
+        neighbours = array(CFG_INT32_TYPECODE)
+        for neighbours_slice in slices:
+            neighbours.extend(neighbours_slice)
+        return intbitset(neighbours.tolist()) | changed
+
+def create_citation_graph(dic):
+    """Return CitationGraph of citation dictionary DIC, that is
+    {recid -> [list of recids]}."""
+    offsets = array(CFG_INT32_TYPECODE, [0])
+    neighbours = array(CFG_INT32_TYPECODE)
+    nb_keys = 0
+    if dic:
+        for recid in xrange(max(dic.keys()) + 1):
+            recids = dic.get(recid)
+            if recids:
+                neighbours.extend(recids)
+                nb_keys += 1
+            offsets.append(len(neighbours))
+    return CitationGraph(offsets, neighbours, nb_keys)
+
+def update_citation_graph(graph, changes):
+    """Return new CitationGraph made of GRAPH where the neighbours of
+    the record IDs of CHANGES, that is {recid -> [list of recids]},
+    are replaced by the new ones (an empty list or None removing all
+    of them).  The changes are kept in a dictionary on top of the
+    arrays of GRAPH, which are shared and left untouched."""
+    if not changes:
+        return graph
+    all_changes = dict(graph.changes)
+    all_changes.update(changes)
+    return CitationGraph(graph.offsets, graph.neighbours, graph.nb_keys,
+                         all_changes)
+
+def merge_citation_graph(graph):
+    """Return CitationGraph having the same neighbours as GRAPH, with
+    the changes applied on top of its arrays merged into new arrays.
+    The unchanged runs of neighbours are copied as whole slices, GRAPH
+    itself being left untouched."""
+    changes = graph.changes
+    if not changes:
+        return graph
+    old_offsets = graph.offsets
+    old_neighbours = graph.neighbours
+    nb_old_recids = len(old_offsets) - 1
+    nb_recids = max(nb_old_recids, max(changes.keys()) + 1)
+    numpy_p = CFG_NUMPY_IMPORTABLE and isinstance(old_offsets, numpy.ndarray)
+    if numpy_p:
+        counts = numpy.zeros(nb_recids, dtype=numpy.int32)
+        counts[:nb_old_recids] = numpy.diff(old_offsets)
+    else:
+        counts = array(CFG_INT32_TYPECODE,
+                       [old_offsets[recid + 1] - old_offsets[recid]
+                        for recid in xrange(nb_old_recids)])
+        counts.extend([0] * (nb_recids - nb_old_recids))
+    slices = []
+    next_recid = 0
+    for recid in sorted(changes.keys()):
+        # unchanged neighbours of the records since the last change:
+        start = old_offsets[min(next_recid, nb_old_recids)]
+        end = old_offsets[min(recid, nb_old_recids)]
+        if start < end:
+            slices.append(old_neighbours[start:end])
+        recids = changes[recid] or []
+        if recids:
+            slices.append(array(CFG_INT32_TYPECODE, recids))
+        counts[recid] = len(recids)
+        next_recid = recid + 1
+    start = old_offsets[min(next_recid, nb_old_recids)]
+    if start < old_offsets[nb_old_recids]:
+        slices.append(old_neighbours[start:old_offsets[nb_old_recids]])
+    if numpy_p:
+        offsets = numpy.zeros(nb_recids + 1, dtype=numpy.int32)
+        numpy.cumsum(counts, out=offsets[1:])
+        if slices:
+            neighbours = numpy.concatenate([numpy.asarray(neighbours_slice, dtype=numpy.int32)
+                                            for neighbours_slice in slices])
+        else:
+            neighbours = numpy.zeros(0, dtype=numpy.int32)
+        nb_keys = int(numpy.count_nonzero(counts))
+    else:
+        offsets = array(CFG_INT32_TYPECODE, [0])
+        total = 0
+        nb_keys = 0
+        for count in counts:
+            total += count
+            offsets.append(total)
+            if count:
+                nb_keys += 1
+        neighbours = array(CFG_INT32_TYPECODE)
+        for neighbours_slice in slices:
+            neighbours.extend(neighbours_slice)
+    return CitationGraph(offsets, neighbours, nb_keys)
+
+def write_citation_graph_file(graph, filename, timestamp):
+    """Save GRAPH into FILENAME along with TIMESTAMP.  The file is
+    written under a temporary name and then renamed, so that the
+    processes reading the old file are not disturbed."""
+    graph = merge_citation_graph(graph)
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmpname = tempfile.mkstemp(prefix='.' + os.path.basename(filename), dir=dirname)
+    tmpfile = os.fdopen(fd, 'wb')
+    try:
+        tmpfile.write(struct.pack(CFG_CITATION_GRAPH_FILE_HEADER,
+                                  CFG_CITATION_GRAPH_FILE_MAGIC, timestamp,
+                                  len(graph.offsets), len(graph.neighbours),
+                                  graph.nb_keys))
+        graph.offsets.tofile(tmpfile)
+        graph.neighbours.tofile(tmpfile)
+        tmpfile.close()
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, filename)
+    except:
+        tmpfile.close()
+        os.remove(tmpname)
+        raise
+
+def read_citation_graph_file(filename):
+    """Return tuple (timestamp, graph) of the CitationGraph saved in
+    FILENAME, or (None, None) if the file does not exist or is not
+    valid.  The graph arrays are memory-mapped if NumPy is available."""
+    try:
+        graph_file = open(filename, 'rb')
+    except IOError:
+        return (None, None)
+    try:
+        header = graph_file.read(CFG_CITATION_GRAPH_FILE_HEADER_SIZE)
+        if len(header) != CFG_CITATION_GRAPH_FILE_HEADER_SIZE:
+            return (None, None)
+        magic, timestamp, nb_offsets, nb_neighbours, nb_keys = \
+               struct.unpack(CFG_CITATION_GRAPH_FILE_HEADER, header)
+        if magic != CFG_CITATION_GRAPH_FILE_MAGIC or \
+               os.path.getsize(filename) != CFG_CITATION_GRAPH_FILE_HEADER_SIZE + \
+               4 * (nb_offsets + nb_neighbours):
+            return (None, None)
+        timestamp = timestamp.rstrip('\0')
+        if CFG_NUMPY_IMPORTABLE:
+            offsets = numpy.memmap(filename, dtype=numpy.int32, mode='r',
+                                   offset=CFG_CITATION_GRAPH_FILE_HEADER_SIZE,
+                                   shape=(nb_offsets,))
+            if nb_neighbours:
+                neighbours = numpy.memmap(filename, dtype=numpy.int32, mode='r',
+                                          offset=CFG_CITATION_GRAPH_FILE_HEADER_SIZE + 4 * nb_offsets,
+                                          shape=(nb_neighbours,))
+            else:
+                neighbours = numpy.zeros(0, dtype=numpy.int32)
+        else:
+            offsets = array(CFG_INT32_TYPECODE)
+            offsets.fromfile(graph_file, nb_offsets)
+            neighbours = array(CFG_INT32_TYPECODE)
+            neighbours.fromfile(graph_file, nb_neighbours)
+        return (timestamp, CitationGraph(offsets, neighbours, nb_keys))
+    finally:
+        graph_file.close()
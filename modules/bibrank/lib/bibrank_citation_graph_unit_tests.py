@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the compact citation graph."""
+
+__revision__ = "$Id$"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from invenio.bibrank_citation_graph import create_citation_graph, \
+     read_citation_graph_file, write_citation_graph_file, \
+     update_citation_graph, merge_citation_graph
+from invenio.intbitset import intbitset
+from invenio.testutils import make_test_suite, run_test_suite
+
+CITATIONS = {1: [2, 3, 5], 3: [2], 4: [1, 2, 3, 5], 7: [1]}
+
+class TestCitationGraph(unittest.TestCase):
+    """Test of the citation graph."""
+
+    def setUp(self):
+        """Create graph of CITATIONS."""
+        self.graph = create_citation_graph(CITATIONS)
+
+    def test_dictionary_interface(self):
+        """bibrank citation graph - dictionary interface"""
+        self.assertEqual(len(self.graph), 4)
+        self.assertEqual(self.graph.keys(), [1, 3, 4, 7])
+        self.assertEqual(self.graph.get(4), [1, 2, 3, 5])
+        self.assertEqual(self.graph.get(2), None)
+        self.assertEqual(self.graph.get(100, []), [])
+        self.assertEqual(self.graph[7], [1])
+        self.assertRaises(KeyError, self.graph.__getitem__, 6)
+        self.failUnless(self.graph.has_key(3))
+        self.failIf(self.graph.has_key(0))
+        self.assertEqual(dict(self.graph.iteritems()), CITATIONS)
+
+    def test_iteration(self):
+        """bibrank citation graph - iteration over the keys"""
+        self.assertEqual([recid for recid in self.graph], [1, 3, 4, 7])
+        self.assertEqual(list(self.graph), self.graph.keys())
+        self.failUnless(7 in self.graph)
+        self.failIf(2 in self.graph)
+        self.failIf(100 in self.graph)
+        self.assertEqual(list(create_citation_graph({})), [])
+
+    def test_counts(self):
+        """bibrank citation graph - records by number of neighbours"""
+        self.assertEqual(self.graph.get_count(1), 3)
+        self.assertEqual(self.graph.get_count(2), 0)
+        self.assertEqual(self.graph.get_keys_with_count(1, 1), intbitset([3, 7]))
+        self.assertEqual(self.graph.get_keys_with_count(3), intbitset([1, 4]))
+
+    def test_neighbours_hitset(self):
+        """bibrank citation graph - neighbours of a set of records"""
+        self.assertEqual(self.graph.get_neighbours_hitset(intbitset([3, 7, 1000])),
+                         intbitset([1, 2]))
+        self.assertEqual(self.graph.get_neighbours_hitset(intbitset()),
+                         intbitset())
+
+    def test_empty_graph(self):
+        """bibrank citation graph - empty graph"""
+        graph = create_citation_graph({})
+        self.assertEqual(len(graph), 0)
+        self.assertEqual(graph.keys(), [])
+        self.assertEqual(graph.get(1, []), [])
+
+    def test_update(self):
+        """bibrank citation graph - applying changes"""
+        graph = update_citation_graph(self.graph, {3: [1, 4], 4: [], 10: [7]})
+        self.assertEqual(dict(graph.iteritems()),
+                         {1: [2, 3, 5], 3: [1, 4], 7: [1], 10: [7]})
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.get_count(4), 0)
+        self.assertEqual(dict(self.graph.iteritems()), CITATIONS)
+        graph = update_citation_graph(create_citation_graph({}), {2: [1]})
+        self.assertEqual(dict(graph.iteritems()), {2: [1]})
+        self.assertEqual(update_citation_graph(self.graph, {}), self.graph)
+
+    def test_update_overlay(self):
+        """bibrank citation graph - changes kept on top of the shared arrays"""
+        graph = update_citation_graph(self.graph, {3: [1, 4], 4: [], 10: [7]})
+        self.failUnless(graph.offsets is self.graph.offsets)
+        self.failUnless(graph.neighbours is self.graph.neighbours)
+        graph = update_citation_graph(graph, {4: [2], 7: None})
+        self.failUnless(graph.offsets is self.graph.offsets)
+        expected = {1: [2, 3, 5], 3: [1, 4], 4: [2], 10: [7]}
+        self.assertEqual(dict(graph.iteritems()), expected)
+        self.assertEqual(list(graph), [1, 3, 4, 10])
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.get(7), None)
+        self.failIf(7 in graph)
+        self.assertEqual(graph.get_count(10), 1)
+        self.assertEqual(graph.get_keys_with_count(1, 1), intbitset([4, 10]))
+        self.assertEqual(graph.get_keys_with_count(2), intbitset([1, 3]))
+        self.assertEqual(graph.get_neighbours_hitset(intbitset([3, 7, 10, 1000])),
+                         intbitset([1, 4, 7]))
+        merged = merge_citation_graph(graph)
+        self.assertEqual(merged.changes, {})
+        self.assertEqual(dict(merged.iteritems()), expected)
+        self.assertEqual(len(merged), 4)
+
+    def test_file(self):
+        """bibrank citation graph - saving to file and reading back"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'citations', 'citationdict.csr')
+            self.assertEqual(read_citation_graph_file(filename), (None, None))
+            write_citation_graph_file(self.graph, filename, '2013-07-15 10:00:00')
+            timestamp, graph = read_citation_graph_file(filename)
+            self.assertEqual(timestamp, '2013-07-15 10:00:00')
+            self.assertEqual(dict(graph.iteritems()), CITATIONS)
+            self.assertEqual(graph.get_keys_with_count(1, 1), intbitset([3, 7]))
+            self.assertEqual(graph.get_neighbours_hitset(intbitset([1, 4])),
+                             intbitset([1, 2, 3, 5]))
+            # the changes applied on top of a graph are saved too:
+            write_citation_graph_file(update_citation_graph(graph, {2: [7]}),
+                                      filename, '2013-07-16 10:00:00')
+            timestamp, graph = read_citation_graph_file(filename)
+            expected = dict(CITATIONS)
+            expected[2] = [7]
+            self.assertEqual(dict(graph.iteritems()), expected)
+        finally:
+            shutil.rmtree(tmpdir)
+
+TEST_SUITE = make_test_suite(TestCitationGraph,)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
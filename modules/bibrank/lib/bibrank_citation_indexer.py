@@ -27,7 +27,8 @@ import ConfigParser
 from itertools import islice
 from datetime import datetime
 
-from invenio.dbquery import run_sql, serialize_via_marshal, \
+from invenio.config import CFG_BIBRANK_CITATION_LOG_MAX_SIZE
+from invenio.dbquery import run_sql, run_sql_many, serialize_via_marshal, \
                             deserialize_via_marshal
 from invenio.bibindex_engine import CFG_JOURNAL_PUBINFO_STANDARD_FORM
 from invenio.search_engine import search_pattern, search_unit
@@ -39,6 +40,7 @@ from invenio.bibtask import write_message, task_get_option, \
                      task_get_task_param
 from invenio.errorlib import register_exception
 from invenio.bibindex_engine import get_field_tags
+from invenio.bibrank_citation_searcher import get_citation_dict_changes
 from invenio.bibindex_engine import CFG_JOURNAL_PUBINFO_STANDARD_FORM_REGEXP_CHECK
 
 
@@ -96,10 +98,10 @@ def get_citation_weight(rank_method_code, config, chunk_size=20000):
         if quick:
             dicts = {
                 'cites_weight': last_updated_result(rank_method_code),
-                'cites': get_cit_dict("citationdict"),
-                'refs': get_cit_dict("reversedict"),
-                'selfcites': get_cit_dict("selfcitdict"),
-                'selfrefs': get_cit_dict("selfcitedbydict"),
+                'cites': ChangeTrackingDict(get_cit_dict("citationdict")),
+                'refs': ChangeTrackingDict(get_cit_dict("reversedict")),
+                'selfcites': ChangeTrackingDict(get_cit_dict("selfcitdict")),
+                'selfrefs': ChangeTrackingDict(get_cit_dict("selfcitedbydict")),
                 'authorcites': get_initial_author_dict(),
             }
         else:
@@ -886,26 +888,94 @@ def ref_analyzer(citation_informations, dicts,
                                                         selfrefs, authorcites
 
 
-def store_dicts(dicts):
-    """Insert the reference and citation list into the database"""
-    insert_into_cit_db(dicts['refs'], "reversedict")
-    insert_into_cit_db(dicts['cites'], "citationdict")
-    insert_into_cit_db(dicts['selfcites'], "selfcitedbydict")
-    insert_into_cit_db(dicts['selfrefs'], "selfcitdict")
+class ChangeTrackingDict(dict):
+    """
+    Citation dictionary remembering which of its keys were changed,
+    so that only these need to be stored.  The lists of recids being
+    modified in place after a setdefault(), the keys passed to
+    setdefault() are considered changed too.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.changed_keys = set()
+
+    def __setitem__(self, key, value):
+        self.changed_keys.add(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.changed_keys.add(key)
+        dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+        self.changed_keys.add(key)
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *args):
+        self.changed_keys.add(key)
+        return dict.pop(self, key, *args)
+
+
+def store_dicts(dicts, compact=False):
+    """Insert the reference and citation list into the database.  Only
+    the changes are stored, unless COMPACT is set or the dictionaries
+    are not tracking their changes."""
+    for key, name in (('refs', 'reversedict'),
+                      ('cites', 'citationdict'),
+                      ('selfcites', 'selfcitedbydict'),
+                      ('selfrefs', 'selfcitdict')):
+        dic = dicts[key]
+        if compact or not isinstance(dic, ChangeTrackingDict):
+            insert_into_cit_db(dic, name)
+        elif dic.changed_keys:
+            insert_changes_into_cit_db(dic, name, dic.changed_keys)
+        if isinstance(dic, ChangeTrackingDict):
+            dic.changed_keys = set()
 
 
 def insert_into_cit_db(dic, name):
-    """Stores citation dictionary in the database"""
+    """Stores citation dictionary in the database, as a whole.  The
+    logged changes of the dictionary are removed."""
     ndate = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-    s = serialize_via_marshal(dic)
+    # marshal does not handle dict subclasses:
+    s = serialize_via_marshal(dict(dic))
     write_message("size of %s %s" % (name, len(s)))
+    last_log_id = run_sql("SELECT MAX(id) FROM rnkCITATIONLOG")[0][0]
     # check that this column really exists
     run_sql("""REPLACE INTO rnkCITATIONDATA(object_name, object_value,
                last_updated) VALUES (%s, %s, %s)""", (name, s, ndate))
+    if last_log_id is not None:
+        run_sql("""DELETE FROM rnkCITATIONLOG
+                   WHERE object_name=%s AND id<=%s""", (name, last_log_id))
+
+
+def insert_changes_into_cit_db(dic, name, recids):
+    """Append to the log of citation dictionary NAME the new values in
+    DIC of the keys RECIDS.  The dictionary is stored as a whole if it
+    has too many logged changes."""
+    nb_logged = run_sql("""SELECT COUNT(*) FROM rnkCITATIONLOG
+                           WHERE object_name=%s""", (name,))[0][0]
+    if nb_logged + len(recids) > CFG_BIBRANK_CITATION_LOG_MAX_SIZE:
+        write_message("compacting %s" % name)
+        insert_into_cit_db(dic, name)
+        return
+    write_message("logging %s changes of %s" % (len(recids), name))
+    ndate = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    params = []
+    for recid in sorted(recids):
+        value = dic.get(recid)
+        if value:
+            value = serialize_via_marshal(value)
+        else:
+            value = None
+        params.append((name, recid, value, ndate))
+    run_sql_many("""INSERT INTO rnkCITATIONLOG(object_name, id_bibrec,
+                    object_value, action_date) VALUES (%s, %s, %s, %s)""",
+                 params)
 
 
 def get_cit_dict(name):
-    """get a named citation dict from the db"""
+    """get a named citation dict from the db, with its logged changes"""
     cdict = run_sql("""SELECT object_value FROM rnkCITATIONDATA
                        WHERE object_name = %s""", (name, ))
 
@@ -914,6 +984,13 @@ def get_cit_dict(name):
     else:
         dict_from_db = {}
 
+    changes = get_citation_dict_changes(name)[0]
+    for recid, recids in changes.iteritems():
+        if recids:
+            dict_from_db[recid] = recids
+        else:
+            dict_from_db.pop(recid, None)
+
     return dict_from_db
 
 
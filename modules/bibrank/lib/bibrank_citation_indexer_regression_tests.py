@@ -129,6 +129,33 @@ class TestCitationIndexer(unittest.TestCase):
         compare_dicts(self, dicts)
 
 
+class TestCitationDictsStorage(unittest.TestCase):
+    """Testing storage of citation dictionaries."""
+    def cleanup(self):
+        run_sql("DELETE FROM rnkCITATIONDATA WHERE object_name='testdict'")
+        run_sql("DELETE FROM rnkCITATIONLOG WHERE object_name='testdict'")
+
+    def test_logged_changes(self):
+        "tests storing only the changes of a citation dictionary"
+        from invenio.bibrank_citation_indexer import ChangeTrackingDict, \
+             insert_into_cit_db, insert_changes_into_cit_db, get_cit_dict
+        self.cleanup()
+        try:
+            insert_into_cit_db({1: [2, 3], 4: [5]}, 'testdict')
+            dic = ChangeTrackingDict(get_cit_dict('testdict'))
+            dic.setdefault(6, []).append(1)
+            del dic[4]
+            self.assertEqual(dic.changed_keys, set([4, 6]))
+            insert_changes_into_cit_db(dic, 'testdict', dic.changed_keys)
+            self.assertEqual(get_cit_dict('testdict'), {1: [2, 3], 6: [1]})
+            insert_into_cit_db(dic, 'testdict')
+            self.assertEqual(run_sql("""SELECT COUNT(*) FROM rnkCITATIONLOG
+                                        WHERE object_name='testdict'""")[0][0], 0)
+            self.assertEqual(get_cit_dict('testdict'), {1: [2, 3], 6: [1]})
+        finally:
+            self.cleanup()
+
+
 class TestCitationIndexerWarnings(unittest.TestCase):
     def cleanup(self):
         run_sql("""DELETE FROM rnkCITATIONDATAERR
@@ -150,7 +177,8 @@ class TestCitationIndexerWarnings(unittest.TestCase):
         self.assertEqual(after2 - before, 2)
         self.cleanup()
 
-TEST_SUITE = make_test_suite(TestCitationIndexer, TestCitationIndexerWarnings)
+TEST_SUITE = make_test_suite(TestCitationIndexer, TestCitationDictsStorage,
+                             TestCitationIndexerWarnings)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE, warn_user=True)
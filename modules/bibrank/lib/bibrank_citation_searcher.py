@@ -19,39 +19,97 @@
 
 __revision__ = "$Id$"
 
+import os
 import re
 
+from invenio.config import CFG_CACHEDIR
 from invenio.dbquery import run_sql, get_table_update_time, OperationalError, \
         deserialize_via_marshal
 from invenio.intbitset import intbitset
-from invenio.data_cacher import DataCacher
+from invenio.data_cacher import DataCacher, datacacher_warmup
+from invenio.errorlib import register_exception
+from invenio.bibrank_citation_graph import CitationGraph, \
+     create_citation_graph, read_citation_graph_file, \
+     write_citation_graph_file, update_citation_graph
+
+def get_citation_graph_filename(name):
+    """Return the name of the file holding citation graph NAME."""
+    return os.path.join(CFG_CACHEDIR, 'citations', '%s.csr' % name)
+
+def load_citation_graph(name, last_updated):
+    """Return CitationGraph of citation dictionary NAME, that was last
+    updated at LAST_UPDATED.  The graph is read from its file if the
+    file is up-to-date; otherwise the dictionary is read from the
+    database and converted, and the file is written for the other
+    processes."""
+    filename = get_citation_graph_filename(name)
+    timestamp, graph = read_citation_graph_file(filename)
+    if graph is not None and timestamp == last_updated:
+        return graph
+    res = run_sql("SELECT object_value FROM rnkCITATIONDATA WHERE object_name=%s",
+                  (name,))
+    try:
+        dic = deserialize_via_marshal(res[0][0])
+    except:
+        dic = {}
+    graph = create_citation_graph(dic)
+    try:
+        write_citation_graph_file(graph, filename, last_updated)
+    except (IOError, OSError):
+        register_exception(prefix="Cannot write citation graph file %s" % filename)
+    return graph
+
+def get_citation_dict_changes(name, last_log_id=0):
+    """Return tuple (changes, last_log_id) of the changes of citation
+    dictionary NAME logged after LAST_LOG_ID in rnkCITATIONLOG, that
+    is {recid -> list of recids, or None if removed}, and of the ID
+    of the last logged change."""
+    changes = {}
+    res = run_sql("""SELECT id, id_bibrec, object_value FROM rnkCITATIONLOG
+                     WHERE object_name=%s AND id>%s ORDER BY id""",
+                  (name, last_log_id))
+    for log_id, recid, value in res:
+        if value:
+            changes[recid] = deserialize_via_marshal(value)
+        else:
+            changes[recid] = None
+        last_log_id = log_id
+    return changes, last_log_id
 
 class CitationDictsDataCacher(DataCacher):
     """
     Cache holding all citation dictionaries (citationdict,
-    reversedict, selfcitdict, selfcitedbydict).
+    reversedict, selfcitdict, selfcitedbydict) as CitationGraph
+    objects.  The graphs are kept in files shared by all the processes
+    of the machine, see load_citation_graph().  The changes logged by
+    the citation indexer since the dictionaries were last stored are
+    applied on top of them, and when the citation indexer runs again,
+    only the new changes are applied, unless the dictionaries were
+    stored again in the meantime.
     """
     def __init__(self):
+        self.dicts_last_updated = {} # name -> rnkCITATIONDATA last_updated
+        self.last_log_ids = {} # name -> last applied rnkCITATIONLOG id
         def cache_filler():
             alldicts = {}
             try:
-                res = run_sql("SELECT object_name,object_value FROM rnkCITATIONDATA")
+                res = run_sql("""SELECT object_name,
+                                 DATE_FORMAT(last_updated, '%Y-%m-%d %H:%i:%s')
+                                 FROM rnkCITATIONDATA""")
             except OperationalError:
                 # database problems, return empty cache
                 return {}
-            for row in res:
-                object_name = row[0]
-                object_value = row[1]
-                try:
-                    object_value_dict = deserialize_via_marshal(object_value)
-                except:
-                    object_value_dict = {}
-                alldicts[object_name] = object_value_dict
-                if object_name == 'citationdict':
-                    # for cited:M->N queries, it is interesting to cache also
-                    # some preprocessed citationdict:
-                    alldicts['citationdict_keys'] = object_value_dict.keys()
-                    alldicts['citationdict_keys_intbitset'] = intbitset(object_value_dict.keys())
+            dicts_last_updated = {}
+            last_log_ids = {}
+            for object_name, last_updated in res:
+                last_updated = last_updated or ''
+                graph = load_citation_graph(object_name, last_updated)
+                changes, last_log_ids[object_name] = \
+                         get_citation_dict_changes(object_name)
+                alldicts[object_name] = update_citation_graph(graph, changes)
+                dicts_last_updated[object_name] = last_updated
+            self.dicts_last_updated = dicts_last_updated
+            self.last_log_ids = last_log_ids
             return alldicts
         def timestamp_verifier():
             res = run_sql("""SELECT DATE_FORMAT(last_updated, '%Y-%m-%d %H:%i:%s')
@@ -63,6 +121,40 @@ class CitationDictsDataCacher(DataCacher):
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
+    def complete_cache(self, cache):
+        """Add to CACHE some preprocessed citationdict data."""
+        # for cited:M->N queries, it is interesting to cache also
+        # the set of cited records:
+        citationdict = cache.get('citationdict', CitationGraph())
+        cache['citationdict_keys_intbitset'] = intbitset(citationdict.keys())
+
+    def refresh_delta(self, since_timestamp):
+        """Return the citation dictionaries having new logged changes,
+        with these changes applied, or None if some dictionary was
+        stored as a whole since it was loaded."""
+        try:
+            res = run_sql("""SELECT object_name,
+                             DATE_FORMAT(last_updated, '%Y-%m-%d %H:%i:%s')
+                             FROM rnkCITATIONDATA""")
+        except OperationalError:
+            return None
+        if dict([(object_name, last_updated or '')
+                 for object_name, last_updated in res]) != self.dicts_last_updated:
+            return None
+        delta = {}
+        last_log_ids = dict(self.last_log_ids)
+        for object_name in self.dicts_last_updated.keys():
+            changes, last_log_ids[object_name] = \
+                     get_citation_dict_changes(object_name,
+                                               last_log_ids.get(object_name, 0))
+            if changes:
+                delta[object_name] = update_citation_graph(
+                    self.cache.get(object_name, CitationGraph()), changes)
+        if 'citationdict' in delta:
+            self.complete_cache(delta)
+        self.last_log_ids = last_log_ids
+        return delta
+
 CACHE_CITATION_DICTS = None
 
 def get_citation_dict(dictname):
@@ -76,14 +168,16 @@ def get_citation_dict(dictname):
     @type dictname: string
     @return: a citation dictionary. The structure of the dictionary is
             { recid -> [list of recids] }.
-    @rtype: dictionary
+    @rtype: CitationGraph (read-only dictionary)
     """
     global CACHE_CITATION_DICTS
+    # the dictionaries may be being loaded by the warmup thread:
+    datacacher_warmup.wait('citation_dicts')
     if CACHE_CITATION_DICTS is None:
         CACHE_CITATION_DICTS = CitationDictsDataCacher()
     else:
         CACHE_CITATION_DICTS.recreate_cache_if_needed()
-    return CACHE_CITATION_DICTS.cache.get(dictname, {})
+    return CACHE_CITATION_DICTS.cache.get(dictname, CitationGraph())
 
 def get_refers_to(recordid):
     """Return a list of records referenced by this record"""
@@ -113,9 +207,7 @@ def get_records_with_num_cites(numstr, allrecs = intbitset([])):
        be 10,0->100 etc
     """
     cache_cited_by_dictionary = get_citation_dict("citationdict")
-    cache_cited_by_dictionary_keys = get_citation_dict("citationdict_keys")
     cache_cited_by_dictionary_keys_intbitset = get_citation_dict("citationdict_keys_intbitset")
-    matches = intbitset([])
     #once again, check that the parameter is a string
     if not (type(numstr) == type("thisisastring")):
         return intbitset([])
@@ -130,11 +222,7 @@ def get_records_with_num_cites(numstr, allrecs = intbitset([])):
         if num == 0:
             #we return recids that are not in keys
             return allrecs - cache_cited_by_dictionary_keys_intbitset
-        for k in cache_cited_by_dictionary_keys:
-            li = cache_cited_by_dictionary[k]
-            if len(li) == num:
-                matches.add(k)
-        return matches
+        return cache_cited_by_dictionary.get_keys_with_count(num, num)
 
     #try to get 1->10 or such
     firstsec = re.findall("(\d+)->(\d+)", numstr)
@@ -146,25 +234,19 @@ def get_records_with_num_cites(numstr, allrecs = intbitset([])):
             sec = int(firstsec[0][1])
         except:
             return intbitset([])
+        matches = intbitset([])
         if (first == 0):
             #start with those that have no cites..
             matches = allrecs - cache_cited_by_dictionary_keys_intbitset
         if (first <= sec):
-            for k in cache_cited_by_dictionary_keys:
-                li = cache_cited_by_dictionary[k]
-                if len(li) >= first:
-                    if len(li) <= sec:
-                        matches.add(k)
+            matches |= cache_cited_by_dictionary.get_keys_with_count(max(first, 1), sec)
             return matches
 
     firstsec = re.findall("(\d+)\+", numstr)
     if firstsec:
         first = firstsec[0]
-        for k in cache_cited_by_dictionary_keys:
-            li = cache_cited_by_dictionary[k]
-            if len(li) > int(first):
-                matches.add(k)
-    return matches
+        return cache_cited_by_dictionary.get_keys_with_count(int(first) + 1)
+    return intbitset([])
 
 def get_cited_by_list(recordlist):
     """Return a tuple of ([recid,list_of_citing_records],...) for all the
@@ -186,8 +268,7 @@ def get_refersto_hitset(ahitset):
     out = intbitset()
     if ahitset:
         try:
-            for recid in ahitset:
-                out = out | intbitset(cache_cited_by_dictionary.get(recid, []))
+            out = cache_cited_by_dictionary.get_neighbours_hitset(ahitset)
         except OverflowError:
             # ignore attempt to iterate over infinite ahitset
             pass
@@ -202,8 +283,7 @@ def get_citedby_hitset(ahitset):
     out = intbitset()
     if ahitset:
         try:
-            for recid in ahitset:
-                out = out | intbitset(cache_cited_by_dictionary.get(recid, []))
+            out = cache_cited_by_dictionary.get_neighbours_hitset(ahitset)
         except OverflowError:
             # ignore attempt to iterate over infinite ahitset
             pass
@@ -216,7 +296,7 @@ def get_cited_by_weight(recordlist):
     cache_cited_by_dictionary = get_citation_dict("citationdict")
     result = []
     for recid in recordlist:
-        result.append([recid, len(cache_cited_by_dictionary.get(recid, []))])
+        result.append([recid, cache_cited_by_dictionary.get_count(recid)])
     return result
 
 def calculate_cited_by_list(record_id, sort_order="d"):
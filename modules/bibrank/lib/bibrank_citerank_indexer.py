@@ -29,24 +29,33 @@ the citation graph:
 import ConfigParser
 from math import exp
 import datetime
+import marshal
+import os
 import time
 import re
 import sys
 try:
-    from numpy import array, ones, zeros, int32, float32, sqrt, dot
+    import numpy
+    from numpy import array, ones, zeros, int32, float32, float64, sqrt, dot
     import_numpy = 1
 except ImportError:
     import_numpy = 0
+try:
+    from scipy.sparse import csr_matrix
+    import_scipy = 1
+except ImportError:
+    import_scipy = 0
 
 if sys.hexversion < 0x2040000:
     # pylint: disable=W0622
     from sets import Set as set
     # pylint: enable=W0622
 
-from invenio.dbquery import run_sql, serialize_via_marshal, \
-        deserialize_via_marshal
+from invenio.dbquery import run_sql, serialize_via_marshal
 from invenio.bibtask import write_message
-from invenio.config import CFG_ETCDIR
+from invenio.config import CFG_ETCDIR, CFG_CACHEDIR
+from invenio.bibrank_citation_indexer import get_cit_dict
+from invenio.bibrank_score_vector import export_score_vector
 
 
 def get_citations_from_file(filename):
@@ -93,34 +102,26 @@ def get_citations_from_db():
     -a dict of type a:{b} where recid 'a' is asociated with an index 'b'"""
     dict_of_ids = {}
     count = 0
-    query = "select object_value from rnkCITATIONDATA \
-                where object_name = 'citationdict'"
-    cit_compressed = run_sql(query)
-    cit = []
-    if cit_compressed and cit_compressed[0] and cit_compressed[0][0]:
-        cit = deserialize_via_marshal(cit_compressed[0][0])
-        if cit:
-            for item in cit:
-                #check for duplicates in citation dictionary
-                cit[item] = set(cit[item])
-                if item in cit[item]:
-                    cit[item].remove(item)
-                if item not in dict_of_ids:
-                    dict_of_ids[item] = count
+    cit = get_cit_dict('citationdict')
+    if cit:
+        for item in cit:
+            #check for duplicates in citation dictionary
+            cit[item] = set(cit[item])
+            if item in cit[item]:
+                cit[item].remove(item)
+            if item not in dict_of_ids:
+                dict_of_ids[item] = count
+                count += 1
+            for value in cit[item]:
+                if value not in dict_of_ids:
+                    dict_of_ids[value] = count
                     count += 1
-                for value in cit[item]:
-                    if value not in dict_of_ids:
-                        dict_of_ids[value] = count
-                        count += 1
-            write_message("Citation data collected\
+        write_message("Citation data collected\
 from rnkCITATIONDATA", verbose=2)
-            write_message("Ids and recids corespondace: %s" \
-                % str(dict_of_ids), verbose=9)
-            write_message("Citations: %s" % str(cit), verbose=9)
-            return cit, dict_of_ids
-        else:
-            write_message("Error while extracting citation data \
-from rnkCITATIONDATA table", verbose=1)
+        write_message("Ids and recids corespondace: %s" \
+            % str(dict_of_ids), verbose=9)
+        write_message("Citations: %s" % str(cit), verbose=9)
+        return cit, dict_of_ids
     else:
         write_message("Error while extracting citation data \
 from rnkCITATIONDATA table", verbose=1)
@@ -545,6 +546,211 @@ The threshold was %s" % (str(nr_of_check_points), \
     return weights_old
 
 
+class CitationMatrix:
+    """Sparse matrix in compressed sparse row form, where the entry
+    (i, j) is the weight that paper i receives from paper j citing it.
+    Uses SciPy for the multiplication if available, NumPy otherwise."""
+
+    def __init__(self, indptr, indices, data, size):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.size = size
+        self.nonempty_rows = numpy.nonzero(indptr[:-1] < indptr[1:])[0]
+        if import_scipy:
+            self.matrix = csr_matrix((data, indices, indptr), shape=(size, size))
+        else:
+            self.matrix = None
+
+    def dot(self, weights):
+        """returns the product of the matrix by the vector WEIGHTS"""
+        if self.matrix is not None:
+            return self.matrix.dot(weights)
+        result = zeros(self.size, float64)
+        if len(self.data):
+            products = self.data * weights[self.indices]
+            result[self.nonempty_rows] = numpy.add.reduceat(products, \
+                self.indptr[self.nonempty_rows])
+        return result
+
+
+def construct_citation_matrix(cit, dict_of_ids, len_, coefficients):
+    """returns the CitationMatrix where the entry (i, j), for paper i
+    cited by paper j, is COEFFICIENTS[j]"""
+    rows = []
+    cols = []
+    for item in cit:
+        values = [dict_of_ids[value] for value in cit[item]]
+        rows.extend([dict_of_ids[item]] * len(values))
+        cols.extend(values)
+    rows = array(rows, int32)
+    cols = array(cols, int32)
+    order = numpy.lexsort((cols, rows))
+    rows = rows[order]
+    cols = cols[order]
+    indptr = zeros(len_ + 1, int32)
+    if len(rows):
+        numpy.cumsum(numpy.bincount(rows, minlength=len_), out=indptr[1:])
+    write_message("Citation matrix calculated: %s citations" % len(cols), \
+                  verbose=3)
+    return CitationMatrix(indptr, cols, coefficients[cols], len_)
+
+
+def get_start_weights(len_, dict_of_ids, previous_weights=None):
+    """returns the initial weights of the power iteration: the weights
+    of the previous run, if any, for the papers that were already
+    ranked, and 1 for the others, the total being LEN_ as when
+    starting from scratch"""
+    weights = ones(len_, float64)
+    if previous_weights:
+        for recid, weight in previous_weights.iteritems():
+            idx = dict_of_ids.get(recid)
+            if idx is not None and weight > 0:
+                weights[idx] = weight
+        weights *= len_ / weights.sum()
+    return weights
+
+
+def power_iteration(step_function, weights, conv_threshold, check_point):
+    """runs step_function on the weights until they are stable, and
+    returns the final weights and the convergence statistics"""
+    start_time = time.time()
+    len_ = len(weights)
+    converged = False
+    nr_of_steps = 0
+    difference = len_
+    while not converged:
+        for step in range(check_point):
+            weights_new = step_function(weights)
+            nr_of_steps += 1
+            if step == check_point - 1:
+                diff = weights_new - weights
+                difference = sqrt(dot(diff, diff))/len_
+                write_message("Finished step: %s, %s " \
+                        % (str(nr_of_steps - 1), str(difference)), verbose=5)
+            weights = weights_new
+        converged = (difference < conv_threshold)
+    statistics = {'steps': nr_of_steps,
+                  'difference': float(difference),
+                  'time': time.time() - start_time}
+    write_message("PageRank calculated for all recids finished in %s steps \
+(%.2f s). The threshold was %s" % (nr_of_steps, statistics['time'], \
+        str(difference)), verbose=2)
+    return weights, statistics
+
+
+def compute_pagerank(cit, dict_of_ids, len_, ref, damping_factor, \
+                     conv_threshold, check_point, date_coef=None, \
+                     start_weights=None):
+    """the core function of the PAGERANK and PAGERANK_TIME methods,
+    using sparse matrix multiplication; returns an array with the ranks
+    coresponding to each recid and the convergence statistics"""
+    ref = array(ref, float64)
+    dangling = numpy.nonzero(ref == 0)[0]
+    ref[dangling] = 1
+    coefficients = damping_factor / ref
+    if date_coef is not None:
+        date_coef = array([date_coef[j] for j in range(len_)], float64)
+        coefficients *= date_coef
+    matrix = construct_citation_matrix(cit, dict_of_ids, len_, coefficients)
+    semi_sparse_coef = damping_factor/len_
+    zero_coef = 1.0/len_ - semi_sparse_coef
+
+    def step(weights):
+        """one step of the power iteration"""
+        if date_coef is not None:
+            weights_coef = weights * date_coef
+        else:
+            weights_coef = weights
+        return matrix.dot(weights) + \
+               semi_sparse_coef * weights_coef[dangling].sum() + \
+               zero_coef * weights_coef.sum()
+
+    if start_weights is None:
+        start_weights = ones(len_, float64)
+    return power_iteration(step, start_weights, conv_threshold, check_point)
+
+
+def compute_pagerank_ext(cit, dict_of_ids, ref, ext_links, conv_threshold, \
+                         check_point, alpha, beta, start_weights=None):
+    """the core function of the PAGERANK_EXT method, using sparse matrix
+    multiplication; returns an array with the ranks coresponding to
+    each recid and the convergence statistics"""
+    len_ = len(dict_of_ids)
+    ref = array(ref, float64)
+    dangling = ref == 0
+    ext = zeros(len_, float64)
+    for j, nr_of_links in ext_links.iteritems():
+        ext[j] = nr_of_links
+    aux = beta * ext
+    # weight that a paper gives to the external node:
+    ext_coef = numpy.where(ext == 0, beta/(len_ + beta), \
+                   aux/(aux + numpy.where(dangling, len_, ref)))
+    semi_sparse = numpy.where(dangling, (1.0 - ext_coef)/len_, 0.0)
+    matrix = construct_citation_matrix(cit, dict_of_ids, len_, \
+                 (1.0 - ext_coef)/numpy.where(dangling, 1, ref))
+
+    def step(weights):
+        """one step of the power iteration"""
+        internal_weights = weights[1:]
+        weights_new = zeros(len_ + 1, float64)
+        weights_new[0] = (1.0 - alpha) * weights[0] + \
+                         dot(ext_coef, internal_weights)
+        weights_new[1:] = matrix.dot(internal_weights) + \
+                          alpha/len_ * weights[0] + \
+                          dot(semi_sparse, internal_weights)
+        return weights_new
+
+    weights = ones(len_ + 1, float64)
+    if start_weights is not None:
+        weights[1:] = start_weights
+    weights, statistics = power_iteration(step, weights, \
+                              conv_threshold, check_point)
+    return weights[1:], statistics
+
+
+def get_weights_filename(rank_method_code):
+    """returns the name of the file keeping the weights of the last
+    run of the rank method"""
+    return os.path.join(CFG_CACHEDIR, 'rnkMETHODDATA', \
+                        '%s.weights' % rank_method_code)
+
+
+def load_previous_weights(rank_method_code):
+    """returns the dictionary recid:weight of the last run of the rank
+    method, or None if there is none"""
+    try:
+        weights_file = open(get_weights_filename(rank_method_code), 'rb')
+        try:
+            return marshal.load(weights_file)['weights']
+        finally:
+            weights_file.close()
+    except (IOError, EOFError, ValueError, TypeError, KeyError):
+        return None
+
+
+def save_weights(rank_method_code, weights, dict_of_ids, statistics):
+    """saves the weights of this run of the rank method, so that the
+    next run can start from them, along with its convergence
+    statistics"""
+    filename = get_weights_filename(rank_method_code)
+    data = {'weights': dict([(recid, float(weights[idx])) \
+                             for recid, idx in dict_of_ids.iteritems()]),
+            'statistics': statistics}
+    try:
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        weights_file = open(filename, 'wb')
+        try:
+            marshal.dump(data, weights_file)
+        finally:
+            weights_file.close()
+    except (IOError, OSError), err:
+        write_message("Cannot save the weights into %s: %s" \
+                      % (filename, err), sys.stderr)
+
+
 def citation_rank_time(cit, dict_of_ids, date_coef, dates, decimals):
     """returns a dictionary recid:weight based on the total number of
     citations as function of time"""
@@ -623,11 +829,12 @@ def into_db(dict_of_ranks, rank_method_code):
     del_rank_method_data(rank_method_code)
     serialized_data = serialize_via_marshal(dict_of_ranks)
     method_id_str = str(method_id[0][0])
-    run_sql("INSERT INTO rnkMETHODDATA(id_rnkMETHOD, relevance_data) \
-        VALUES(%s, %s) ", (method_id_str, serialized_data, ))
     date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    run_sql("INSERT INTO rnkMETHODDATA(id_rnkMETHOD, relevance_data, \
+        last_updated) VALUES(%s, %s, %s) ", (method_id_str, serialized_data, date))
     run_sql("UPDATE rnkMETHOD SET last_updated=%s WHERE name=%s", \
         (date, rank_method_code))
+    export_score_vector(rank_method_code, dict_of_ranks, date)
     write_message("Finished writing the ranks into rnkMETHOD table", verbose=5)
 
 
@@ -635,10 +842,8 @@ def run_pagerank(cit, dict_of_ids, len_, ref, damping_factor, \
             conv_threshold, check_point, dates):
     """returns the final form of the ranks when using pagerank method"""
     write_message("Running the PageRank method", verbose=5)
-    sparse, semi_sparse, semi_sparse_coeficient = \
-        construct_sparse_matrix(cit, ref, dict_of_ids, len_, damping_factor)
-    weights = pagerank(conv_threshold, check_point, len_, \
-                    sparse, semi_sparse, semi_sparse_coeficient)
+    weights = compute_pagerank(cit, dict_of_ids, len_, ref, damping_factor, \
+                               conv_threshold, check_point)[0]
     dict_of_ranks = get_ranks(weights, dict_of_ids, 1, dates, 2)
     return dict_of_ranks
 
@@ -647,11 +852,8 @@ def run_pagerank_ext(cit, dict_of_ids, ref, ext_links, \
                         conv_threshold, check_point, alpha, beta, dates):
     """returns the final form of the ranks when using pagerank_ext method"""
     write_message("Running the PageRank with external links method", verbose=5)
-    len_ = len(dict_of_ids)
-    sparse, semi_sparse = construct_sparse_matrix_ext(cit, ref, \
-        ext_links, dict_of_ids, alpha, beta)
-    weights = pagerank_ext(conv_threshold, check_point, \
-        len_ + 1, sparse, semi_sparse)
+    weights = compute_pagerank_ext(cit, dict_of_ids, ref, ext_links, \
+        conv_threshold, check_point, alpha, beta)[0]
     dict_of_ranks = get_ranks(weights, dict_of_ids, 1, dates, 2)
     return dict_of_ranks
 
@@ -661,11 +863,8 @@ def run_pagerank_time(cit, dict_of_ids, len_, ref, damping_factor, \
     """returns the final form of the ranks when using
     pagerank + time decay method"""
     write_message("Running the PageRank_time method", verbose=5)
-    sparse, semi_sparse, semi_sparse_coeficient = \
-        construct_sparse_matrix_time(cit, ref, dict_of_ids, \
-            damping_factor, date_coef)
-    weights = pagerank_time(conv_threshold, check_point, len_, \
-        sparse, semi_sparse, semi_sparse_coeficient, date_coef)
+    weights = compute_pagerank(cit, dict_of_ids, len_, ref, damping_factor, \
+        conv_threshold, check_point, date_coef)[0]
     dict_of_ranks = get_ranks(weights, dict_of_ids, 100000, dates, 2)
     return dict_of_ranks
 
@@ -810,6 +1009,18 @@ str(conv_threshold), str(check_point)), verbose=5)
             raise Exception
         if method == "pagerank_classic":
             ref = construct_ref_array(cit, dict_of_ids, len_)
+            previous_weights = None
+            try:
+                warm_start = config.get(function, "warm_start")
+            except ConfigParser.NoOptionError:
+                warm_start = "yes"
+            if warm_start == "yes":
+                previous_weights = load_previous_weights(rank_method_code)
+                if previous_weights:
+                    write_message("Starting from the weights of the previous \
+run", verbose=5)
+            start_weights = get_start_weights(len_, dict_of_ids, \
+                                              previous_weights)
             use_ext_cit = ""
             try:
                 use_ext_cit = config.get(function, "use_external_citations")
@@ -848,11 +1059,19 @@ sys.stderr)
                 except (ConfigParser.NoOptionError, StandardError), err:
                     write_message("Exception: %s" % err, sys.stderr)
                     raise Exception
-                dict_of_ranks = run_pagerank_ext(cit, dict_of_ids, ref, \
-                ext_links, conv_threshold, check_point, alpha, beta, dates)
+                write_message("Running the PageRank with external links \
+method", verbose=5)
+                weights, statistics = compute_pagerank_ext(cit, dict_of_ids, \
+                    ref, ext_links, conv_threshold, check_point, alpha, beta, \
+                    start_weights)
             else:
-                dict_of_ranks = run_pagerank(cit, dict_of_ids, len_, ref, \
-                    damping_factor, conv_threshold, check_point, dates)
+                write_message("Running the PageRank method", verbose=5)
+                weights, statistics = compute_pagerank(cit, dict_of_ids, \
+                    len_, ref, damping_factor, conv_threshold, check_point, \
+                    start_weights=start_weights)
+            statistics['warm_start'] = bool(previous_weights)
+            save_weights(rank_method_code, weights, dict_of_ids, statistics)
+            dict_of_ranks = get_ranks(weights, dict_of_ids, 1, dates, 2)
         elif method == "pagerank_time":
             try:
                 time_decay = float(config.get(function, "time_decay"))
@@ -864,8 +1083,14 @@ sys.stderr)
             date_coef = calculate_time_weights(len_, time_decay, dates)
             cit = remove_loops(cit, dates, dict_of_ids)
             ref = construct_ref_array(cit, dict_of_ids, len_)
-            dict_of_ranks = run_pagerank_time(cit, dict_of_ids, len_, ref, \
-             damping_factor, conv_threshold, check_point, date_coef, dates)
+            # the time decayed weights are not normalized, so that they
+            # depend on the initial weights: always start from scratch
+            write_message("Running the PageRank_time method", verbose=5)
+            weights, statistics = compute_pagerank(cit, dict_of_ids, len_, \
+                ref, damping_factor, conv_threshold, check_point, date_coef)
+            statistics['warm_start'] = False
+            save_weights(rank_method_code, weights, dict_of_ids, statistics)
+            dict_of_ranks = get_ranks(weights, dict_of_ids, 100000, dates, 2)
         else:
             write_message("Error: Unknown ranking method. \
 Please check the ranking_method parameter in the config. file.", sys.stderr)
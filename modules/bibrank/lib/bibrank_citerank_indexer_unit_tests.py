@@ -51,6 +51,44 @@ class TestCiterankIndexer(unittest.TestCase):
         dict_of_ranks = bibrank_citerank_indexer.run_pagerank(self.cit, self.dict_of_ids, len(self.dict_of_ids), self.ref, self.damping_factor, self.conv_threshold, self.check_point, self.dates)
         self.assertEqual({96: 0.622, 18: 1.1419839999999999, 74: 0.88200100000000003, 77: 1.142002, 78: 1.6020020000000001, 79: 0.86200299999999996, 80: 0.62200199999999994, 81: 2.712002, 82: 0.62200199999999994, 83: 0.62200299999999997, 84: 1.6520029999999999, 85: 0.62200299999999997, 86: 0.62200299999999997, 87: 0.62200299999999997, 88: 0.62200299999999997, 89: 0.62200500000000003, 91: 0.88200699999999999, 92: 0.62200599999999995, 94: 1.1419969999999999, 95: 1.8519990000000002}, dict_of_ranks)
 
+    def test_sparse_matrix_pagerank(self):
+        """bibrank citerank indexer - sparse matrix pagerank"""
+        len_ = len(self.dict_of_ids)
+        sparse, semi_sparse, semi_sparse_coef = bibrank_citerank_indexer.construct_sparse_matrix(self.cit, self.ref, self.dict_of_ids, len_, self.damping_factor)
+        expected = bibrank_citerank_indexer.pagerank(self.conv_threshold, self.check_point, len_, sparse, semi_sparse, semi_sparse_coef)
+        weights, statistics = bibrank_citerank_indexer.compute_pagerank(self.cit, self.dict_of_ids, len_, self.ref, self.damping_factor, self.conv_threshold, self.check_point)
+        self.assertEqual([round(weight, 4) for weight in expected], [round(weight, 4) for weight in weights])
+        self.failUnless(statistics['difference'] < self.conv_threshold)
+
+    def test_sparse_matrix_pagerank_time(self):
+        """bibrank citerank indexer - sparse matrix pagerank with time decay"""
+        len_ = len(self.dict_of_ids)
+        date_coef = bibrank_citerank_indexer.calculate_time_weights(len_, 0.2, self.dates)
+        sparse, semi_sparse, semi_sparse_coef = bibrank_citerank_indexer.construct_sparse_matrix_time(self.cit, self.ref, self.dict_of_ids, self.damping_factor, date_coef)
+        expected = bibrank_citerank_indexer.pagerank_time(self.conv_threshold, self.check_point, len_, sparse, semi_sparse, semi_sparse_coef, date_coef)
+        weights = bibrank_citerank_indexer.compute_pagerank(self.cit, self.dict_of_ids, len_, self.ref, self.damping_factor, self.conv_threshold, self.check_point, date_coef)[0]
+        self.assertEqual([round(weight, 4) for weight in expected], [round(weight, 4) for weight in weights])
+
+    def test_sparse_matrix_pagerank_ext(self):
+        """bibrank citerank indexer - sparse matrix pagerank with external links"""
+        len_ = len(self.dict_of_ids)
+        ext_links = {0: 3, 1: 0, 5: 10, 8: 1}
+        sparse, semi_sparse = bibrank_citerank_indexer.construct_sparse_matrix_ext(self.cit, self.ref, ext_links, self.dict_of_ids, 0.1, 0.1)
+        expected = bibrank_citerank_indexer.pagerank_ext(self.conv_threshold, self.check_point, len_ + 1, sparse, semi_sparse)
+        weights = bibrank_citerank_indexer.compute_pagerank_ext(self.cit, self.dict_of_ids, self.ref, ext_links, self.conv_threshold, self.check_point, 0.1, 0.1)[0]
+        self.assertEqual([round(weight, 4) for weight in expected], [round(weight, 4) for weight in weights])
+
+    def test_warm_start(self):
+        """bibrank citerank indexer - pagerank starting from previous weights"""
+        len_ = len(self.dict_of_ids)
+        weights, statistics = bibrank_citerank_indexer.compute_pagerank(self.cit, self.dict_of_ids, len_, self.ref, self.damping_factor, self.conv_threshold, self.check_point)
+        previous_weights = dict([(recid, weights[idx]) for recid, idx in self.dict_of_ids.items()])
+        start_weights = bibrank_citerank_indexer.get_start_weights(len_, self.dict_of_ids, previous_weights)
+        self.assertAlmostEqual(start_weights.sum(), len_)
+        warm_weights, warm_statistics = bibrank_citerank_indexer.compute_pagerank(self.cit, self.dict_of_ids, len_, self.ref, self.damping_factor, self.conv_threshold, self.check_point, start_weights=start_weights)
+        self.failUnless(warm_statistics['steps'] < statistics['steps'])
+        self.assertEqual([round(weight, 3) for weight in weights], [round(weight, 3) for weight in warm_weights])
+
 TEST_SUITE = make_test_suite(TestCiterankIndexer,)
 
 if __name__ == "__main__":
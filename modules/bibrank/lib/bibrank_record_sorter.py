@@ -39,7 +39,9 @@ from invenio.bibindex_engine_stemmer import stem
 from invenio.bibindex_engine_stopwords import is_stopword
 from invenio.bibrank_citation_searcher import get_cited_by, get_cited_by_weight
 from invenio.intbitset import intbitset
-from invenio.bibrank_word_searcher import find_similar
+from invenio.bibrank_word_searcher import find_similar, sort_ranked_records
+from invenio.bibrank_score_vector import create_score_vector, \
+     get_score_vector_filename, read_score_vector_file, write_score_vector_file
 # Do not remove these lines, it is necessary for func_object = globals().get(function)
 from invenio.bibrank_word_searcher import word_similarity
 from invenio.solrutils_bibrank_searcher import word_similarity_solr
@@ -208,12 +210,15 @@ def get_bibrank_methods(colID, ln=CFG_SITE_LANG):
                 avail_methods.append((rank_method_code, rank_method_code))
     return avail_methods
 
-def rank_records(rank_method_code, rank_limit_relevance, hitset_global, pattern=[], verbose=0, field='', rg=None, jrec=None):
+def rank_records(rank_method_code, rank_limit_relevance, hitset_global, pattern=[], verbose=0, field='', rg=None, jrec=None, ranked_result_amount=None):
     """rank_method_code, e.g. `jif' or `sbr' (word frequency vector model)
        rank_limit_relevance, e.g. `23' for `nbc' (number of citations) or `0.10' for `vec'
        hitset, search engine hits;
        pattern, search engine query or record ID (you check the type)
        verbose, verbose level
+       ranked_result_amount, if given, only this number of best records is
+       sorted, e.g. the records of the displayed page; the other ones come
+       unsorted before them (the best records being at the end of the list)
        output:
        list of records
        list of rank values
@@ -248,11 +253,11 @@ def rank_records(rank_method_code, rank_limit_relevance, hitset_global, pattern=
             p = ""
             if pattern and pattern[0]:
                 p = pattern[0][6:]
-            result = find_citations(rank_method_code, p, hitset, verbose)
+            result = find_citations(rank_method_code, p, hitset, verbose, ranked_result_amount)
 
         elif func_object:
             if function == "word_similarity":
-                result = func_object(rank_method_code, pattern, hitset, rank_limit_relevance, verbose, methods)
+                result = func_object(rank_method_code, pattern, hitset, rank_limit_relevance, verbose, methods, ranked_result_amount)
             elif function in ("word_similarity_solr", "word_similarity_xapian"):
                 if not rg:
                     rg = CFG_WEBSEARCH_DEF_RECORDS_IN_GROUPS
@@ -276,7 +281,7 @@ def rank_records(rank_method_code, rank_limit_relevance, hitset_global, pattern=
             else:
                 result = func_object(rank_method_code, pattern, hitset, rank_limit_relevance, verbose)
         else:
-            result = rank_by_method(rank_method_code, pattern, hitset, rank_limit_relevance, verbose)
+            result = rank_by_method(rank_method_code, pattern, hitset, rank_limit_relevance, verbose, ranked_result_amount)
     except Exception, e:
         register_exception()
         result = (None, "", adderrorbox("An error occured when trying to rank the search result "+rank_method_code, ["Unexpected error: %s<br />" % (e,)]), voutput)
@@ -328,7 +333,37 @@ def combine_method(rank_method_code, pattern, hitset, rank_limit_relevance,verbo
     except Exception, e:
         return (None, "Warning: %s method cannot be used for ranking your query." % rank_method_code, "", voutput)
 
-def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbose):
+SCORE_VECTORS_CACHE = {} # rank_method_code -> (version, ScoreVector)
+
+def load_score_vector(rank_method_code):
+    """Return ScoreVector of the scores of rank method RANK_METHOD_CODE,
+    or None if its scores are not numbers.  The vector is kept in
+    memory as long as the rank method data do not change; it is read
+    from its file, that is shared by all the processes, if the file is
+    up-to-date, or else built from rnkMETHODDATA and saved."""
+    res = run_sql("""SELECT DATE_FORMAT(d.last_updated, '%%Y-%%m-%%d %%H:%%i:%%s'), m.id
+                     FROM rnkMETHODDATA AS d, rnkMETHOD AS m
+                     WHERE m.id=d.id_rnkMETHOD AND m.name=%s""", (rank_method_code,))
+    if not res:
+        return None
+    version = res[0][0]
+    cached = SCORE_VECTORS_CACHE.get(rank_method_code)
+    if cached and cached[0] == version:
+        return cached[1]
+    filename = get_score_vector_filename(rank_method_code)
+    file_version, vector = read_score_vector_file(filename)
+    if vector is None or file_version != version:
+        rnkdict = run_sql("SELECT relevance_data FROM rnkMETHODDATA WHERE id_rnkMETHOD=%s", (res[0][1],))
+        vector = create_score_vector(deserialize_via_marshal(rnkdict[0][0]))
+        if vector is not None:
+            try:
+                write_score_vector_file(vector, filename, version)
+            except (IOError, OSError):
+                register_exception(prefix="Cannot write score vector file %s" % filename)
+    SCORE_VECTORS_CACHE[rank_method_code] = (version, vector)
+    return vector
+
+def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbose, ranked_result_amount=None):
     """Ranking of records based on predetermined values.
     input:
     rank_method_code - the code of the method, from the name field in rnkMETHOD, used to get predetermined values from
@@ -337,6 +372,7 @@ def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbos
     hitset - a list of hits for the query found by search_engine
     rank_limit_relevance - show only records with a rank value above this
     verbose - verbose value
+    ranked_result_amount - number of best records to sort, None for all
     output:
     reclist - a list of sorted records, with unsorted added to the end: [[23,34], [344,24], [1,01]]
     prefix - what to show before the rank value
@@ -345,10 +381,12 @@ def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbos
 
     global voutput
     voutput = ""
-    rnkdict = run_sql("SELECT relevance_data FROM rnkMETHODDATA,rnkMETHOD where rnkMETHOD.id=id_rnkMETHOD and rnkMETHOD.name=%s", (rank_method_code,))
+    rnkvector = load_score_vector(rank_method_code)
+    if rnkvector is None:
+        rnkdict = run_sql("SELECT relevance_data FROM rnkMETHODDATA,rnkMETHOD where rnkMETHOD.id=id_rnkMETHOD and rnkMETHOD.name=%s", (rank_method_code,))
 
-    if not rnkdict:
-        return (None, "Warning: Could not load ranking data for method %s." % rank_method_code, "", voutput)
+        if not rnkdict:
+            return (None, "Warning: Could not load ranking data for method %s." % rank_method_code, "", voutput)
 
     max_recid = 0
     res = run_sql("SELECT max(id) FROM bibrec")
@@ -372,6 +410,22 @@ def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbos
             else:
                 return (None, "Warning: Given record IDs are out of range.", "", voutput)
 
+    if rnkvector is not None:
+        if verbose > 0:
+            voutput += "<br />Running rank method: %s, using rank_by_method function in bibrank_record_sorter<br />" % rank_method_code
+            voutput += "Ranking data loaded, size of score vector: %s<br />" % len(rnkvector)
+        if lwords_hitset:
+            hitset = hitset & lwords_hitset
+        if verbose > 0:
+            voutput += "Number of records to rank: %s<br />" % len(hitset)
+        reclist, reclist_addend = rnkvector.get_scores(hitset.tolist())
+        reclist_addend = [(recID, 0) for recID in reclist_addend]
+        if verbose > 0:
+            voutput += "Number of records ranked: %s<br />" % len(reclist)
+            voutput += "Number of records not ranked: %s<br />" % len(reclist_addend)
+        reclist = sort_ranked_records(reclist, ranked_result_amount)
+        return (reclist_addend + reclist, methods[rank_method_code]["prefix"], methods[rank_method_code]["postfix"], voutput)
+
     rnkdict = deserialize_via_marshal(rnkdict[0][0])
     if verbose > 0:
         voutput += "<br />Running rank method: %s, using rank_by_method function in bibrank_record_sorter<br />" % rank_method_code
@@ -402,11 +456,13 @@ def rank_by_method(rank_method_code, lwords, hitset, rank_limit_relevance,verbos
         voutput += "Number of records ranked: %s<br />" % len(reclist)
         voutput += "Number of records not ranked: %s<br />" % len(reclist_addend)
 
-    reclist.sort(lambda x, y: cmp(x[1], y[1]))
+    reclist = sort_ranked_records(reclist, ranked_result_amount)
     return (reclist_addend + reclist, methods[rank_method_code]["prefix"], methods[rank_method_code]["postfix"], voutput)
 
-def find_citations(rank_method_code, recID, hitset, verbose):
-    """Rank by the amount of citations."""
+def find_citations(rank_method_code, recID, hitset, verbose, ranked_result_amount=None):
+    """Rank by the amount of citations.  If RANKED_RESULT_AMOUNT is
+    given, only the records having this number of best citation counts
+    are sorted."""
     #calculate the cited-by values for all the members of the hitset
     #returns: ((recordid,weight),prefix,postfix,message)
 
@@ -429,7 +485,7 @@ def find_citations(rank_method_code, recID, hitset, verbose):
         ret = get_cited_by_weight(myrecords)
     else:
         ret = get_cited_by_weight(hitset)
-    ret.sort(lambda x,y:cmp(x[1],y[1]))      #ascending by the second member of the tuples
+    ret = sort_ranked_records(ret, ranked_result_amount) #ascending by the second member of the tuples
 
     if verbose > 0:
         voutput = voutput+"\nrecID "+str(recID)+" is int: "+str(recisint)+" hitset "+str(hitset)+"\n"+"find_citations retlist "+str(ret)
@@ -47,6 +47,15 @@ class TestListSetOperations(unittest.TestCase):
         self.assertEqual(({1: 7, 2: 7, 5: 5}, {1: 1, 2: 1, 5: 1}),  bibrank_word_searcher.calculate_record_relevance(("testterm", 2.0),
 {"Gi":(0, 50.0), 1: (3, 4.0), 2: (4, 5.0), 5: (1, 3.5)}, hitset, {}, {}, 0, None))
 
+    def test_sort_ranked_records(self):
+        """bibrank record sorter - sorting only the best records"""
+        reclist = [(1, 5), (2, 1), (3, 9), (4, 5), (5, 0), (6, 7), (7, 5)]
+        self.assertEqual(bibrank_word_searcher.sort_ranked_records(list(reclist)),
+                         [(5, 0), (2, 1), (1, 5), (4, 5), (7, 5), (6, 7), (3, 9)])
+        # the 3 best records come last, as with the full sort:
+        self.assertEqual(bibrank_word_searcher.sort_ranked_records(list(reclist), 3),
+                         [(1, 5), (2, 1), (4, 5), (5, 0), (7, 5), (6, 7), (3, 9)])
+
 TEST_SUITE = make_test_suite(TestListSetOperations,)
 
 if __name__ == "__main__":
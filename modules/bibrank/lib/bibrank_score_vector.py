@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Dense rank method score vectors.
+
+Stores the {recid: score} dictionary of a rank method (as kept in
+rnkMETHODDATA) as one array indexed by recid, so that the scores of a
+hitset can be gathered without deserializing the whole dictionary.
+The vector can be saved to a binary file, stamped with the version of
+the rank method data, that is memory-mapped when NumPy is available,
+so that all the processes of a machine share the same pages.
+"""
+
+__revision__ = "$Id$"
+
+import os
+import struct
+import tempfile
+from array import array
+
+try:
+    ## import optional module:
+    import numpy
+    CFG_NUMPY_IMPORTABLE = True
+except ImportError:
+    CFG_NUMPY_IMPORTABLE = False
+
+from invenio.config import CFG_CACHEDIR
+from invenio.errorlib import register_exception
+
+# array type code of 32-bit integers:
+CFG_INT32_TYPECODE = [typecode for typecode in 'ilh'
+                      if array(typecode).itemsize == 4][0]
+
+# integer scores are stored as 32-bit integers, the other ones as
+# doubles, so that the scores displayed next to the records are the
+# same as the ones of the dictionary.  Records without score are
+# marked by the smallest integer, respectively by NaN.
+CFG_SCORE_VECTOR_INT_MISSING = -2147483648
+CFG_SCORE_VECTOR_FLOAT_MISSING = struct.unpack('<d', '\x00\x00\x00\x00\x00\x00\xf8\x7f')[0]
+
+# file header: magic, version, kind of scores ('i' or 'd'), number of scores
+CFG_SCORE_VECTOR_FILE_MAGIC = 'INVRNK01'
+CFG_SCORE_VECTOR_FILE_HEADER = '=8s20sci'
+CFG_SCORE_VECTOR_FILE_HEADER_SIZE = struct.calcsize(CFG_SCORE_VECTOR_FILE_HEADER)
+
+class ScoreVector:
+    """
+    Scores of the records of a rank method, as an array indexed by
+    recid, where the records without score hold a missing value
+    marker.
+    """
+
+    def __init__(self, scores=None, kind='i'):
+        """Initialise.
+        @param scores: array of the scores, indexed by recid
+        @param kind: 'i' for integer scores, 'd' for float ones
+        """
+        if scores is None:
+            scores = array(kind == 'i' and CFG_INT32_TYPECODE or 'd')
+        self.scores = scores
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.scores)
+
+    def get(self, recid, default=None):
+        """Return score of RECID, or DEFAULT if it has none."""
+        if 0 <= recid < len(self.scores):
+            score = self.scores[recid]
+            if self.kind == 'i':
+                if score != CFG_SCORE_VECTOR_INT_MISSING:
+                    return int(score)
+            elif score == score: # i.e. is not NaN
+                return float(score)
+        return default
+
+    def get_scores(self, recids):
+        """Return tuple (ranked, unranked) where RANKED is the list
+        of (recid, score) of the records of RECIDS that have a score,
+        and UNRANKED the list of the other ones, both in the order of
+        RECIDS."""
+        if CFG_NUMPY_IMPORTABLE and isinstance(self.scores, numpy.ndarray):
+            recids = numpy.array(recids, dtype=numpy.int32)
+            ranked_p = recids < len(self.scores)
+            scores = self.scores[recids[ranked_p]]
+            if self.kind == 'i':
+                selected = scores != CFG_SCORE_VECTOR_INT_MISSING
+            else:
+                selected = ~numpy.isnan(scores)
+            ranked_p[ranked_p] = selected
+            return (zip(recids[ranked_p].tolist(), scores[selected].tolist()),
+                    recids[~ranked_p].tolist())
+        ranked = []
+        unranked = []
+        for recid in recids:
+            score = self.get(recid)
+            if score is None:
+                unranked.append(recid)
+            else:
+                ranked.append((recid, score))
+        return (ranked, unranked)
+
+def create_score_vector(dic):
+    """Return ScoreVector of the scores dictionary DIC, that is
+    {recid -> score}, or None if some scores are not numbers."""
+    kind = 'i'
+    for score in dic.itervalues():
+        if isinstance(score, bool) or not isinstance(score, (int, long, float)):
+            return None
+        if kind == 'i' and (isinstance(score, float) or \
+               not CFG_SCORE_VECTOR_INT_MISSING < score < 2147483648):
+            kind = 'd'
+    if kind == 'i':
+        scores = array(CFG_INT32_TYPECODE)
+        missing = CFG_SCORE_VECTOR_INT_MISSING
+    else:
+        scores = array('d')
+        missing = CFG_SCORE_VECTOR_FLOAT_MISSING
+    if dic:
+        scores.extend([missing] * (max(dic.keys()) + 1))
+        for recid, score in dic.iteritems():
+            if recid >= 0:
+                scores[recid] = score
+    return ScoreVector(scores, kind)
+
+def get_score_vector_filename(rank_method_code):
+    """Return the name of the file holding the score vector of rank
+    method RANK_METHOD_CODE."""
+    return os.path.join(CFG_CACHEDIR, 'rnkMETHODDATA', '%s.scores' % rank_method_code)
+
+def write_score_vector_file(vector, filename, version):
+    """Save score VECTOR into FILENAME along with VERSION.  The file
+    is written under a temporary name and then renamed, so that the
+    processes reading the old file are not disturbed."""
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmpname = tempfile.mkstemp(prefix='.' + os.path.basename(filename), dir=dirname)
+    tmpfile = os.fdopen(fd, 'wb')
+    try:
+        tmpfile.write(struct.pack(CFG_SCORE_VECTOR_FILE_HEADER,
+                                  CFG_SCORE_VECTOR_FILE_MAGIC, version,
+                                  vector.kind, len(vector.scores)))
+        vector.scores.tofile(tmpfile)
+        tmpfile.close()
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, filename)
+    except:
+        tmpfile.close()
+        os.remove(tmpname)
+        raise
+
+def read_score_vector_file(filename):
+    """Return tuple (version, vector) of the ScoreVector saved in
+    FILENAME, or (None, None) if the file does not exist or is not
+    valid.  The scores are memory-mapped if NumPy is available."""
+    try:
+        vector_file = open(filename, 'rb')
+    except IOError:
+        return (None, None)
+    try:
+        header = vector_file.read(CFG_SCORE_VECTOR_FILE_HEADER_SIZE)
+        if len(header) != CFG_SCORE_VECTOR_FILE_HEADER_SIZE:
+            return (None, None)
+        magic, version, kind, nb_scores = \
+               struct.unpack(CFG_SCORE_VECTOR_FILE_HEADER, header)
+        if magic != CFG_SCORE_VECTOR_FILE_MAGIC or kind not in ('i', 'd'):
+            return (None, None)
+        if kind == 'i':
+            typecode, itemsize = CFG_INT32_TYPECODE, 4
+        else:
+            typecode, itemsize = 'd', 8
+        if os.path.getsize(filename) != CFG_SCORE_VECTOR_FILE_HEADER_SIZE + \
+               itemsize * nb_scores:
+            return (None, None)
+        version = version.rstrip('\0')
+        if CFG_NUMPY_IMPORTABLE:
+            if nb_scores:
+                scores = numpy.memmap(filename, mode='r',
+                                      dtype=kind == 'i' and numpy.int32 or numpy.float64,
+                                      offset=CFG_SCORE_VECTOR_FILE_HEADER_SIZE,
+                                      shape=(nb_scores,))
+            else:
+                scores = numpy.zeros(0, dtype=kind == 'i' and numpy.int32 or numpy.float64)
+        else:
+            scores = array(typecode)
+            scores.fromfile(vector_file, nb_scores)
+        return (version, ScoreVector(scores, kind))
+    finally:
+        vector_file.close()
+
+def export_score_vector(rank_method_code, dic, version):
+    """Save the scores dictionary DIC of rank method RANK_METHOD_CODE,
+    stored in rnkMETHODDATA at time VERSION, into its score vector
+    file, so that the search processes do not have to deserialize
+    it.  Nothing is saved if the scores are not numbers."""
+    vector = create_score_vector(dic)
+    if vector is None:
+        return
+    filename = get_score_vector_filename(rank_method_code)
+    try:
+        write_score_vector_file(vector, filename, version)
+    except (IOError, OSError):
+        register_exception(prefix="Cannot write score vector file %s" % filename)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the rank method score vectors."""
+
+__revision__ = "$Id$"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from invenio.bibrank_score_vector import create_score_vector, \
+     read_score_vector_file, write_score_vector_file
+from invenio.testutils import make_test_suite, run_test_suite
+
+INT_SCORES = {1: 10, 3: 0, 4: 7, 8: 2}
+FLOAT_SCORES = {2: 0.5, 5: 1.25, 6: 3}
+
+class TestScoreVector(unittest.TestCase):
+    """Test of the score vectors."""
+
+    def test_int_scores(self):
+        """bibrank score vector - integer scores"""
+        vector = create_score_vector(INT_SCORES)
+        self.assertEqual(vector.kind, 'i')
+        self.assertEqual(len(vector), 9)
+        self.assertEqual(vector.get(3), 0)
+        self.assertEqual(vector.get(2), None)
+        self.assertEqual(vector.get(100, -1), -1)
+        self.assertEqual(vector.get_scores([1, 2, 3, 8, 100]),
+                         ([(1, 10), (3, 0), (8, 2)], [2, 100]))
+
+    def test_float_scores(self):
+        """bibrank score vector - float scores"""
+        vector = create_score_vector(FLOAT_SCORES)
+        self.assertEqual(vector.kind, 'd')
+        self.assertEqual(vector.get(5), 1.25)
+        self.assertEqual(vector.get(6), 3.0)
+        self.assertEqual(vector.get(1), None)
+        self.assertEqual(vector.get_scores([1, 2, 6]),
+                         ([(2, 0.5), (6, 3.0)], [1]))
+        self.assertEqual(create_score_vector({1: 2 ** 40}).kind, 'd')
+
+    def test_non_numeric_scores(self):
+        """bibrank score vector - scores that are not numbers"""
+        self.assertEqual(create_score_vector({1: 'a'}), None)
+        self.assertEqual(create_score_vector({1: [1, 2]}), None)
+
+    def test_file(self):
+        """bibrank score vector - saving to file and reading back"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'rnkMETHODDATA', 'demo.scores')
+            self.assertEqual(read_score_vector_file(filename), (None, None))
+            for scores in (INT_SCORES, FLOAT_SCORES, {}):
+                vector = create_score_vector(scores)
+                write_score_vector_file(vector, filename, '2013-07-22 10:00:00')
+                version, vector = read_score_vector_file(filename)
+                self.assertEqual(version, '2013-07-22 10:00:00')
+                ranked, unranked = vector.get_scores(range(10))
+                self.assertEqual(dict(ranked), scores)
+                self.assertEqual(len(ranked) + len(unranked), 10)
+        finally:
+            shutil.rmtree(tmpdir)
+
+TEST_SUITE = make_test_suite(TestScoreVector,)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
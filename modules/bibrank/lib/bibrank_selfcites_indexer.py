@@ -165,6 +165,151 @@ def compute_self_citations(recid, tags, authors_fun):
     return self_citations
 
 
+def run_sql_for_records(query, recids, params=(), chunk_size=1000):
+    """Run QUERY, where `%s' stands for the list of record IDs and
+    `%%s' for the other PARAMS, on RECIDS, by chunks of CHUNK_SIZE
+    records, and return all the rows"""
+    recids = list(recids)
+    rows = []
+    for start in xrange(0, len(recids), chunk_size):
+        chunk = recids[start:start + chunk_size]
+        in_sql = ','.join('%s' for dummy in chunk)
+        rows.extend(run_sql(query % in_sql, tuple(chunk) + tuple(params)))
+    return rows
+
+
+def get_fieldvalues_for_records(recids, tag):
+    """Get the values of TAG for many records at once
+
+    Returns a dictionary recid -> list of values, each list being in the
+    order get_fieldvalues() would return it
+    """
+    try:
+        digits = int(tag[0:2])
+    except ValueError:
+        return {}
+    bx = "bib%02dx" % digits
+    bibx = "bibrec_bib%02dx" % digits
+    query = "SELECT bibx.id_bibrec, bx.value FROM " + bx + " AS bx, " + \
+            bibx + " AS bibx WHERE bibx.id_bibrec IN (%s)" \
+            " AND bx.id=bibx.id_bibxxx AND bx.tag LIKE %%s" \
+            " ORDER BY bibx.id_bibrec, bibx.field_number, bx.tag"
+    values = {}
+    for recid, value in run_sql_for_records(query, recids, (tag, )):
+        values.setdefault(recid, []).append(value)
+    return values
+
+
+def get_authors_from_records(recids, tags,
+                             use_bibauthorid=CFG_BIBRANK_SELFCITES_USE_BIBAUTHORID):
+    """Get all authors for many records at once
+
+    Returns a dictionary recid -> set of authors, the same as
+    get_authors_from_record() for each record
+    """
+    authors = {}
+    if use_bibauthorid:
+        personids = {}
+        for recid, personid in run_sql_for_records("""
+                SELECT DISTINCT bibrec, personid FROM aidPERSONIDPAPERS
+                WHERE bibrec IN (%s) AND flag > -2""", recids):
+            personids.setdefault(recid, []).append(personid)
+        for recid in recids:
+            ids = personids.get(recid, ())
+            if 0 < len(ids) <= 20:
+                authors[recid] = set(ids)
+            else:
+                authors[recid] = set()
+    else:
+        first_authors = get_fieldvalues_for_records(recids,
+                                                    tags['first_author'])
+        additional_authors = get_fieldvalues_for_records(recids,
+                                                tags['additional_author'])
+        alternative_authors = get_fieldvalues_for_records(recids,
+                                          tags['alternative_author_name'])
+        for recid in recids:
+            authors_list = first_authors.get(recid, []) + \
+                           additional_authors.get(recid, []) + \
+                           alternative_authors.get(recid, [])
+            authors[recid] = set(hash(author) for author in authors_list[:20])
+    return authors
+
+
+def get_collaborations_from_records(recids, tags):
+    """Get all collaborations for many records at once
+
+    Returns a dictionary recid -> list of collaborations
+    """
+    return get_fieldvalues_for_records(recids, tags['collaboration_name'])
+
+
+def get_records_coauthors(recids):
+    """Get the co-authors of many records at once
+
+    Returns a dictionary recid -> list of authors, the same as
+    get_record_coauthors() for each record
+    """
+    coauthors = {}
+    for recid, authorid in run_sql_for_records("""
+            SELECT id, authorid FROM rnkEXTENDEDAUTHORS
+            WHERE id IN (%s)""", recids):
+        coauthors.setdefault(recid, []).append(authorid)
+    return coauthors
+
+
+def compute_self_citations_for_records(recids, tags, algorithm='simple'):
+    """Compute the self-citations of many records at once
+
+    Gives the same result as the given algorithm of ALL_ALGORITHMS run
+    on each record, but the authors, collaborations and co-authors of
+    the records and of their citers are fetched in a few queries.
+    Returns a dictionary recid -> set of self-citations
+    """
+    citers = {}
+    concerned_recids = set(recids)
+    for recid in recids:
+        citers[recid] = get_cited_by(recid)
+        concerned_recids.update(citers[recid])
+    concerned_recids = sorted(concerned_recids)
+    authors = get_authors_from_records(concerned_recids, tags)
+    collaborations = get_collaborations_from_records(concerned_recids, tags)
+    if algorithm == 'friends':
+        coauthors = get_records_coauthors(concerned_recids)
+        def get_coauthors(recid):
+            return set(coauthors.get(recid, ())) | authors[recid]
+    else:
+        def get_coauthors(recid):
+            return authors[recid]
+
+    results = {}
+    for recid in recids:
+        self_citations = set()
+        results[recid] = self_citations
+        if not citers[recid]:
+            continue
+        record_authors = frozenset(authors[recid])
+        record_collaborations = None
+        if not record_authors or len(record_authors) > 20:
+            record_collaborations = frozenset(collaborations.get(recid, ()))
+        if record_collaborations:
+            # Use collaborations names
+            for cit in citers[recid]:
+                if record_collaborations.intersection(
+                                               collaborations.get(cit, ())):
+                    self_citations.add(cit)
+        else:
+            # Use authors names
+            for cit in citers[recid]:
+                if (not record_authors or len(authors[cit]) > 20) and \
+                    collaborations.get(cit):
+                    # Record from a collaboration that cites
+                    # a record from an author, it's fine
+                    pass
+                elif record_authors.intersection(get_coauthors(cit)):
+                    self_citations.add(cit)
+    return results
+
+
 def fetch_references(recid):
     """Fetch the references stored in the self-citations table for given record
 
@@ -251,9 +396,13 @@ def get_self_citations_count(recids, algorithm='simple',
     return total_cites
 
 
-def update_self_cites_tables(recid, config, tags):
-    """For a given record update all self-cites table if needed"""
-    authors = get_authors_from_record(recid, tags)
+def update_self_cites_tables(recid, config, tags, authors=None):
+    """For a given record update all self-cites table if needed
+
+    AUTHORS, the authors of the record, are fetched if not given
+    """
+    if authors is None:
+        authors = get_authors_from_record(recid, tags)
 
     if 0 < len(authors) <= 20:
         # Updated reords cache table
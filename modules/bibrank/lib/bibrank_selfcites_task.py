@@ -24,6 +24,7 @@ Stores self-citations in a table for quick access
 """
 
 import sys
+import time
 import ConfigParser
 from datetime import datetime
 
@@ -32,13 +33,17 @@ from invenio.config import CFG_BIBRANK_SELFCITES_USE_BIBAUTHORID, \
 from invenio.bibtask import task_set_option, \
                             task_get_option, write_message, \
                             task_sleep_now_if_required, \
-                            task_update_progress
-from invenio.dbquery import run_sql
+                            task_update_progress, \
+                            task_run_in_workers
+from invenio.dbquery import run_sql, run_sql_many
 from invenio.shellutils import split_cli_ids_arg
 from invenio.bibrank_selfcites_indexer import update_self_cites_tables, \
                                               compute_friends_self_citations, \
                                               compute_simple_self_citations, \
-                                              get_authors_tags
+                                              compute_self_citations_for_records, \
+                                              get_authors_from_records, \
+                                              get_authors_tags, \
+                                              run_sql_for_records
 from invenio.bibrank_citation_searcher import get_refers_to
 from invenio.bibauthorid_daemon import get_user_log as bibauthorid_user_log
 from invenio.bibrank_citation_indexer import get_bibrankmethod_lastupdate
@@ -159,12 +164,98 @@ def compute_and_store_self_citations(recid, tags, citations_fun,
             write_message("%s found" % len(cites))
 
 
+def compute_and_store_self_citations_for_records(recids, tags, algorithm):
+    """Compute and store self-cites in a table for many records at once
+
+    Same as compute_and_store_self_citations() on each record, but the
+    data needed are fetched and the results stored in a few queries.
+    Returns the number of records whose self-cites were computed.
+    """
+    references = {}
+    recids_to_check = set(recids)
+    for recid in recids:
+        references[recid] = get_refers_to(recid)
+        recids_to_check.update(references[recid])
+
+    modification_dates = dict(run_sql_for_records("SELECT `id`,"
+                    " `modification_date` FROM `bibrec` WHERE `id` IN (%s)",
+                    recids_to_check))
+    cached_citations = {}
+    for recid, count, last_updated in run_sql_for_records("SELECT"
+                    " `id_bibrec`, `count`, `last_updated` FROM `rnkSELFCITES`"
+                    " WHERE `id_bibrec` IN (%s)", recids):
+        cached_citations[recid] = (count, last_updated)
+
+    recids_to_compute = []
+    for recid in recids:
+        rec_timestamp = max([modification_dates.get(r)
+                            for r in [recid] + list(references[recid])])
+        cached = cached_citations.get(recid)
+        if not cached or not cached[0] or rec_timestamp is None \
+                or cached[1] < rec_timestamp:
+            recids_to_compute.append(recid)
+
+    self_citations = compute_self_citations_for_records(recids_to_compute,
+                                                        tags, algorithm)
+    sql = """REPLACE INTO rnkSELFCITES (`id_bibrec`, `count`, `references`,
+             `last_updated`) VALUES (%s, %s, %s, NOW())"""
+    run_sql_many(sql, [(recid, len(self_citations[recid]),
+                        ','.join(str(r) for r in references[recid]))
+                       for recid in recids_to_compute])
+    return len(recids_to_compute)
+
+
+def process_records(recids, tags, config):
+    """Compute and store the self-cites of RECIDS
+
+    The records are processed by chunks, in several worker processes if
+    the configuration says so, and the throughput is reported.
+    """
+    chunk_size = config.get('chunk_size', 1000)
+    workers = config.get('workers', 1)
+    chunks = [recids[start:start + chunk_size]
+              for start in xrange(0, len(recids), chunk_size)]
+    start_time = time.time()
+
+    def process_chunk(chunk):
+        task_sleep_now_if_required(can_stop_too=True)
+        nb_computed = compute_and_store_self_citations_for_records(chunk,
+                                                tags, config['algorithm'])
+        write_message("self-cites computed for %s records (%s to %s), "
+                      "%s up-to-date" % (nb_computed, chunk[0], chunk[-1],
+                                         len(chunk) - nb_computed))
+
+    if workers > 1 and len(chunks) > 1:
+        jobs = []
+        for chunk in chunks:
+            def job(chunk=chunk):
+                process_chunk(chunk)
+            jobs.append(job)
+        write_message("Processing %s chunks of records in %s worker "
+                      "processes" % (len(chunks), workers))
+        results = task_run_in_workers(jobs, workers)
+        if False in results:
+            write_message("Failed to process %s chunks of records"
+                          % results.count(False), sys.stderr)
+        success = False not in results
+    else:
+        for index, chunk in enumerate(chunks):
+            task_update_progress("self-cites %d/%d"
+                                 % (index * chunk_size, len(recids)))
+            process_chunk(chunk)
+        success = True
+
+    duration = time.time() - start_time
+    write_message("Processed %d records in %.1f s (%.1f records/s)"
+                  % (len(recids), duration, len(recids) / max(duration, 0.001)))
+    return success
+
+
 def rebuild_tables(config):
     task_update_progress('emptying tables')
     empty_self_cites_tables()
     task_update_progress('filling tables')
-    fill_self_cites_tables(config)
-    return True
+    return fill_self_cites_tables(config)
 
 
 def fetch_bibauthorid_last_update():
@@ -228,13 +319,19 @@ def process_updates(rank_method_code):
     """
     This is what gets executed first when the task is started.
     It handles the --rebuild option. If that option is not specified
-    we fall back to the process_one()
+    we fall back to process_records()
     """
     selfcites_config = read_configuration(rank_method_code)
     config = {
         'algorithm': selfcites_config.get(rank_method_code, "algorithm"),
-        'friends_threshold': selfcites_config.get(rank_method_code, "friends_threshold")
+        'friends_threshold': selfcites_config.get(rank_method_code, "friends_threshold"),
+        'workers': 1,
+        'chunk_size': 1000,
     }
+    for option in ('workers', 'chunk_size'):
+        if selfcites_config.has_option(rank_method_code, option):
+            config[option] = max(1, selfcites_config.getint(rank_method_code,
+                                                            option))
     begin_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     quick = task_get_option("quick") != "no"
     if not quick:
@@ -244,18 +341,17 @@ def process_updates(rank_method_code):
 
     tags = get_authors_tags()
     recids = fetch_concerned_records(rank_method_code)
-    citations_fun = get_citations_fun(config['algorithm'])
 
     write_message("recids %s" % str(recids))
 
-    total = len(recids)
-    for count, recid in enumerate(recids):
-        task_sleep_now_if_required(can_stop_too=True)
-        msg = "Extracting for %s (%d/%d)" % (recid, count + 1, total)
-        task_update_progress(msg)
-        write_message(msg)
+    # Update the records then all their references
+    recids_to_process = set()
+    for recid in recids:
+        recids_to_process.add(recid)
+        recids_to_process.update(get_refers_to(recid))
 
-        process_one(recid, tags, citations_fun)
+    if not process_records(sorted(recids_to_process), tags, config):
+        return False
 
     store_last_updated(rank_method_code, begin_date)
 
@@ -303,23 +399,19 @@ def fill_self_cites_tables(config):
     algorithm = config['algorithm']
     tags = get_authors_tags()
     all_ids = [r[0] for r in run_sql('SELECT id FROM bibrec ORDER BY id')]
-    citations_fun = get_citations_fun(algorithm)
-    write_message('using %s' % citations_fun.__name__)
+    write_message('using %s algorithm' % algorithm)
     if algorithm == 'friends':
         # We only needs this table for the friends algorithm or assimilated
         # Fill intermediary tables
-        for index, recid in enumerate(all_ids):
-            if index % 1000 == 0:
-                msg = 'intermediate %d/%d' % (index, len(all_ids))
-                task_update_progress(msg)
-                write_message(msg)
-                task_sleep_now_if_required()
-            update_self_cites_tables(recid, config, tags)
-    # Fill self-cites table
-    for index, recid in enumerate(all_ids):
-        if index % 1000 == 0:
-            msg = 'final %d/%d' % (index, len(all_ids))
+        for index in xrange(0, len(all_ids), 1000):
+            msg = 'intermediate %d/%d' % (index, len(all_ids))
             task_update_progress(msg)
             write_message(msg)
             task_sleep_now_if_required()
-        compute_and_store_self_citations(recid, tags, citations_fun)
+            chunk = all_ids[index:index + 1000]
+            authors = get_authors_from_records(chunk, tags)
+            for recid in chunk:
+                update_self_cites_tables(recid, config, tags, authors[recid])
+    # Fill self-cites table
+    write_message('final')
+    return process_records(all_ids, tags, config)
@@ -160,6 +160,24 @@ class SelfCitesOtherTests(unittest.TestCase):
             total_citations = compute_self_citations(1, tags, get_record_coauthors_mock)
             self.assertEqual(total_citations, set([1, 2, 3]))
 
+        @patch('invenio.bibrank_selfcites_indexer.get_collaborations_from_records',
+            lambda recids, dummy_tags: {})
+        @patch('invenio.bibrank_selfcites_indexer.get_authors_from_records',
+            lambda recids, dummy_tags: dict((recid, set(get_personids_from_bibrec_mock(recid))) for recid in recids))
+        @patch('invenio.bibrank_selfcites_indexer.get_cited_by',
+            lambda recid: {1: (2, 3, 4), 2: (3,), 3: (), 4: (5,)}[recid])
+        def test_compute_self_citations_for_records(self):
+            """Check self citations of many records computed at once
+
+            see document graph up in this file
+            """
+            from invenio.bibrank_selfcites_indexer import \
+                compute_self_citations_for_records
+            tags = get_author_tags_mock()
+            self_citations = compute_self_citations_for_records([1, 2, 3, 4], tags)
+            self.assertEqual(self_citations,
+                             {1: set([2]), 2: set([3]), 3: set(), 4: set()})
+
 
 TEST_SUITE = make_test_suite(SelfCitesOtherTests)
 
@@ -38,6 +38,7 @@ from invenio.dbquery import run_sql, serialize_via_marshal, deserialize_via_mars
 from invenio.errorlib import register_exception
 from invenio.bibtask import task_get_option, write_message, task_sleep_now_if_required
 from invenio.bibindex_engine import create_range_list
+from invenio.bibrank_score_vector import export_score_vector
 from invenio.intbitset import intbitset
 
 options = {}
@@ -230,9 +231,11 @@ def intoDB(dict, date, rank_method_code):
     del_rank_method_codeDATA(rank_method_code)
     serdata = serialize_via_marshal(dict);
     midstr = str(mid[0][0]);
-    run_sql("INSERT INTO rnkMETHODDATA(id_rnkMETHOD, relevance_data) VALUES (%s,%s)", (midstr, serdata,))
+    data_date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    run_sql("INSERT INTO rnkMETHODDATA(id_rnkMETHOD, relevance_data, last_updated) VALUES (%s,%s,%s)", (midstr, serdata, data_date))
     if date:
         run_sql("UPDATE rnkMETHOD SET last_updated=%s WHERE name=%s", (date, rank_method_code))
+    export_score_vector(rank_method_code, dict, data_date)
 
 def fromDB(rank_method_code):
     """Get the data for a rank method"""
@@ -20,8 +20,17 @@ import string
 import time
 import math
 import re
+import heapq
+
+try:
+    ## import optional module:
+    import numpy
+    CFG_NUMPY_IMPORTABLE = True
+except ImportError:
+    CFG_NUMPY_IMPORTABLE = False
 
 from invenio.dbquery import run_sql, deserialize_via_marshal
+from invenio.intbitset import intbitset
 from invenio.bibindex_engine_stemmer import stem
 from invenio.bibindex_engine_stopwords import is_stopword
 
@@ -168,7 +177,7 @@ def sort_record_relevance_findsimilar(recdict, rec_termcount, hitset, rank_limit
         voutput += "Sort time: %s<br />" % (str(time.time() - startCreate))
     return (reclist, hitset)
 
-def word_similarity(rank_method_code, lwords, hitset, rank_limit_relevance, verbose, methods):
+def word_similarity(rank_method_code, lwords, hitset, rank_limit_relevance, verbose, methods, ranked_result_amount=None):
     """Ranking a records containing specified words and returns a sorted list.
     input:
     rank_method_code - the code of the method, from the name field in rnkMETHOD
@@ -176,6 +185,8 @@ def word_similarity(rank_method_code, lwords, hitset, rank_limit_relevance, verb
     hitset - a list of hits for the query found by search_engine
     rank_limit_relevance - show only records with a rank value above this
     verbose - verbose value
+    ranked_result_amount - if given, only this number of best records is sorted,
+                           the other ranked records coming unsorted before them
     output:
     reclist - a list of sorted records: [[23,34], [344,24], [1,01]]
     prefix - what to show before the rank value
@@ -202,20 +213,37 @@ def word_similarity(rank_method_code, lwords, hitset, rank_limit_relevance, verb
                 if lwords_old[i] != term: #add if stemmed word is different than original word
                     lwords.append((term, methods[rank_method_code]["rnkWORD_table"]))
 
-    (recdict, rec_termcount, lrecIDs_remove) = ({}, {}, {})
+    if CFG_NUMPY_IMPORTABLE and hitset:
+        #accumulate the relevance into arrays indexed by recid
+        hitset_recids = numpy.array(hitset.tolist(), dtype=numpy.int32)
+        hitset_mask = numpy.zeros(hitset_recids.max() + 1, dtype=numpy.bool_)
+        hitset_mask[hitset_recids] = True
+        recdict = numpy.zeros(len(hitset_mask), dtype=numpy.int64)
+        rec_termcount = numpy.zeros(len(hitset_mask), dtype=numpy.int32)
+    else:
+        (recdict, rec_termcount) = ({}, {})
     #For each term, if accepted, get a list of the records using the term
     #calculate then relevance for each term before sorting the list of records
     for (term, table) in lwords:
         term_recs = run_sql("""SELECT term, hitlist FROM %s WHERE term=%%s""" % methods[rank_method_code]["rnkWORD_table"], (term,))
         if term_recs: #if term exists in database, use for ranking
             term_recs = deserialize_via_marshal(term_recs[0][1])
-            (recdict, rec_termcount) = calculate_record_relevance((term, int(term_recs["Gi"][1])) , term_recs, hitset, recdict, rec_termcount, verbose, quick=None)
+            if isinstance(recdict, dict):
+                (recdict, rec_termcount) = calculate_record_relevance((term, int(term_recs["Gi"][1])) , term_recs, hitset, recdict, rec_termcount, verbose, quick=None)
+            else:
+                calculate_record_relevance_vectors((term, int(term_recs["Gi"][1])), term_recs, hitset_mask, recdict, rec_termcount)
             del term_recs
 
-    if len(recdict) == 0 or (len(lwords) == 1 and lwords[0] == ""):
+    if isinstance(recdict, dict):
+        nb_ranked = len(recdict)
+    else:
+        nb_ranked = int(numpy.count_nonzero(rec_termcount))
+    if nb_ranked == 0 or (len(lwords) == 1 and lwords[0] == ""):
         return (None, "Records not ranked. The query is not detailed enough, or not enough records found, for ranking to be possible.", "", voutput)
-    else: #sort if we got something to sort
-        (reclist, hitset) = sort_record_relevance(recdict, rec_termcount, hitset, rank_limit_relevance, verbose)
+    elif isinstance(recdict, dict): #sort if we got something to sort
+        (reclist, hitset) = sort_record_relevance(recdict, rec_termcount, hitset, rank_limit_relevance, verbose, ranked_result_amount)
+    else:
+        (reclist, hitset) = sort_record_relevance_vectors(recdict, rec_termcount, hitset, rank_limit_relevance, ranked_result_amount)
 
     #Add any documents not ranked to the end of the list
     if hitset:
@@ -269,11 +297,44 @@ def calculate_record_relevance(term, invidx, hitset, recdict, rec_termcount, ver
 
     return (recdict, rec_termcount)
 
-def sort_record_relevance(recdict, rec_termcount, hitset, rank_limit_relevance, verbose):
+def sort_ranked_records(reclist, ranked_result_amount=None):
+    """Sorts the list of ranked records [(recid, value), ...] by ascending value.
+    If RANKED_RESULT_AMOUNT is given, only the records having the best
+    RANKED_RESULT_AMOUNT values are sorted, at the end of the list, exactly
+    as a full sort would place them, the other records coming before them
+    in their original order.  Returns the new list.
+    reclist - [(recid, value), ...] unsorted
+    ranked_result_amount - number of best records to sort, None for all"""
+
+    if not ranked_result_amount or ranked_result_amount >= len(reclist):
+        reclist.sort(lambda x, y: cmp(x[1], y[1]))
+        return reclist
+
+    #value of the worst of the best records, found via a heap
+    threshold = heapq.nlargest(ranked_result_amount, [value for (recid, value) in reclist])[-1]
+    #the sort being stable, the last records having this value come last
+    nb_equal = ranked_result_amount - len([value for (recid, value) in reclist if value > threshold])
+    (others, best) = ([], [])
+    for i in xrange(len(reclist) - 1, -1, -1):
+        value = reclist[i][1]
+        if value > threshold:
+            best.append(reclist[i])
+        elif value == threshold and nb_equal > 0:
+            best.append(reclist[i])
+            nb_equal -= 1
+        else:
+            others.append(reclist[i])
+    others.reverse()
+    best.reverse()
+    best.sort(lambda x, y: cmp(x[1], y[1]))
+    return others + best
+
+def sort_record_relevance(recdict, rec_termcount, hitset, rank_limit_relevance, verbose, ranked_result_amount=None):
     """Sorts the dictionary and returns records with a relevance higher than the given value.
     recdict - {recid: value} unsorted
     rank_limit_relevance - a value > 0 usually
-    verbose - verbose value"""
+    verbose - verbose value
+    ranked_result_amount - number of best records to sort, None for all"""
 
     startCreate = time.time()
     voutput = ""
@@ -290,13 +351,91 @@ def sort_record_relevance(recdict, rec_termcount, hitset, rank_limit_relevance,
             reclist.append((j, w))
 
     #sort scores
-    reclist.sort(lambda x, y: cmp(x[1], y[1]))
+    reclist = sort_ranked_records(reclist, ranked_result_amount)
 
     if verbose > 0:
         voutput += "Number of records sorted: %s<br />" % len(reclist)
         voutput += "Sort time: %s<br />" % (str(time.time() - startCreate))
     return (reclist, hitset)
 
+def calculate_record_relevance_vectors(term, invidx, hitset_mask, scores, termcounts):
+    """Same as calculate_record_relevance() without quick, but using
+    NumPy arrays instead of dictionaries.
+    term - (term, query term factor) the term and its importance in the overall search
+    invidx - {recid: tf, Gi: norm value} The Gi value is used as a idf value
+    hitset_mask - boolean array telling, for each recid, if it may be ranked
+    scores - array of the relevance of each recid, updated in place
+    termcounts - array of the number of terms from the query existing in
+                 each recid, updated in place"""
+
+    (t, qtf) = term
+    if invidx.has_key("Gi"): #Gi = weigth for this term, created by bibrank_word_indexer
+        Gi = invidx["Gi"][1]
+        del invidx["Gi"]
+    else: #if not existing, bibrank should be run with -R
+        return
+
+    #term vector as parallel arrays of recids and term frequencies
+    nb_recids = len(invidx)
+    recids = numpy.fromiter(invidx.iterkeys(), dtype=numpy.int32, count=nb_recids)
+    tf0 = numpy.fromiter([tf[0] for tf in invidx.itervalues()], dtype=numpy.float64, count=nb_recids)
+    tf1 = numpy.fromiter([tf[1] for tf in invidx.itervalues()], dtype=numpy.float64, count=nb_recids)
+
+    #only accept records existing in the hitset received from the search engine
+    selected = recids < len(hitset_mask)
+    selected[selected] = hitset_mask[recids[selected]]
+    recids = recids[selected]
+    values = tf0[selected] * Gi * tf1[selected] * qtf
+    #the logarithm is not defined for these, so they are not ranked
+    selected = values > 0
+    recids = recids[selected]
+    scores[recids] += numpy.trunc(numpy.log(values[selected])).astype(scores.dtype)
+    termcounts[recids] += 1
+
+def sort_record_relevance_vectors(scores, termcounts, hitset, rank_limit_relevance, ranked_result_amount=None):
+    """Same as sort_record_relevance(), but for the arrays computed by
+    calculate_record_relevance_vectors().  If RANKED_RESULT_AMOUNT is
+    given, only the records having the best RANKED_RESULT_AMOUNT
+    scores are sorted, via partial sorting, and the other ones come
+    first, in the order of their recids.
+    scores - array of the relevance of each recid
+    termcounts - array of the number of terms from the query existing in each recid
+    rank_limit_relevance - a value > 0 usually"""
+
+    recids = numpy.nonzero(termcounts)[0]
+
+    #remove all ranked documents so that unranked can be added to the end
+    hitset -= intbitset(recids.tolist())
+
+    #gives each record a score between 0-100
+    values = scores[recids]
+    divideby = 1
+    if len(values):
+        divideby = values.max() or 1
+    values = values * 100 // divideby
+    selected = values >= rank_limit_relevance
+    recids = recids[selected]
+    values = values[selected]
+
+    #sort scores, only the best ones if not all are needed
+    if ranked_result_amount and ranked_result_amount < len(values):
+        if hasattr(numpy, 'argpartition'):
+            best = numpy.argpartition(-values, ranked_result_amount - 1)[:ranked_result_amount]
+        else:
+            best = numpy.argsort(-values, kind='mergesort')[:ranked_result_amount]
+        best.sort()
+        others = numpy.ones(len(values), dtype=numpy.bool_)
+        others[best] = False
+        reclist = zip(recids[others].tolist(), values[others].tolist())
+        recids = recids[best]
+        values = values[best]
+    else:
+        reclist = []
+    order = numpy.argsort(values, kind='mergesort')
+    reclist += zip(recids[order].tolist(), values[order].tolist())
+
+    return (reclist, hitset)
+
 def rank_method_stat(rank_method_code, reclist, lwords):
     """Shows some statistics about the searchresult.
     rank_method_code - name field from rnkMETHOD
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the word similarity ranking."""
+
+__revision__ = "$Id$"
+
+import unittest
+
+from invenio import bibrank_word_searcher
+from invenio.intbitset import intbitset
+from invenio.testutils import make_test_suite, run_test_suite
+
+# term -> {recid: (tf, norm), 'Gi': (0, idf)}, as stored in rnkWORDxxF:
+TERMS = {'higgs': {1: (3, 0.5), 2: (1, 1.2), 5: (2, 0.8), 9: (4, 0.3), 'Gi': (0, 4)},
+         'boson': {2: (2, 0.7), 5: (1, 1.5), 7: (5, 0.9), 9: (1, 0.2), 'Gi': (0, 2)},
+         'mass': {1: (1, 0.1), 7: (1, 0.4), 8: (2, 2.0), 'Gi': (0, 1)}}
+
+HITSET = intbitset([1, 2, 5, 7, 8])
+
+class TestWordSimilarityVectors(unittest.TestCase):
+    """Test of the NumPy computation of the word similarity ranking."""
+
+    def rank_with_dicts(self):
+        """Return ranking computed with the dictionaries."""
+        recdict, rec_termcount = {}, {}
+        for term, invidx in TERMS.items():
+            recdict, rec_termcount = bibrank_word_searcher.calculate_record_relevance(
+                (term, invidx['Gi'][1]), dict(invidx), HITSET, recdict, rec_termcount, 0)
+        return bibrank_word_searcher.sort_record_relevance(recdict, rec_termcount,
+                                                           intbitset(HITSET), 0, 0)
+
+    def rank_with_vectors(self, ranked_result_amount=None):
+        """Return ranking computed with the NumPy arrays."""
+        import numpy
+        hitset_mask = numpy.zeros(HITSET.tolist()[-1] + 1, dtype=numpy.bool_)
+        hitset_mask[HITSET.tolist()] = True
+        scores = numpy.zeros(len(hitset_mask), dtype=numpy.int64)
+        termcounts = numpy.zeros(len(hitset_mask), dtype=numpy.int32)
+        for term, invidx in TERMS.items():
+            bibrank_word_searcher.calculate_record_relevance_vectors(
+                (term, invidx['Gi'][1]), dict(invidx), hitset_mask, scores, termcounts)
+        return bibrank_word_searcher.sort_record_relevance_vectors(scores, termcounts,
+                                                                   intbitset(HITSET), 0,
+                                                                   ranked_result_amount)
+
+    if bibrank_word_searcher.CFG_NUMPY_IMPORTABLE:
+        # the vector functions can not run if numpy is not installed
+        def test_same_ranking(self):
+            """bibrank word searcher - vectors rank like dictionaries"""
+            reclist, hitset = self.rank_with_dicts()
+            reclist_vectors, hitset_vectors = self.rank_with_vectors()
+            # records having the same score may come in any order:
+            self.assertEqual(sorted(reclist_vectors), sorted(reclist))
+            self.assertEqual([score for recid, score in reclist_vectors],
+                             [score for recid, score in reclist])
+            self.assertEqual(hitset_vectors, hitset)
+
+        def test_best_records(self):
+            """bibrank word searcher - sorting only the best records"""
+            reclist = self.rank_with_vectors()[0]
+            reclist_best = self.rank_with_vectors(2)[0]
+            self.assertEqual(reclist_best[-2:], reclist[-2:])
+            self.assertEqual(sorted(reclist_best), sorted(reclist))
+
+        def test_zero_scores(self):
+            """bibrank word searcher - ranking records having zero scores"""
+            import numpy
+            scores = numpy.zeros(10, dtype=numpy.int64)
+            termcounts = numpy.zeros(10, dtype=numpy.int32)
+            termcounts[[2, 5]] = 1
+            old_settings = numpy.seterr(all='raise')
+            try:
+                reclist, hitset = bibrank_word_searcher.sort_record_relevance_vectors(
+                    scores, termcounts, intbitset(HITSET), 0)
+            finally:
+                numpy.seterr(**old_settings)
+            self.assertEqual(reclist, [(2, 0), (5, 0)])
+            self.assertEqual(hitset, intbitset([1, 7, 8]))
+
+TEST_SUITE = make_test_suite(TestWordSimilarityVectors,)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -69,6 +69,13 @@ try:
 except ImportError:
     pass
 
+try:
+    import xml.parsers.expat
+    if 'expat' in CFG_BIBRECORD_PARSERS_AVAILABLE:
+        AVAILABLE_PARSERS.append('expat')
+except ImportError:
+    pass
+
 try:
     import Ft.Xml.Domlette
     if '4suite' in CFG_BIBRECORD_PARSERS_AVAILABLE:
@@ -116,6 +123,44 @@ def create_records(marcxml, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
     return [create_record(record_xml, verbose=verbose, correct=correct,
             parser=parser, keep_singletons=keep_singletons) for record_xml in record_xmls]
 
+def create_records_from_file(marcxml_file, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
+    correct=CFG_BIBRECORD_DEFAULT_CORRECT, parser='',
+    keep_singletons=CFG_BIBRECORD_KEEP_SINGLETONS, chunk_size=1048576):
+    """Iterates over the records of the marcxml description read from
+    the file object MARCXML_FILE, yielding the objects returned by the
+    function create_record() one after the other, as create_records()
+    would return them.
+
+    The file is read by chunks of CHUNK_SIZE bytes and each record is
+    parsed as soon as it has been read, so that only one record at a
+    time needs to be held in memory, whatever the size of the file."""
+    regex = re.compile('<record.*?>.*?</record>', re.DOTALL)
+    buf = ''
+    eof = False
+    while not eof:
+        chunk = marcxml_file.read(chunk_size)
+        if chunk:
+            buf += chunk
+        else:
+            eof = True
+        pos = 0
+        # The first match found in the buffer is the one that would be
+        # found in the whole file, as a record that would start before
+        # it would also end before it.  Do not search past the last end
+        # tag, as failing to match an incomplete record is quadratic.
+        end = buf.rfind('</record>') + len('</record>')
+        match = regex.search(buf, pos, end)
+        while match is not None:
+            yield create_record(match.group(), verbose=verbose, correct=correct,
+                                parser=parser, keep_singletons=keep_singletons)
+            pos = match.end()
+            match = regex.search(buf, pos, end)
+        # Keep only what may be the beginning of the next record
+        start = buf.find('<record', pos)
+        if start == -1:
+            start = max(pos, len(buf) - len('<record') + 1)
+        buf = buf[start:]
+
 def create_record(marcxml, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
     correct=CFG_BIBRECORD_DEFAULT_CORRECT, parser='',
     sort_fields_by_indicators=False,
@@ -176,6 +221,9 @@ def create_record(marcxml, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
         elif parser == 'minidom':
             rec = _create_record_minidom(marcxml,
                 keep_singletons=keep_singletons)
+        elif parser == 'expat':
+            rec = _create_record_expat(marcxml,
+                keep_singletons=keep_singletons)
     except InvenioBibRecordParserError, ex1:
         return (None, 0, str(ex1))
 
@@ -1642,6 +1690,101 @@ def _create_record_4suite(marcxml,
 
     return _create_record_from_document(dom, keep_singletons=keep_singletons)
 
+def _create_record_expat(marcxml,
+        keep_singletons=CFG_BIBRECORD_KEEP_SINGLETONS):
+    """Creates a record using the expat parser.  The record is built
+    directly from the parsing events, without creating the DOM of the
+    document like _create_record_minidom() does.
+
+    Note that, like lxml and pyRXP, and unlike minidom, missing
+    indicator attributes become '!': such datafields are then reported
+    as errors (4, 5) with correct=1, and the record gets status 0
+    instead of 1."""
+    controlfields = [] # (tag, value)
+    datafields = [] # [tag, ind1, ind2, subfields]
+    # names of the open elements:
+    stack = []
+    # depth of the record element (0 before it, -1 after it), open
+    # field, code of the open subfield:
+    state = [0, None, None]
+    # text of the open controlfield or subfield:
+    text = []
+
+    def start_element(name, attrs):
+        """Handle the start of an element."""
+        stack.append(name)
+        depth = len(stack)
+        record_depth = state[0]
+        if record_depth > 0:
+            if depth == record_depth + 1:
+                if name == 'controlfield':
+                    state[1] = [attrs.get('tag', '!')]
+                    del text[:]
+                elif name == 'datafield':
+                    state[1] = [attrs.get('tag', '!'), attrs.get('ind1', '!'),
+                                attrs.get('ind2', '!'), []]
+            elif depth == record_depth + 2 and name == 'subfield' and \
+                     state[1] is not None and len(state[1]) == 4:
+                state[2] = attrs.get('code', '!')
+                del text[:]
+        elif record_depth == 0 and name == 'record' and \
+                 (depth == 1 or (depth == 2 and stack[0] == 'collection')):
+            state[0] = depth
+
+    def end_element(name):
+        """Handle the end of an element."""
+        depth = len(stack)
+        stack.pop()
+        record_depth = state[0]
+        if record_depth <= 0:
+            return
+        if depth == record_depth:
+            # Only the first record is considered.
+            state[0] = -1
+        elif depth == record_depth + 1 and state[1] is not None:
+            if len(state[1]) == 1:
+                controlfields.append((state[1][0], ''.join(text)))
+            else:
+                datafields.append(state[1])
+            state[1] = None
+        elif depth == record_depth + 2 and state[2] is not None:
+            state[1][3].append((state[2], ''.join(text)))
+            state[2] = None
+
+    parser = xml.parsers.expat.ParserCreate()
+    # get UTF-8 encoded strings rather than Unicode ones
+    parser.returns_unicode = False
+    parser.buffer_text = True
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = text.append
+    if isinstance(marcxml, unicode):
+        marcxml = marcxml.encode('utf-8')
+    try:
+        parser.Parse(marcxml, True)
+    except xml.parsers.expat.ExpatError, ex1:
+        raise InvenioBibRecordParserError(str(ex1))
+
+    # As with the other parsers, the control fields come first.
+    field_position_global = 1
+    record = {}
+    for tag, value in controlfields:
+        if value or keep_singletons:
+            field = ([], ' ', ' ', value, field_position_global)
+            record.setdefault(tag, []).append(field)
+            field_position_global += 1
+
+    for tag, ind1, ind2, subfields in datafields:
+        if not keep_singletons:
+            subfields = [subfield for subfield in subfields if subfield[1]]
+        if subfields or keep_singletons:
+            ind1, ind2 = _wash_indicators(ind1, ind2)
+            field = (subfields, ind1, ind2, '', field_position_global)
+            record.setdefault(tag, []).append(field)
+            field_position_global += 1
+
+    return record
+
 def _concat(alist):
     """Concats a list of lists"""
     return [element for single_list in alist for element in single_list]
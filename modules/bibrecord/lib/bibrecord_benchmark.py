@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+BibRecord parsers benchmark.
+
+Measures the speed and the peak memory of every available XML parser
+of BibRecord when creating the records of a MARCXML file.
+
+Usage: python bibrecord_benchmark.py [options] [MARCXML file]
+
+  -n, --nb-records=N  number of records to create (10000)
+  -c, --correct       correct the records, as with create_records(correct=1)
+
+The records of the MARCXML file (by default the demo records,
+demobibdata.xml) are repeated as many times as needed to get N of
+them.  Each parser is run in a separate process, so that their
+memory usages do not add up.
+"""
+
+__revision__ = "$Id$"
+
+import getopt
+import marshal
+import os
+import re
+import resource
+import sys
+import time
+import traceback
+
+from invenio.config import CFG_TMPDIR
+from invenio.bibrecord import create_records, AVAILABLE_PARSERS
+
+CFG_BIBRECORD_BENCHMARK_NB_RECORDS = 10000
+
+def get_benchmark_marcxml(marcxml, nb_records):
+    """Return a MARCXML collection of NB_RECORDS records made of the
+    records of MARCXML repeated as many times as needed."""
+    record_xmls = re.compile('<record.*?>.*?</record>', re.DOTALL).findall(marcxml)
+    if not record_xmls:
+        return '<collection>\n</collection>\n'
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<collection>\n']
+    for i in xrange(nb_records):
+        out.append(record_xmls[i % len(record_xmls)])
+        out.append('\n')
+    out.append('</collection>\n')
+    return ''.join(out)
+
+def benchmark_parser(marcxml, parser, correct=0):
+    """Create the records of MARCXML with PARSER in a child process.
+    Return tuple (number of records created without errors, duration
+    in seconds, peak memory used by the parsing in kB)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # the child must never return into the caller's code
+        exitcode = 1
+        try:
+            try:
+                os.close(read_fd)
+                maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                start = time.time()
+                records = create_records(marcxml, verbose=0, correct=correct, parser=parser)
+                duration = time.time() - start
+                maxrss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                nb_ok = len([record for record in records if record[0] is not None])
+                os.write(write_fd, marshal.dumps((nb_ok, duration, maxrss_after - maxrss_before)))
+                os.close(write_fd)
+                exitcode = 0
+            except:
+                traceback.print_exc()
+        finally:
+            os._exit(exitcode)
+    os.close(write_fd)
+    result = ''
+    while True:
+        data = os.read(read_fd, 4096)
+        if not data:
+            break
+        result += data
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    if not result:
+        return (0, 0.0, 0)
+    return marshal.loads(result)
+
+def usage(exitcode=1, msg=""):
+    """Print usage info and exit."""
+    if msg:
+        sys.stderr.write("Error: %s.\n" % msg)
+    sys.stderr.write(__doc__.split("\n", 3)[3])
+    sys.exit(exitcode)
+
+def main():
+    """Run the benchmark on the file given as argument."""
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:c",
+                                   ["help", "nb-records=", "correct"])
+    except getopt.GetoptError, err:
+        usage(1, err)
+    nb_records = CFG_BIBRECORD_BENCHMARK_NB_RECORDS
+    correct = 0
+    for opt, value in opts:
+        if opt in ("-h", "--help"):
+            usage(0)
+        elif opt in ("-n", "--nb-records"):
+            try:
+                nb_records = int(value)
+            except ValueError:
+                usage(1, "wrong number of records %s" % value)
+        elif opt in ("-c", "--correct"):
+            correct = 1
+    if args:
+        filename = args[0]
+    else:
+        filename = os.path.join(CFG_TMPDIR, 'demobibdata.xml')
+    try:
+        marcxml = open(filename).read()
+    except IOError, err:
+        usage(1, err)
+
+    marcxml = get_benchmark_marcxml(marcxml, nb_records)
+    print "%d records, %.1f MB of MARCXML, correct=%d" % \
+          (nb_records, len(marcxml) / 1048576.0, correct)
+    print "%-10s %10s %12s %16s" % ("parser", "records", "records/s", "peak memory (MB)")
+    for parser in AVAILABLE_PARSERS:
+        nb_ok, duration, peak_memory = benchmark_parser(marcxml, parser, correct)
+        print "%-10s %10d %12.1f %16.1f" % (parser, nb_ok,
+                                            nb_records / max(duration, 0.001),
+                                            peak_memory / 1024.0)
+
+if __name__ == "__main__":
+    main()
@@ -48,8 +48,10 @@ CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL = 0
 # correction level to be used when creating records from XML: (0=no, 1=yes)
 CFG_BIBRECORD_DEFAULT_CORRECT = 0
 
-# XML parsers available:
-CFG_BIBRECORD_PARSERS_AVAILABLE = ['pyrxp', 'lxml', '4suite', 'minidom']
+# XML parsers available, in order of preference (note that expat, like
+# pyrxp and lxml, reports the datafields without indicator attributes
+# as errors with correct=1, while minidom accepts them):
+CFG_BIBRECORD_PARSERS_AVAILABLE = ['pyrxp', 'lxml', 'expat', '4suite', 'minidom']
 
 # Exceptions
 class InvenioBibRecordParserError(Exception):
@@ -22,6 +22,7 @@ The BibRecord test suite.
 """
 
 import unittest
+from cStringIO import StringIO
 
 from invenio.config import CFG_TMPDIR, \
      CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG
@@ -53,6 +54,12 @@ try:
 except ImportError:
     parser_minidom_available = False
 
+try:
+    import xml.parsers.expat
+    parser_expat_available = True
+except ImportError:
+    parser_expat_available = False
+
 class BibRecordSuccessTest(unittest.TestCase):
     """ bibrecord - demo file parsing test """
 
@@ -112,6 +119,18 @@ class BibRecordSuccessTest(unittest.TestCase):
             ret.append(rec)
         self.assertEqual(fields, cr, "\n%s\n!=\n%s" % (fields, cr))
 
+    def test_records_created_from_file(self):
+        """ bibrecord - demo file records created one at a time"""
+        f = open(CFG_TMPDIR + '/demobibdata.xml', 'r')
+        xmltext = f.read()
+        f.close()
+        expected = bibrecord.create_records(xmltext)
+        for chunk_size in (7, 1000, 1048576):
+            f = StringIO(xmltext)
+            self.assertEqual(list(bibrecord.create_records_from_file(f,
+                                                 chunk_size=chunk_size)),
+                             expected)
+
     def test_create_record_with_collection_tag(self):
         """ bibrecord - create_record() for single record in collection"""
         xmltext = """
@@ -174,6 +193,12 @@ class BibRecordParsersTest(unittest.TestCase):
             record = bibrecord._create_record_minidom(self.xmltext)
             self.assertEqual(record, self.expected_record)
 
+    if parser_expat_available:
+        def test_expat(self):
+            """ bibrecord - create_record() with expat """
+            record = bibrecord._create_record_expat(self.xmltext)
+            self.assertEqual(record, self.expected_record)
+
 class BibRecordBadInputTreatmentTest(unittest.TestCase):
     """ bibrecord - testing for bad input treatment """
     def test_empty_collection(self):
@@ -1539,6 +1564,14 @@ class BibRecordSingletonTest(unittest.TestCase):
                                            keep_singletons=False)[0][0]
             self.assertEqual(rec, self.rec_expected)
 
+    if parser_expat_available:
+        def test_singleton_removal_expat(self):
+            """bibrecord - enforcing singleton removal with expat"""
+            rec = bibrecord.create_records(self.xml, verbose=1,
+                                           correct=1, parser='expat',
+                                           keep_singletons=False)[0][0]
+            self.assertEqual(rec, self.rec_expected)
+
 class BibRecordNumCharRefTest(unittest.TestCase):
     """ bibrecord - testing numerical character reference expansion"""
 
@@ -1596,6 +1629,13 @@ class BibRecordNumCharRefTest(unittest.TestCase):
                                            correct=1, parser='lxml')[0][0]
             self.assertEqual(rec, self.rec_expected)
 
+    if parser_expat_available:
+        def test_numcharref_expansion_expat(self):
+            """bibrecord - numcharref expansion with expat"""
+            rec = bibrecord.create_records(self.xml, verbose=1,
+                                           correct=1, parser='expat')[0][0]
+            self.assertEqual(rec, self.rec_expected)
+
 class BibRecordExtractIdentifiersTest(unittest.TestCase):
     """ bibrecord - testing for getting identifiers from record """
 
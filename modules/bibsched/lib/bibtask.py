@@ -70,7 +70,8 @@ from invenio.access_control_config import CFG_EXTERNAL_AUTH_USING_SSO, \
     CFG_EXTERNAL_AUTHENTICATION
 from invenio.webuser import get_user_preferences, get_email
 from invenio.bibtask_config import CFG_BIBTASK_VALID_TASKS, \
-    CFG_BIBTASK_DEFAULT_TASK_SETTINGS, CFG_BIBTASK_FIXEDTIMETASKS
+    CFG_BIBTASK_DEFAULT_TASK_SETTINGS, CFG_BIBTASK_FIXEDTIMETASKS, \
+    CFG_BIBTASK_WORKER_STOPPED_EXIT_CODE
 from invenio.dateutils import parse_runtime_limit
 from invenio.shellutils import escape_shell_arg
 from invenio.mailutils import send_email
@@ -709,6 +710,9 @@ def task_sleep_now_if_required(can_stop_too=False):
     """This function should be called during safe state of BibTask,
     e.g. after flushing caches or outside of run_sql calls.
     """
+    if _TASK_PARAMS.get('task_worker_p'):
+        _task_worker_sleep_now_if_required(can_stop_too)
+        return
     status = task_read_status()
     write_message('Entering task_sleep_now_if_required with status=%s' % status, verbose=9)
     if status == 'ABOUT TO SLEEP':
@@ -753,6 +757,103 @@ def task_sleep_now_if_required(can_stop_too=False):
                 task_update_status("STOPPED")
                 sys.exit(0)
 
+def _task_worker_sleep_now_if_required(can_stop_too=False):
+    """Version of task_sleep_now_if_required() for the worker processes
+    run by task_run_in_workers().  Workers leave the task status alone:
+    they stop themselves when the task is about to sleep, until the
+    task process continues them, and exit when the task is about to
+    stop."""
+    status = task_read_status()
+    if status in ('ABOUT TO SLEEP', 'SLEEPING'):
+        write_message("worker sleeping...", verbose=9)
+        os.kill(os.getpid(), signal.SIGSTOP)
+        time.sleep(1)
+        status = task_read_status()
+    if can_stop_too and status in ('ABOUT TO STOP', 'NOW STOP'):
+        write_message("worker stopped", verbose=9)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(CFG_BIBTASK_WORKER_STOPPED_EXIT_CODE)
+
+def _task_run_worker(job):
+    """Run JOB in the freshly forked worker process and exit with 0 if
+    it succeeded or with 1 if it failed."""
+    task_set_task_param('task_worker_p', True)
+    exit_code = 1
+    try:
+        if job() is not False:
+            exit_code = 0
+    except Exception:
+        register_exception(alert_admin=True)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(exit_code)
+
+def task_run_in_workers(jobs, nb_workers):
+    """Run the functions JOBS, that take no arguments, in at most
+    NB_WORKERS forked worker processes at a time.  Return the list of
+    their results: True if the job succeeded, False if it returned
+    False or raised an exception, None if it was not run or did not
+    finish because the task was asked to stop.
+
+    The jobs must call task_sleep_now_if_required() at their safe
+    points, as usual.  When BibSched asks the task to sleep, the task
+    process waits for all the running workers to reach a safe point
+    and stop there before going to sleep itself, and continues them
+    upon waking up.  When BibSched asks the task to stop, no more jobs
+    are started, and the task process stops once the running workers
+    have exited at their safe points.
+    """
+    results = [None] * len(jobs)
+    pending = range(len(jobs))
+    running = {} # pid -> job index
+    sleeping = {} # pids of workers stopped at a safe point
+    stopping = False
+    while pending or running:
+        status = task_read_status()
+        if status in ('ABOUT TO STOP', 'NOW STOP'):
+            stopping = True
+        if status in ('ABOUT TO SLEEP', 'SLEEPING'):
+            if len(sleeping) == len(running):
+                task_sleep_now_if_required()
+                for pid in sleeping.keys():
+                    os.kill(pid, signal.SIGCONT)
+                sleeping = {}
+                continue
+        else:
+            while not stopping and pending and len(running) < nb_workers:
+                idx_job = pending.pop(0)
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    _task_run_worker(jobs[idx_job])
+                running[pid] = idx_job
+        if not running:
+            break
+        time.sleep(1)
+        while running:
+            pid, exit_status = os.waitpid(-1, os.WNOHANG | os.WUNTRACED)
+            if not pid:
+                break
+            if os.WIFSTOPPED(exit_status):
+                sleeping[pid] = True
+                continue
+            idx_job = running.pop(pid)
+            if sleeping.has_key(pid):
+                del sleeping[pid]
+            if os.WIFEXITED(exit_status) and \
+                   os.WEXITSTATUS(exit_status) == CFG_BIBTASK_WORKER_STOPPED_EXIT_CODE:
+                write_message("worker %s stopped" % pid, verbose=9)
+            else:
+                results[idx_job] = os.WIFEXITED(exit_status) and \
+                                   os.WEXITSTATUS(exit_status) == 0
+                write_message("worker %s finished job %s: %s" % \
+                              (pid, idx_job, results[idx_job] and "success" or "failure"), verbose=9)
+    if stopping:
+        task_sleep_now_if_required(can_stop_too=True)
+    return results
+
 def authenticate(user, authorization_action, authorization_msg=""):
     """Authenticate the user against the user database.
     Check for its password, if it exists.
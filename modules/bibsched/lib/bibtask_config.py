@@ -39,6 +39,10 @@ CFG_BIBTASK_MONOTASKS = ("bibupload", "dbdump", "inveniogc")
 # Tasks that should be run during fixed times
 CFG_BIBTASK_FIXEDTIMETASKS = ("oaiharvest", )
 
+# Exit code of worker processes that stopped because their task was
+# asked to stop (see task_run_in_workers)
+CFG_BIBTASK_WORKER_STOPPED_EXIT_CODE = 3
+
 # Task that should not be reinstatiated
 CFG_BIBTASK_NON_REPETITIVE_TASK = ('bibupload', )
 
@@ -81,6 +85,8 @@ CFG_BIBTASK_DEFAULT_TASK_SETTINGS = {
         'collection': [],
         'maxmem': 0,
         'flush': 10000,
+        'flush_batch_size': 0,
+        'parallel': 0,
         'windex': None,
         'reindex': False,
     },
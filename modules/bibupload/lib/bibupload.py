@@ -49,17 +49,23 @@ from invenio.config import CFG_OAI_ID_FIELD, \
      CFG_SITE_URL, CFG_SITE_SECURE_URL, CFG_SITE_RECORD, \
      CFG_OAI_PROVENANCE_ALTERED_SUBFIELD, \
      CFG_BIBUPLOAD_DISABLE_RECORD_REVISIONS, \
-     CFG_BIBUPLOAD_CONFLICTING_REVISION_TICKET_QUEUE
+     CFG_BIBUPLOAD_CONFLICTING_REVISION_TICKET_QUEUE, \
+     CFG_DATABASE_NAME
 
 from invenio.jsonutils import json, CFG_JSON_AVAILABLE
 from invenio.bibupload_config import CFG_BIBUPLOAD_CONTROLFIELD_TAGS, \
     CFG_BIBUPLOAD_SPECIAL_TAGS, \
     CFG_BIBUPLOAD_DELETE_CODE, \
     CFG_BIBUPLOAD_DELETE_VALUE, \
-    CFG_BIBUPLOAD_OPT_MODES
+    CFG_BIBUPLOAD_OPT_MODES, \
+    CFG_BIBUPLOAD_BULK_CHUNK_SIZE, \
+    CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE, \
+    CFG_BIBUPLOAD_BIBXXX_LOCK_TIMEOUT
 from invenio.dbquery import run_sql, \
+                            run_sql_many, \
                             Error
 from invenio.bibrecord import create_records, \
+                              create_records_from_file, \
                               record_add_field, \
                               record_delete_field, \
                               record_xml_output, \
@@ -86,7 +92,8 @@ from invenio.urlutils import make_user_agent_string
 from invenio.config import CFG_BIBDOCFILE_FILEDIR
 from invenio.bibtask import task_init, write_message, \
     task_set_option, task_get_option, task_get_task_param, task_update_status, \
-    task_update_progress, task_sleep_now_if_required, fix_argv_paths
+    task_update_progress, task_sleep_now_if_required, fix_argv_paths, \
+    task_run_in_workers
 from invenio.bibdocfile import BibRecDocs, file_strip_ext, normalize_format, \
     get_docname_from_url, check_valid_url, download_url, \
     KEEP_OLD_VALUE, decompose_bibdocfile_url, InvenioBibDocFileError, \
@@ -112,6 +119,10 @@ stat['exectime'] = time.localtime()
 
 _WRITING_RIGHTS = None
 
+# whether other bibupload processes (the workers of --parallel) may
+# insert values into the bibxxx tables at the same time as this one
+_LOCK_BIBXXX_TABLES = False
+
 CFG_BIBUPLOAD_ALLOWED_SPECIAL_TREATMENTS = ('oracle', )
 
 CFG_HAS_BIBCATALOG = "UNKNOWN"
@@ -192,11 +203,15 @@ def bibupload_pending_recids():
 
 ### bibupload engine functions:
 def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=False,
-        tmp_ids=None, tmp_vers=None):
+        tmp_ids=None, tmp_vers=None, new_rec_id=None):
     """Main function: process a record and fit it in the tables
     bibfmt, bibrec, bibrec_bibxxx, bibxxx with proper record
     metadata.
 
+    In insert mode, NEW_REC_ID may be the rec_id of an empty record
+    allocated beforehand by create_new_records(), to be used instead
+    of creating a new one.
+
     Return (error_code, recID) of the processed record.
     """
     if tmp_ids is None:
@@ -214,8 +229,8 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
     original_record = {}
     rec_old = {}
     now = datetime.now() # will hold record creation/modification date
+    revision_date_pending_p = False # whether now was not checked yet
     record_had_altered_bit = False
-    is_opt_mode_delete = False
 
     # Extraction of the Record Id from 001, SYSNO or OAIID or DOI tags:
     rec_id = retrieve_rec_id(record, opt_mode, pretend=pretend)
@@ -252,7 +267,10 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
     (opt_mode == 'replace_or_insert') and rec_id is None:
         insert_mode_p = True
         # Insert the record into the bibrec databases to have a recordId
-        rec_id = create_new_record(pretend=pretend)
+        if new_rec_id is not None:
+            rec_id = new_rec_id
+        else:
+            rec_id = create_new_record(pretend=pretend)
         write_message("   -Creation of a new record id (%d): DONE" % rec_id, verbose=2)
 
         # we add the record Id control field to the record
@@ -280,7 +298,7 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
         rec_old = get_record(rec_id)
         record_had_altered_bit = record_get_field_values(rec_old, CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG[:3], CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG[3], CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG[4], CFG_OAI_PROVENANCE_ALTERED_SUBFIELD)
         # Also save a copy to restore previous situation in case of errors
-        original_record = get_record(rec_id)
+        original_record = copy.deepcopy(rec_old)
 
         if rec_old is None:
             msg = "   Failed during the creation of the old record!"
@@ -336,10 +354,6 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
         existing_tags = {}
         retained_tags = {}
 
-        # in case of delete operation affected tags should be deleted in delete_bibrec_bibxxx
-        # but should not be updated again in STAGE 4
-        # utilising the below flag
-        is_opt_mode_delete = False
         if not revision_verified:
             # either 005 was not present or opt_mode was not correct/replace
             # in this case we still need to find out affected tags to process
@@ -351,7 +365,6 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
             elif opt_mode == 'delete':
                 # populate an intermediate dictionary
                 # used in upcoming step related to 'delete' mode
-                is_opt_mode_delete = True
                 for tag, fields in original_record.iteritems():
                     existing_tags[tag] = [tag + (field[1] != ' ' and field[1] or '_') + (field[2] != ' ' and field[2] or '_') for field in fields]
             elif opt_mode == 'append':
@@ -409,12 +422,14 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
         if record.has_key('005'):
             record_delete_field(record, '005')
             write_message("  Deleted the existing 005 tag.", verbose=2)
-        last_revision = run_sql("SELECT MAX(job_date) FROM hstRECORD WHERE id_bibrec=%s", (rec_id, ))[0][0]
-        if last_revision and last_revision.strftime("%Y%m%d%H%M%S.0") == now.strftime("%Y%m%d%H%M%S.0"):
-            ## We are updating the same record within the same seconds! It's less than
-            ## the minimal granularity. Let's pause for 1 more second to take a breath :-)
-            time.sleep(1)
-            now = datetime.now()
+        if records_identical(record, original_record):
+            # Nothing but 005 differs (e.g. the record is harvested again
+            # unchanged): no new revision will be archived, see Stage 4,
+            # unless the FFT, 8564 or deletion stages change the record.
+            write_message("     -Record identical to the existing one apart from 005.", verbose=2)
+            revision_date_pending_p = True
+        else:
+            now = get_new_revision_date(rec_id, now)
 
         error = record_add_field(record, '005', controlfield_value=now.strftime("%Y%m%d%H%M%S.0"))
         if error is None:
@@ -508,6 +523,14 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
         write_message("Stage 4: Start (Update bibfmt).", verbose=2)
 
         updates_exist = not records_identical(record, original_record)
+        if updates_exist and revision_date_pending_p:
+            # the previous stages changed the record: its revision
+            # must get a 005 distinct from the last archived one
+            new_now = get_new_revision_date(rec_id, now)
+            if new_now != now:
+                now = new_now
+                record_delete_field(record, '005')
+                record_add_field(record, '005', controlfield_value=now.strftime("%Y%m%d%H%M%S.0"))
         if updates_exist:
             # if record_had_altered_bit, this must be set to true, since the
             # record has been altered.
@@ -558,6 +581,8 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
                 except:
                     # OK, some formats like HB could not have been deleted, no big deal
                     pass
+            # as well as the cached outputs of its format elements:
+            delete_bibfmt_element_cache(rec_id, pretend=pretend)
         write_message("   -Stage COMPLETED", verbose=2)
 
         # Update the database MetaData
@@ -567,19 +592,10 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
             update_database_with_metadata(record, rec_id, oai_rec_id, pretend=pretend)
         elif opt_mode in ('replace', 'replace_or_insert',
             'append', 'correct', 'delete') and updates_exist:
-            # now we clear all the rows from bibrec_bibxxx from the old
+            # now we replace the rows of bibrec_bibxxx of the affected
+            # tags that differ from the new record
             record_deleted_p = True
-            delete_bibrec_bibxxx(rec_old, rec_id, affected_tags, pretend=pretend)
-            # metadata update will insert tags that are available in affected_tags.
-            # but for delete, once the tags have been deleted from bibrec_bibxxx, they dont have to be inserted
-            # except for 005.
-            if is_opt_mode_delete:
-                tmp_affected_tags = copy.deepcopy(affected_tags)
-                for tag in tmp_affected_tags:
-                    if tag != '005':
-                        affected_tags.pop(tag)
-            write_message("   -Clean bibrec_bibxxx: DONE", verbose=2)
-            update_database_with_metadata(record, rec_id, oai_rec_id, affected_tags, pretend=pretend)
+            update_database_with_metadata_diff(record, rec_id, affected_tags, oai_rec_id, pretend=pretend)
         else:
             write_message("   -Stage NOT NEEDED in mode %s" % opt_mode,
                         verbose=2)
@@ -610,7 +626,7 @@ def bibupload(record, opt_mode=None, opt_notimechange=0, oai_rec_id="", pretend=
         if record_deleted_p:
             ## BibUpload has failed living the record deleted. We should
             ## back the original record then.
-            update_database_with_metadata(original_record, rec_id, oai_rec_id, pretend=pretend)
+            update_database_with_metadata_diff(original_record, rec_id, affected_tags, oai_rec_id, pretend=pretend)
             write_message("   Restored original record", verbose=1, stream=sys.stderr)
 
 def record_is_valid(record):
@@ -754,16 +770,20 @@ def insert_record_into_holding_pen(record, oai_id, pretend=False):
     stat['nb_holdingpen'] += 1
 
 def print_out_bibupload_statistics():
-    """Print the statistics of the process"""
+    """Print the statistics of the process, summed up over all the
+    worker processes when running with --parallel"""
+    nb_sec = time.time() - time.mktime(stat['exectime'])
     out = "Task stats: %(nb_input)d input records, %(nb_updated)d updated, " \
           "%(nb_inserted)d inserted, %(nb_errors)d errors, %(nb_holdingpen)d inserted to holding pen.  " \
-          "Time %(nb_sec).2f sec." % { \
+          "Time %(nb_sec).2f sec, %(nb_per_sec).1f records/sec." % { \
               'nb_input': stat['nb_records_to_upload'],
               'nb_updated': stat['nb_records_updated'],
               'nb_inserted': stat['nb_records_inserted'],
               'nb_errors': stat['nb_errors'],
               'nb_holdingpen': stat['nb_holdingpen'],
-              'nb_sec': time.time() - time.mktime(stat['exectime']) }
+              'nb_sec': nb_sec,
+              'nb_per_sec': (stat['nb_records_inserted'] + \
+                             stat['nb_records_updated']) / max(nb_sec, 0.001) }
     write_message(out)
 
 def open_marc_file(path):
@@ -804,6 +824,73 @@ def xml_marc_to_records(xml_marc):
         recs = map((lambda x:x[0]), recs)
         return recs
 
+def open_marc_file_records(path):
+    """Return an iterator over the records of the MARCXML file PATH,
+    which are read and parsed one at a time, so that the memory needed
+    does not depend on the size of the file.  Exit if the file cannot
+    be parsed, as xml_marc_to_records() does."""
+    try:
+        marc_file = open(path, 'r')
+    except IOError, erro:
+        write_message("Error: %s" % erro, verbose=1, stream=sys.stderr)
+        write_message("Exiting.", sys.stderr)
+        if erro.errno == 2:
+            # No such file or directory
+            # Not scary
+            task_update_status("CERROR")
+        else:
+            task_update_status("ERROR")
+        sys.exit(1)
+    recs = create_records_from_file(marc_file, 1, 1)
+    try:
+        first_rec = recs.next()
+    except StopIteration:
+        marc_file.close()
+        write_message("Error: Cannot parse MARCXML file.", verbose=1, stream=sys.stderr)
+        write_message("Exiting.", sys.stderr)
+        task_update_status("ERROR")
+        sys.exit(1)
+    if first_rec[0] is None:
+        marc_file.close()
+        write_message("Error: MARCXML file has wrong format: %s" % [first_rec],
+            verbose=1, stream=sys.stderr)
+        write_message("Exiting.", sys.stderr)
+        task_update_status("CERROR")
+        sys.exit(1)
+
+    def iter_records():
+        """Yield the records of the file."""
+        try:
+            yield first_rec[0]
+            for rec in recs:
+                yield rec[0]
+        finally:
+            marc_file.close()
+    return iter_records()
+
+def count_marc_file_records(path, chunk_size=1048576):
+    """Return the number of records of the MARCXML file PATH, that is
+    the number of </record> end tags, without holding it in memory."""
+    count = 0
+    tail = ''
+    try:
+        marc_file = open(path, 'r')
+    except IOError:
+        return 0
+    try:
+        while True:
+            chunk = marc_file.read(chunk_size)
+            if not chunk:
+                break
+            buf = tail + chunk
+            count += buf.count('</record>')
+            # keep the end of the chunk, too short to hold a whole end
+            # tag, in case one is split between two chunks:
+            tail = buf[-(len('</record>') - 1):]
+    finally:
+        marc_file.close()
+    return count
+
 def find_record_format(rec_id, bibformat):
     """Look whether record REC_ID is formatted in FORMAT,
        i.e. whether FORMAT exists in the bibfmt table for this record.
@@ -1209,6 +1296,42 @@ def create_new_record(rec_id=None, pretend=False):
     else:
         return run_sql("INSERT INTO bibrec (creation_date, modification_date) VALUES (NOW(), NOW())")
 
+def create_new_records(nb_records):
+    """
+    Create NB_RECORDS new empty records in the database with a single
+    query.
+
+    @param nb_records: number of records to create
+    @type nb_records: int
+    @return: the allocated consecutive rec_ids
+    @rtype: list of int
+    """
+    if nb_records < 1:
+        return []
+    # a multiple-row INSERT into a MyISAM table, such as bibrec, locks
+    # the table and thus allocates consecutive values of the
+    # AUTO_INCREMENT column, returning the first one.  (This would not
+    # hold for an InnoDB table with innodb_autoinc_lock_mode=2.)
+    first_rec_id = run_sql("INSERT INTO bibrec (creation_date, modification_date) VALUES " + \
+                           ", ".join(["(NOW(), NOW())"] * nb_records))
+    return range(first_rec_id, first_rec_id + nb_records)
+
+def delete_unused_new_records(rec_ids):
+    """
+    Delete the records of REC_IDS, allocated by create_new_records(),
+    that are still empty because their upload failed or was not run.
+    """
+    if not rec_ids:
+        return
+    used_rec_ids = intbitset()
+    for table in ('bibfmt', 'bibrec_bib00x'):
+        used_rec_ids |= intbitset(run_sql("SELECT DISTINCT id_bibrec FROM %s WHERE id_bibrec BETWEEN %%s AND %%s" % table,
+                                          (min(rec_ids), max(rec_ids))))
+    unused_rec_ids = [(rec_id, ) for rec_id in rec_ids if rec_id not in used_rec_ids]
+    if unused_rec_ids:
+        write_message("   Deleting %s unused new records" % len(unused_rec_ids), verbose=2)
+        run_sql_many("DELETE FROM bibrec WHERE id=%s", unused_rec_ids)
+
 def insert_bibfmt(id_bibrec, marc, bibformat, modification_date='1970-01-01 00:00:00', pretend=False):
     """Insert the format in the table bibfmt"""
     # compress the marc value
@@ -1265,6 +1388,150 @@ def insert_record_bibxxx(tag, value, pretend=False):
         return (table_name, 1)
     return (table_name, row_id)
 
+def get_record_bibxxx_values(record):
+    """Return the list of (full tag, value, field number) to be stored
+    in the bibxxx tables for the fields of RECORD, such as 100__a for
+    datafields or 005__ for controlfields (but 001 and the special
+    tags, which are not stored there)."""
+    out = []
+    for tag in record.keys():
+        # check if tag is not a special one:
+        if tag in CFG_BIBUPLOAD_SPECIAL_TAGS or tag == "001":
+            # nothing to do for special tags (FFT, BDR, BDM)
+            continue
+        # for each tag there is a list of tuples representing datafields
+        for single_tuple in record[tag]:
+            # these are the contents of a single tuple
+            subfield_list = single_tuple[0]
+            ind1 = single_tuple[1]
+            ind2 = single_tuple[2]
+            # the full tag is [tag, ind1, ind2, subfield_code]
+            if ind1 == '' or ind1 == ' ':
+                ind1 = '_'
+            if ind2 == '' or ind2 == ' ':
+                ind2 = '_'
+            datafield_number = single_tuple[4]
+            if tag in CFG_BIBUPLOAD_CONTROLFIELD_TAGS:
+                out.append((tag + ind1 + ind2, single_tuple[3], datafield_number))
+            else:
+                # get the tag and value from the content of each subfield
+                for subtag, value in subfield_list:
+                    out.append((tag + ind1 + ind2 + subtag, value, datafield_number))
+    return out
+
+def get_bibxxx_ids(table_name, tag_values):
+    """Return dictionary {(tag, value): id} of the rows of bibxxx
+    table TABLE_NAME that hold the (tag, value) pairs of TAG_VALUES,
+    using one query per CFG_BIBUPLOAD_BULK_CHUNK_SIZE pairs."""
+    out = {}
+    tag_values = list(tag_values)
+    for i in range(0, len(tag_values), CFG_BIBUPLOAD_BULK_CHUNK_SIZE):
+        chunk = tag_values[i:i + CFG_BIBUPLOAD_BULK_CHUNK_SIZE]
+        tags = list(set([tag for tag, dummy in chunk]))
+        values = list(set([value for dummy, value in chunk]))
+        query = """SELECT id,tag,value FROM %s WHERE tag IN (%s) AND value IN (%s)""" % \
+                (table_name, ','.join(['%s'] * len(tags)), ','.join(['%s'] * len(values)))
+        wanted = set(chunk)
+        # Note: as in insert_record_bibxxx(), compare the found values
+        # in Python, to look for string binary equality.
+        for row_id, row_tag, row_value in run_sql(query, tuple(tags) + tuple(values)):
+            if (row_tag, row_value) in wanted and not out.has_key((row_tag, row_value)):
+                out[(row_tag, row_value)] = row_id
+    return out
+
+def lock_bibxxx_table(table_name):
+    """Wait until this process holds the lock on the (tag, value)
+    pairs of bibxxx table TABLE_NAME, for at most
+    CFG_BIBUPLOAD_BIBXXX_LOCK_TIMEOUT seconds."""
+    res = run_sql("SELECT GET_LOCK(%s, %s)",
+                  ("%s.bibupload.%s" % (CFG_DATABASE_NAME, table_name),
+                   CFG_BIBUPLOAD_BIBXXX_LOCK_TIMEOUT))
+    if not res or res[0][0] != 1:
+        raise StandardError("Could not lock table %s" % table_name)
+
+def unlock_bibxxx_table(table_name):
+    """Release the lock taken by lock_bibxxx_table()."""
+    run_sql("SELECT RELEASE_LOCK(%s)",
+            ("%s.bibupload.%s" % (CFG_DATABASE_NAME, table_name), ))
+
+def get_or_insert_bibxxx_ids(table_name, tag_values):
+    """Return dictionary {(tag, value): id} of the rows of bibxxx
+    table TABLE_NAME holding the (tag, value) pairs of TAG_VALUES,
+    inserting the pairs not present yet with a few multi-row queries.
+    The table should be locked with lock_bibxxx_table() if other
+    processes may insert into it at the same time."""
+    ids = get_bibxxx_ids(table_name, tag_values)
+    missing = [tag_value for tag_value in tag_values if not ids.has_key(tag_value)]
+    for i in range(0, len(missing), CFG_BIBUPLOAD_BULK_CHUNK_SIZE):
+        chunk = missing[i:i + CFG_BIBUPLOAD_BULK_CHUNK_SIZE]
+        query = """INSERT INTO %s (tag, value) VALUES %s""" % \
+                (table_name, ','.join(['(%s,%s)'] * len(chunk)))
+        params = []
+        for tag, value in chunk:
+            params.extend((tag, value))
+        run_sql(query, tuple(params))
+    if missing:
+        ids.update(get_bibxxx_ids(table_name, missing))
+        # MySQL may have stored a value different from the one we
+        # sent (e.g. without trailing spaces or with invalid
+        # characters replaced), so that it is not found back with
+        # binary equality: look such values up again with the
+        # collation of the table, taking the most recent row, which
+        # is the one inserted above, since no other process inserts
+        # into the table meanwhile.
+        for tag, value in missing:
+            if not ids.has_key((tag, value)):
+                query = """SELECT MAX(id) FROM %s WHERE tag=%%s AND value=%%s""" % table_name
+                res = run_sql(query, (tag, value))
+                if res and res[0][0]:
+                    ids[(tag, value)] = res[0][0]
+                else:
+                    write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
+    return ids
+
+def insert_records_bibxxx(records_values, pretend=False):
+    """Insert the fields of several records into the bibxxx tables and
+    connect them to the records with the bibrec_bibxxx tables, using a
+    few queries per table for all the records rather than a few
+    queries per field.
+
+    RECORDS_VALUES is a list of (id_bibrec, list of (tag, value,
+    field_number)), as returned by get_record_bibxxx_values() for the
+    record.  Return the number of bibrec_bibxxx rows inserted."""
+    # group the values by bibxxx table
+    tables = {}
+    for id_bibrec, values in records_values:
+        for tag, value, field_number in values:
+            table_name = 'bib' + tag[0:2] + 'x'
+            tables.setdefault(table_name, []).append((id_bibrec, tag, value, field_number))
+
+    res = 0
+    for table_name, rows in tables.iteritems():
+        tag_values = set([(tag, value) for dummy, tag, value, dummy in rows])
+        if pretend:
+            res += len(rows)
+            continue
+        # look for the existing tag, value combinations, and insert the
+        # other ones into bibxxx table as new, while no other worker of
+        # --parallel does the same, since bibxxx tables have no unique
+        # key on (tag, value)
+        if _LOCK_BIBXXX_TABLES:
+            lock_bibxxx_table(table_name)
+        try:
+            ids = get_or_insert_bibxxx_ids(table_name, tag_values)
+        finally:
+            if _LOCK_BIBXXX_TABLES:
+                unlock_bibxxx_table(table_name)
+        # insert the proper rows into bibrec_bibxxx table
+        query = """INSERT INTO bibrec_%s (id_bibrec,id_bibxxx,field_number) VALUES (%%s,%%s,%%s)""" % \
+                table_name
+        params = [(id_bibrec, ids[(tag, value)], field_number)
+                  for id_bibrec, tag, value, field_number in rows
+                  if ids.has_key((tag, value))]
+        run_sql_many(query, params)
+        res += len(params)
+    return res
+
 def insert_record_bibrec_bibxxx(table_name, id_bibxxx,
         field_number, id_bibrec, pretend=False):
     """Insert the record into bibrec_bibxxx"""
@@ -2282,6 +2549,29 @@ def delete_bibfmt_format(id_bibrec, format_name, pretend=False):
         run_sql("DELETE LOW_PRIORITY FROM bibfmt WHERE id_bibrec=%s and format=%s", (id_bibrec, format_name))
     return 0
 
+def delete_bibfmt_element_cache(id_bibrec, pretend=False):
+    """
+    Delete the cached outputs of the format elements of record
+    ID_BIBREC from bibfmtELEMENTCACHE table.
+    """
+    if not pretend:
+        run_sql("DELETE LOW_PRIORITY FROM bibfmtELEMENTCACHE WHERE id_bibrec=%s", (id_bibrec,))
+    return 0
+
+def get_new_revision_date(rec_id, now):
+    """
+    Return NOW, the modification date of a new revision of record
+    REC_ID, or a date one second later if the last revision archived
+    in hstRECORD has the same date, at the granularity of 005.
+    """
+    last_revision = run_sql("SELECT MAX(job_date) FROM hstRECORD WHERE id_bibrec=%s", (rec_id, ))[0][0]
+    if last_revision and last_revision.strftime("%Y%m%d%H%M%S.0") == now.strftime("%Y%m%d%H%M%S.0"):
+        ## We are updating the same record within the same seconds! It's less than
+        ## the minimal granularity. Let's pause for 1 more second to take a breath :-)
+        time.sleep(1)
+        now = datetime.now()
+    return now
+
 def archive_marcxml_for_history(recID, pretend=False):
     """
     Archive current MARCXML format of record RECID from BIBFMT table
@@ -2305,94 +2595,112 @@ def update_database_with_metadata(record, rec_id, oai_rec_id="oai", affected_tag
     # check happens at subfield level. This is to prevent overhead
     # associated with inserting already existing field with given ind pair
     write_message("update_database_with_metadata: record=%s, rec_id=%s, oai_rec_id=%s, affected_tags=%s" % (record, rec_id, oai_rec_id, affected_tags), verbose=9)
-    tmp_record = {}
     if affected_tags:
-        for tag in record.keys():
-            if tag in affected_tags.keys():
-                write_message("     -Tag %s found to be modified.Setting up for update" % tag, verbose=9)
-                # initialize new list to hold affected field
-                new_data_tuple_list = []
-                for data_tuple in record[tag]:
-                    ind1 = data_tuple[1]
-                    ind2 = data_tuple[2]
-                    if (ind1, ind2) in affected_tags[tag]:
-                        write_message("     -Indicator pair (%s, %s) added to update list" % (ind1, ind2), verbose=9)
-                        new_data_tuple_list.append(data_tuple)
-                tmp_record[tag] = new_data_tuple_list
+        tmp_record = get_record_affected_fields(record, affected_tags)
         write_message(lambda: "     -Modified fields: \n%s" % record_xml_output(tmp_record), verbose=2)
     else:
         tmp_record = record
 
-    for tag in tmp_record.keys():
-        # check if tag is not a special one:
-        if tag not in CFG_BIBUPLOAD_SPECIAL_TAGS:
-            # for each tag there is a list of tuples representing datafields
-            tuple_list = tmp_record[tag]
-            # this list should contain the elements of a full tag [tag, ind1, ind2, subfield_code]
-            tag_list = []
-            tag_list.append(tag)
-            for single_tuple in tuple_list:
-                # these are the contents of a single tuple
-                subfield_list = single_tuple[0]
-                ind1 = single_tuple[1]
-                ind2 = single_tuple[2]
-                # append the ind's to the full tag
-                if ind1 == '' or ind1 == ' ':
-                    tag_list.append('_')
-                else:
-                    tag_list.append(ind1)
-                if ind2 == '' or ind2 == ' ':
-                    tag_list.append('_')
-                else:
-                    tag_list.append(ind2)
-                datafield_number = single_tuple[4]
+    # insert the tag and value of all the fields into bibxxx, and
+    # connect them to the record with bibrec_bibxxx, all at once
+    values = get_record_bibxxx_values(tmp_record)
+    for full_tag, value, dummy in values:
+        write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
+    insert_records_bibxxx([(rec_id, values)], pretend=pretend)
+    write_message("   -Update the database with metadata: DONE", verbose=2)
 
-                if tag in CFG_BIBUPLOAD_SPECIAL_TAGS:
-                    # nothing to do for special tags (FFT, BDR, BDM)
-                    pass
-                elif tag in CFG_BIBUPLOAD_CONTROLFIELD_TAGS and tag != "001":
-                    value = single_tuple[3]
-                    # get the full tag
-                    full_tag = ''.join(tag_list)
-
-                    # update the tables
-                    write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
-                    # insert the tag and value into into bibxxx
-                    (table_name, bibxxx_row_id) = insert_record_bibxxx(full_tag, value, pretend=pretend)
-                    #print 'tname, bibrow', table_name, bibxxx_row_id;
-                    if table_name is None or bibxxx_row_id is None:
-                        write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
-                    # connect bibxxx and bibrec with the table bibrec_bibxxx
-                    res = insert_record_bibrec_bibxxx(table_name, bibxxx_row_id, datafield_number, rec_id, pretend=pretend)
-                    if res is None:
-                        write_message("   Failed: during insert_record_bibrec_bibxxx", verbose=1, stream=sys.stderr)
-                else:
-                    # get the tag and value from the content of each subfield
-                    for subfield in subfield_list:
-                        subtag = subfield[0]
-                        value = subfield[1]
-                        tag_list.append(subtag)
-                        # get the full tag
-                        full_tag = ''.join(tag_list)
-                        # update the tables
-                        write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
-                        # insert the tag and value into into bibxxx
-                        (table_name, bibxxx_row_id) = insert_record_bibxxx(full_tag, value, pretend=pretend)
-                        if table_name is None or bibxxx_row_id is None:
-                            write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
-                        # connect bibxxx and bibrec with the table bibrec_bibxxx
-                        res = insert_record_bibrec_bibxxx(table_name, bibxxx_row_id, datafield_number, rec_id, pretend=pretend)
-                        if res is None:
-                            write_message("   Failed: during insert_record_bibrec_bibxxx", verbose=1, stream=sys.stderr)
-                        # remove the subtag from the list
-                        tag_list.pop()
-                tag_list.pop()
-                tag_list.pop()
-            tag_list.pop()
+    log_record_uploading(oai_rec_id, task_get_task_param('task_id', 0), rec_id, 'P', pretend=pretend)
+
+def update_database_with_metadata_diff(record, rec_id, affected_tags, oai_rec_id="oai", pretend=False):
+    """Update the bibxxx tables with the fields of RECORD having the tags
+    and indicators of AFFECTED_TAGS, as update_database_with_metadata()
+    does after delete_bibrec_bibxxx(), but deleting and inserting only
+    the bibrec_bibxxx rows that differ from the ones stored for REC_ID."""
+    write_message("update_database_with_metadata_diff: record=%s, rec_id=%s, oai_rec_id=%s, affected_tags=%s" % (record, rec_id, oai_rec_id, affected_tags), verbose=9)
+    # stored rows: (tag, value, field number) -> list of ids of bibxxx
+    old_rows = {}
+    for tag, value, field_number, id_bibxxx in get_bibrec_bibxxx_rows(rec_id, affected_tags):
+        old_rows.setdefault((tag, value, field_number), []).append(id_bibxxx)
+    # wanted rows: (tag, value, field number) -> number of rows
+    new_rows = {}
+    for row in get_record_bibxxx_values(get_record_affected_fields(record, affected_tags)):
+        new_rows[row] = new_rows.get(row, 0) + 1
+
+    # the rows whose number of occurrences differs are all replaced
+    rows_to_delete = {}
+    for row, ids in old_rows.iteritems():
+        if new_rows.get(row) != len(ids):
+            tag, dummy, field_number = row
+            table_name = 'bib' + tag[0:2] + 'x'
+            for id_bibxxx in set(ids):
+                rows_to_delete.setdefault((table_name, field_number is None), []).append((rec_id, id_bibxxx, field_number))
+    rows_to_insert = []
+    for row, count in new_rows.iteritems():
+        if len(old_rows.get(row, ())) != count:
+            rows_to_insert.extend([row] * count)
+    write_message("   -%s rows to delete, %s rows to insert" % \
+                  (sum([len(rows) for rows in rows_to_delete.itervalues()]), len(rows_to_insert)), verbose=2)
+
+    for (table_name, null_field_number_p), rows in rows_to_delete.iteritems():
+        for row in rows:
+            write_message("   deletion of the row %s from bibrec_%s" % (row, table_name), verbose=9)
+        if pretend:
+            continue
+        if null_field_number_p:
+            query = """DELETE FROM bibrec_%s WHERE id_bibrec=%%s AND id_bibxxx=%%s AND field_number IS NULL""" % table_name
+            rows = [row[:2] for row in rows]
+        else:
+            query = """DELETE FROM bibrec_%s WHERE id_bibrec=%%s AND id_bibxxx=%%s AND field_number=%%s""" % table_name
+        run_sql_many(query, rows)
+    for full_tag, value, dummy in rows_to_insert:
+        write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
+    insert_records_bibxxx([(rec_id, rows_to_insert)], pretend=pretend)
     write_message("   -Update the database with metadata: DONE", verbose=2)
 
     log_record_uploading(oai_rec_id, task_get_task_param('task_id', 0), rec_id, 'P', pretend=pretend)
 
+def get_record_affected_fields(record, affected_tags):
+    """Return the record made of the fields of RECORD having the tags
+    and indicators of AFFECTED_TAGS, that is {tag: [(ind1, ind2)]}."""
+    tmp_record = {}
+    for tag in record.keys():
+        if tag in affected_tags.keys():
+            write_message("     -Tag %s found to be modified.Setting up for update" % tag, verbose=9)
+            # initialize new list to hold affected field
+            new_data_tuple_list = []
+            for data_tuple in record[tag]:
+                ind1 = data_tuple[1]
+                ind2 = data_tuple[2]
+                if (ind1, ind2) in affected_tags[tag]:
+                    write_message("     -Indicator pair (%s, %s) added to update list" % (ind1, ind2), verbose=9)
+                    new_data_tuple_list.append(data_tuple)
+            tmp_record[tag] = new_data_tuple_list
+    return tmp_record
+
+def get_bibrec_bibxxx_rows(id_bibrec, affected_tags):
+    """Return the list of (full tag, value, field number, id_bibxxx)
+    of the bibxxx values connected to record ID_BIBREC for the tags
+    and indicators of AFFECTED_TAGS, using one query per bibxxx table."""
+    tag_patterns = {}
+    for tag, ind_pairs in affected_tags.iteritems():
+        if tag in CFG_BIBUPLOAD_SPECIAL_TAGS or tag == '001':
+            continue
+        table_name = 'bib' + tag[0:2] + 'x'
+        for ind1, ind2 in ind_pairs:
+            if ind1 == '' or ind1 == ' ':
+                ind1 = '_'
+            if ind2 == '' or ind2 == ' ':
+                ind2 = '_'
+            # need to escape incase of underscore so that mysql treats it as a char
+            tag_patterns.setdefault(table_name, []).append(tag + "\\" + ind1 + "\\" + ind2 + '%')
+    out = []
+    for table_name, patterns in tag_patterns.iteritems():
+        query = """SELECT b.tag, b.value, br.field_number, b.id FROM bibrec_%s br, %s b
+                   WHERE br.id_bibrec=%%s AND br.id_bibxxx=b.id AND (%s)""" % \
+                (table_name, table_name, ' OR '.join(['b.tag LIKE %s'] * len(patterns)))
+        out.extend(run_sql(query, (id_bibrec, ) + tuple(patterns)))
+    return out
+
 def append_new_tag_to_old_record(record, rec_old):
     """Append new tags to a old record"""
 
@@ -2587,6 +2895,7 @@ Examples:
   -n, --notimechange\tdo not change record last modification date when updating
   -o, --holdingpen\tInsert record into holding pen instead of the normal database
   --pretend\t\tdo not really insert/append/correct/replace the input file
+  --parallel=N\t\twhen --insert, upload the records in up to N worker processes (1)
   --force\t\twhen --replace, use provided 001 tag values, even if the matching
 \t\t\trecord does not exist (thus allocating it on-the-fly)
   --callback-url\tSend via a POST request a JSON-serialized answer (see admin guide), in
@@ -2613,6 +2922,7 @@ Examples:
                    "nonce=",
                    "special-treatment=",
                    "stage=",
+                   "parallel=",
                  ]),
             task_submit_elaborate_specific_parameter_fnc=task_submit_elaborate_specific_parameter,
             task_run_fnc=task_run_core)
@@ -2704,6 +3014,14 @@ def task_submit_elaborate_specific_parameter(key, value, opts, args): # pylint:
             return False
     elif key in ("-S", "--stage"):
         print >> sys.stderr, """WARNING: the --stage parameter is deprecated and ignored."""
+    elif key in ("--parallel", ):
+        try:
+            task_set_option('parallel', int(value))
+        except ValueError:
+            task_set_option('parallel', 0)
+        if task_get_option('parallel') < 1:
+            print >> sys.stderr, """The number of worker processes should be at least 1."""
+            return False
     else:
         return False
     return True
@@ -2778,9 +3096,20 @@ def post_results_to_callback_url(results, callback_url):
     return res
 
 def bibupload_records(records, opt_mode=None, opt_notimechange=0,
-                      pretend=False, callback_url=None, results_for_callback=None):
+                      pretend=False, callback_url=None, results_for_callback=None,
+                      new_rec_ids=None):
     """perform the task of uploading a set of records
     returns list of (error_code, recid) tuples for separate records
+
+    RECORDS can be any iterable, e.g. the iterator returned by
+    open_marc_file_records(): it is iterated over only once, and the
+    records that need a second phase (BDR and BDM tags, which may
+    refer to records coming later) are spooled to a temporary file
+    meanwhile, so that the records do not have to be held in memory.
+
+    In insert mode, NEW_REC_IDS may be the list of the rec_ids
+    allocated beforehand by create_new_records() for the records, in
+    the same order.
     """
     #Dictionaries maintaining temporary identifiers
     # Structure: identifier -> number
@@ -2795,8 +3124,12 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
         ## NOTE: reference mode has been deprecated in favour of 'correct'
         opt_mode = 'correct'
 
+    # records having fields to be processed in the second phase
+    post_phase_spool = tempfile.TemporaryFile()
+    nb_post_phase_records = 0
+
     record = None
-    for record in records:
+    for idx_record, record in enumerate(records):
         record_id = record_extract_oai_id(record)
         task_sleep_now_if_required(can_stop_too=True)
         if opt_mode == "holdingpen":
@@ -2805,6 +3138,9 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
             insert_record_into_holding_pen(record, record_id)
         else:
             write_message("Inserting into main database", verbose=3)
+            new_rec_id = None
+            if new_rec_ids:
+                new_rec_id = new_rec_ids[idx_record]
             error = bibupload(
                 record,
                 opt_mode = opt_mode,
@@ -2812,7 +3148,8 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
                 oai_rec_id = record_id,
                 pretend = pretend,
                 tmp_ids = tmp_ids,
-                tmp_vers = tmp_vers)
+                tmp_vers = tmp_vers,
+                new_rec_id = new_rec_id)
             results.append(error)
             if error[0] == 1:
                 if record:
@@ -2846,13 +3183,19 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
                                      (stat['nb_records_inserted'] + \
                                           stat['nb_records_updated'],
                                       stat['nb_records_to_upload']))
+            if record and (extract_tag_from_record(record, "BDR") is not None or \
+                           extract_tag_from_record(record, "BDM") is not None):
+                marshal.dump(record, post_phase_spool)
+                nb_post_phase_records += 1
 
     # Second phase -> Now we can process all entries where temporary identifiers might appear (BDR, BDM)
 
     write_message("Identifiers table after processing: %s  versions: %s" % (str(tmp_ids), str(tmp_vers)))
     write_message("Uploading BDR and BDM fields")
     if opt_mode != "holdingpen":
-        for record in records:
+        post_phase_spool.seek(0)
+        for dummy in xrange(nb_post_phase_records):
+            record = marshal.load(post_phase_spool)
             record_id = retrieve_rec_id(record, opt_mode, pretend=pretend, post_phase = True)
             bibupload_post_phase(record,
                                  rec_id = record_id,
@@ -2860,10 +3203,134 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
                                  pretend = pretend,
                                  tmp_ids = tmp_ids,
                                  tmp_vers = tmp_vers)
-
+    post_phase_spool.close()
 
     return results
 
+def bibupload_records_in_workers(records, nb_workers, opt_mode=None,
+                                 opt_notimechange=0):
+    """Upload the records of iterable RECORDS in insert mode in at
+    most NB_WORKERS worker processes, by ranges of
+    CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE consecutive records.  The rec_ids
+    of all the ranges are allocated beforehand, in the order of the
+    input, so that the records get the same rec_ids as when uploaded
+    one after the other.  The workers share the bibxxx tables, where
+    insert_records_bibxxx() serializes the insertion of new values.
+
+    Records having BDR or BDM fields may refer to the temporary
+    identifiers of any other record, and records of different ranges
+    having the same OAI ID would both be inserted by their workers
+    instead of the second one being rejected: in these cases, all the
+    records are uploaded in this process instead.
+
+    The statistics of the workers are added up into stat.
+    Return True if all the ranges were uploaded.
+    """
+    # spool the records, by ranges, into temporary files read back by
+    # the workers
+    chunks = [] # (records file, number of records)
+    post_phase_p = False
+    oai_ids = {} # OAI ID -> index of the range of the record having it
+    duplicate_oai_ids_p = False
+    records_file = None
+    for record in records:
+        if records_file is None:
+            records_file = tempfile.TemporaryFile()
+            nb_records = 0
+        marshal.dump(record, records_file)
+        nb_records += 1
+        if record and (extract_tag_from_record(record, "BDR") is not None or \
+                       extract_tag_from_record(record, "BDM") is not None):
+            post_phase_p = True
+        if record:
+            oaiidvalues = record_get_field_values(record,
+                CFG_OAI_ID_FIELD[0:3],
+                CFG_OAI_ID_FIELD[3:4] != "_" and \
+                CFG_OAI_ID_FIELD[3:4] or "",
+                CFG_OAI_ID_FIELD[4:5] != "_" and \
+                CFG_OAI_ID_FIELD[4:5] or "",
+                CFG_OAI_ID_FIELD[5:6])
+            # there should be only one OAI ID, as in retrieve_rec_id()
+            if oaiidvalues and \
+                   oai_ids.setdefault(oaiidvalues[0], len(chunks)) != len(chunks):
+                duplicate_oai_ids_p = True
+        if nb_records == CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE:
+            chunks.append((records_file, nb_records))
+            records_file = None
+    if records_file is not None:
+        chunks.append((records_file, nb_records))
+
+    def iter_chunk_records(records_file, nb_records):
+        """Yield the records spooled into RECORDS_FILE."""
+        records_file.seek(0)
+        for dummy in xrange(nb_records):
+            yield marshal.load(records_file)
+
+    if post_phase_p or duplicate_oai_ids_p or len(chunks) < 2:
+        if post_phase_p:
+            write_message("BDR or BDM fields found: uploading all records in one process")
+        elif duplicate_oai_ids_p:
+            write_message("Same OAI ID found in several ranges of records: "
+                          "uploading all records in one process")
+        def iter_records():
+            """Yield all the spooled records."""
+            for records_file, nb_records in chunks:
+                for record in iter_chunk_records(records_file, nb_records):
+                    yield record
+                records_file.close()
+        bibupload_records(iter_records(), opt_mode=opt_mode,
+                          opt_notimechange=opt_notimechange)
+        return True
+
+    stat_keys = ('nb_records_inserted', 'nb_records_updated',
+                 'nb_errors', 'nb_holdingpen')
+    jobs = []
+    jobs_data = [] # (rec_ids, stat file) of every job
+    for records_file, nb_records in chunks:
+        records_file.flush()
+        new_rec_ids = create_new_records(nb_records)
+        stat_file = tempfile.TemporaryFile()
+        def job(records_file=records_file, nb_records=nb_records,
+                new_rec_ids=new_rec_ids, stat_file=stat_file):
+            global _LOCK_BIBXXX_TABLES # pylint: disable=W0603
+            _LOCK_BIBXXX_TABLES = True
+            for key in stat_keys:
+                stat[key] = 0
+            stat['nb_records_to_upload'] = nb_records
+            bibupload_records(iter_chunk_records(records_file, nb_records),
+                              opt_mode=opt_mode,
+                              opt_notimechange=opt_notimechange,
+                              new_rec_ids=new_rec_ids)
+            marshal.dump(dict([(key, stat[key]) for key in stat_keys]), stat_file)
+            stat_file.flush()
+        jobs.append(job)
+        jobs_data.append((new_rec_ids, stat_file))
+    write_message("Uploading %s ranges of records in %s worker processes" % \
+                  (len(jobs), nb_workers))
+    results = [None] * len(jobs)
+    try:
+        results = task_run_in_workers(jobs, nb_workers)
+    finally:
+        # also when the task is stopped by BibSched (SystemExit), the
+        # statistics of the finished jobs are kept, and the rec_ids
+        # allocated for the records that were not uploaded are freed
+        for idx_job in xrange(len(jobs)):
+            new_rec_ids, stat_file = jobs_data[idx_job]
+            stat_file.seek(0)
+            try:
+                job_stat = marshal.load(stat_file)
+            except (EOFError, ValueError, TypeError):
+                job_stat = {}
+            for key, value in job_stat.iteritems():
+                stat[key] += value
+            if results[idx_job] is False:
+                write_message("Upload of the records %s to %s failed" % \
+                              (new_rec_ids[0], new_rec_ids[-1]), stream=sys.stderr)
+            delete_unused_new_records(new_rec_ids)
+            stat_file.close()
+            chunks[idx_job][0].close()
+    return False not in results
+
 def task_run_core():
     """ Reimplement to add the body of the task."""
     write_message("Input file '%s', input mode '%s'." %
@@ -2873,15 +3340,29 @@ def task_run_core():
     if task_get_option('file_path') is not None:
         write_message("start preocessing", verbose=3)
         task_update_progress("Reading XML input")
-        recs = xml_marc_to_records(open_marc_file(task_get_option('file_path')))
-        stat['nb_records_to_upload'] = len(recs)
+        # Records are read and uploaded one at a time
+        recs = open_marc_file_records(task_get_option('file_path'))
+        stat['nb_records_to_upload'] = count_marc_file_records(task_get_option('file_path'))
         write_message("   -Open XML marc: DONE", verbose=2)
         task_sleep_now_if_required(can_stop_too=True)
         write_message("Entering records loop", verbose=3)
         callback_url = task_get_option('callback_url')
         results_for_callback = {'results': []}
 
-        if recs is not None:
+        nb_workers = task_get_option('parallel', 1)
+        if nb_workers > 1 and (task_get_option('mode') != 'insert' or \
+                               task_get_option('pretend') or callback_url):
+            write_message("   Warning: --parallel is only used in insert mode, "
+                          "without --pretend nor --callback-url",
+                          stream=sys.stderr)
+            nb_workers = 1
+
+        if recs is not None and nb_workers > 1:
+            if not bibupload_records_in_workers(recs, nb_workers,
+                                    opt_mode=task_get_option('mode'),
+                                    opt_notimechange=task_get_option('notimechange')):
+                stat['nb_errors'] += 1
+        elif recs is not None:
             # We proceed each record by record
             bibupload_records(records=recs, opt_mode=task_get_option('mode'),
                               opt_notimechange=task_get_option('notimechange'),
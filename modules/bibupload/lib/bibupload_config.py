@@ -34,3 +34,16 @@ CFG_BIBUPLOAD_DELETE_VALUE = "__DELETE_FIELDS__"
 
 CFG_BIBUPLOAD_OPT_MODES = ['insert', 'replace', 'replace_or_insert', 'reference',
         'correct', 'append', 'holdingpen', 'delete']
+
+# number of (tag, value) pairs looked up or inserted into a bibxxx
+# table with a single query when writing the metadata of records
+CFG_BIBUPLOAD_BULK_CHUNK_SIZE = 500
+
+# number of consecutive records uploaded by each job of a worker
+# process when running with --parallel
+CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE = 1000
+
+# number of seconds a bibupload process waits for the other ones
+# (e.g. the workers of --parallel) to insert their values into a
+# bibxxx table before giving up
+CFG_BIBUPLOAD_BIBXXX_LOCK_TIMEOUT = 600
@@ -1447,6 +1447,47 @@ class BibUploadInsertModeTest(GenericBibUploadTest):
         self.assertEqual(record_has_field(rec, '005'), True)
         self.assertEqual(str(res[0][0]) + '.0', record_get_field_value(rec, '005', '', ''))
 
+    def test_create_new_records(self):
+        """bibupload - insert mode, allocating several record IDs at once"""
+        rec_ids = bibupload.create_new_records(3)
+        self.assertEqual(len(rec_ids), 3)
+        self.assertEqual(rec_ids, range(rec_ids[0], rec_ids[0] + 3))
+        self.assertEqual(len(run_sql("SELECT id FROM bibrec WHERE id>=%s AND id<=%s",
+                                     (rec_ids[0], rec_ids[-1]))), 3)
+
+    def test_insert_with_new_record_ids(self):
+        """bibupload - insert mode, using record IDs allocated beforehand"""
+        rec_ids = bibupload.create_new_records(2)
+        recs = bibupload.xml_marc_to_records(self.test)
+        _, recid, _ = bibupload.bibupload_records(recs, opt_mode='insert',
+                                                  new_rec_ids=rec_ids[1:])[0]
+        self.assertEqual(recid, rec_ids[1])
+        self.check_record_consistency(recid)
+        # the unused record ID is deleted, but not the used one
+        bibupload.delete_unused_new_records(rec_ids)
+        self.assertEqual(run_sql("SELECT id FROM bibrec WHERE id>=%s AND id<=%s",
+                                 (rec_ids[0], rec_ids[-1])), ((rec_ids[1],),))
+
+    def test_parallel_insert_stopped(self):
+        """bibupload - insert mode, freeing record IDs when a parallel upload is stopped"""
+        def stopped_task_run_in_workers(jobs, nb_workers):
+            """Stop as BibSched would do, without running any job."""
+            sys.exit(0)
+        old_task_run_in_workers = bibupload.task_run_in_workers
+        old_chunk_size = bibupload.CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE
+        bibupload.task_run_in_workers = stopped_task_run_in_workers
+        bibupload.CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE = 1
+        try:
+            recs = bibupload.xml_marc_to_records("<collection>%s%s</collection>" % \
+                                                 (self.test, self.test))
+            self.assertRaises(SystemExit, bibupload.bibupload_records_in_workers,
+                              recs, 2, opt_mode='insert')
+        finally:
+            bibupload.task_run_in_workers = old_task_run_in_workers
+            bibupload.CFG_BIBUPLOAD_PARALLEL_CHUNK_SIZE = old_chunk_size
+        self.assertEqual(run_sql("SELECT id FROM bibrec WHERE id>%s",
+                                 (self.last_recid, )), ())
+
 class BibUploadAppendModeTest(GenericBibUploadTest):
     """Testing append mode."""
 
@@ -1999,6 +2040,44 @@ class BibUploadReplaceModeTest(GenericBibUploadTest):
         # did it work?
         self.assertEqual((err, recid), (1, -1))
 
+    def test_record_replace_unchanged_and_changed(self):
+        """bibupload - replace mode, unchanged record and changed field"""
+        test_record_xm = """
+        <record>
+        <controlfield tag="003">SzGeCERN</controlfield>
+         <datafield tag="100" ind1=" " ind2=" ">
+          <subfield code="a">Test, Jane</subfield>
+          <subfield code="u">Test Institute</subfield>
+         </datafield>
+         <datafield tag="700" ind1=" " ind2=" ">
+          <subfield code="a">Test, John</subfield>
+          <subfield code="u">Test University</subfield>
+         </datafield>
+         <datafield tag="700" ind1=" " ind2=" ">
+          <subfield code="a">Test, Jim</subfield>
+          <subfield code="u">Test Laboratory</subfield>
+         </datafield>
+        </record>
+        """
+        recs = bibupload.xml_marc_to_records(test_record_xm)
+        _, recid, _ = bibupload.bibupload_records(recs, opt_mode='insert')[0]
+        inserted_xm = print_record(recid, 'xm')
+        nb_revisions = run_sql("SELECT COUNT(*) FROM hstRECORD WHERE id_bibrec=%s", (recid, ))[0][0]
+        # uploading the same record again changes nothing:
+        recs = bibupload.xml_marc_to_records(inserted_xm)
+        err, dummy, dummy = bibupload.bibupload(recs[0], opt_mode='replace')
+        self.assertEqual(err, 0)
+        self.assertEqual(print_record(recid, 'xm'), inserted_xm)
+        self.assertEqual(run_sql("SELECT COUNT(*) FROM hstRECORD WHERE id_bibrec=%s", (recid, ))[0][0],
+                         nb_revisions)
+        # changing one author updates only its field:
+        recs = bibupload.xml_marc_to_records(inserted_xm.replace('Test, Jim', 'Test, Joe'))
+        err, dummy, dummy = bibupload.bibupload(recs[0], opt_mode='replace')
+        self.assertEqual(err, 0)
+        self.check_record_consistency(recid)
+        self.assertEqual(compare_xmbuffers(remove_tag_001_from_xmbuffer(print_record(recid, 'xm')),
+                                           test_record_xm.replace('Test, Jim', 'Test, Joe')), '')
+
 
 class BibUploadReferencesModeTest(GenericBibUploadTest):
     """Testing references mode.
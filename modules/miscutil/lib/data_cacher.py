@@ -22,13 +22,278 @@ Tool for caching important infos, which are slow to rebuild, but that
 rarely change.
 """
 
-from invenio.dbquery import run_sql, get_table_update_time
+import os
+import sys
 import time
+import marshal
+import cPickle
+import tempfile
+import threading
+
+try:
+    ## import optional module:
+    import memcache
+    CFG_MEMCACHE_IMPORTABLE = True
+except ImportError:
+    CFG_MEMCACHE_IMPORTABLE = False
+
+from invenio.config import CFG_CACHEDIR, \
+     CFG_DATACACHER_SHARED_BACKEND, \
+     CFG_DATACACHER_MEMCACHED_SERVERS
+from invenio.dbquery import run_sql, get_table_update_time
 
 class InvenioDataCacherError(Exception):
     """Error raised by data cacher."""
     pass
 
+CFG_DATACACHER_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class FileDataCacherBackend:
+    """
+    Shared cache backend storing serialized values in files of a
+    directory, so that all the processes of one host (e.g. Apache
+    mod_wsgi workers) can load the values built by any of them
+    instead of each rebuilding them.  Note that every process still
+    deserializes its own private copy of the values.  The timestamp
+    of a value is the modification time of its file.
+    """
+    def __init__(self, directory, max_entries=None):
+        """@param directory: where to store the cache files
+           @param max_entries: maximum number of values kept, the least
+                  recently written ones being removed first (None for
+                  no limit)"""
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def _get_filename(self, name):
+        """Return path of the file holding value NAME."""
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Return tuple (timestamp, value) stored under NAME, or None
+        if there is none."""
+        filename = self._get_filename(name)
+        try:
+            stream = open(filename, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                timestamp = time.strftime(CFG_DATACACHER_TIMESTAMP_FORMAT,
+                                          time.localtime(os.fstat(stream.fileno()).st_mtime))
+                return (timestamp, deserialize_shared_value(stream.read()))
+            except Exception:
+                # corrupted or incompatible file; ignore it:
+                return None
+        finally:
+            stream.close()
+
+    def set(self, name, value, timestamp):
+        """Store VALUE under NAME, with TIMESTAMP (e.g. the time when
+        the building of VALUE started)."""
+        tmpname = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmpname = tempfile.mkstemp(prefix='.' + name + '_', dir=self.directory)
+            stream = os.fdopen(fd, 'wb')
+            try:
+                stream.write(serialize_shared_value(value))
+            finally:
+                stream.close()
+            os.chmod(tmpname, 0644)
+            mtime = time.mktime(time.strptime(timestamp, CFG_DATACACHER_TIMESTAMP_FORMAT))
+            os.utime(tmpname, (mtime, mtime))
+            # atomic replace, so that readers never see partial files:
+            os.rename(tmpname, self._get_filename(name))
+        except Exception:
+            # the shared cache is an optimisation only; never fail
+            if tmpname is not None:
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
+            return
+        if self.max_entries is not None:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently written values beyond max_entries."""
+        try:
+            filenames = [filename for filename in os.listdir(self.directory)
+                         if not filename.startswith('.')]
+        except OSError:
+            return
+        if len(filenames) <= self.max_entries:
+            return
+        files = []
+        for filename in filenames:
+            try:
+                files.append((os.stat(self._get_filename(filename)).st_mtime, filename))
+            except OSError:
+                pass
+        files.sort()
+        for dummy, filename in files[:len(files) - self.max_entries]:
+            self.delete(filename)
+
+    def delete(self, name):
+        """Remove value stored under NAME."""
+        try:
+            os.remove(self._get_filename(name))
+        except OSError:
+            pass
+
+class MemcachedDataCacherBackend:
+    """
+    Shared cache backend storing values in memcached servers, which
+    evict the least recently used values themselves.  Note that
+    memcached refuses values bigger than its item size limit (1 MB by
+    default), which are then simply not shared.
+    """
+    def __init__(self, servers):
+        """@param servers: list of memcached servers, e.g. ['localhost:11211']"""
+        self.client = memcache.Client(servers)
+
+    def get(self, name):
+        """Return tuple (timestamp, value) stored under NAME, or None
+        if there is none."""
+        value = self.client.get(name)
+        if value is None:
+            return None
+        try:
+            return deserialize_shared_value(value)
+        except Exception:
+            return None
+
+    def set(self, name, value, timestamp):
+        """Store VALUE under NAME, with TIMESTAMP."""
+        self.client.set(name, serialize_shared_value((timestamp, value)))
+
+    def delete(self, name):
+        """Remove value stored under NAME."""
+        self.client.delete(name)
+
+def serialize_shared_value(value):
+    """Serialize VALUE for a shared cache backend.  Use marshal if
+    possible, since it is much faster to load, and cPickle otherwise
+    (e.g. for intbitsets)."""
+    try:
+        return 'M' + marshal.dumps(value)
+    except ValueError:
+        return 'P' + cPickle.dumps(value, -1)
+
+def deserialize_shared_value(data):
+    """Deserialize DATA serialized by serialize_shared_value()."""
+    if data[0] == 'M':
+        return marshal.loads(data[1:])
+    return cPickle.loads(data[1:])
+
+_SHARED_BACKENDS = {}
+
+def get_shared_backend(namespace='', max_entries=None):
+    """
+    Return the shared cache backend configured in
+    CFG_DATACACHER_SHARED_BACKEND, or None if the caches are private
+    to each process.  Values of different NAMESPACEs (e.g. the search
+    results) are stored apart, keeping at most MAX_ENTRIES of them
+    when the backend does not evict values by itself.
+    """
+    if not _SHARED_BACKENDS.has_key(namespace):
+        if CFG_DATACACHER_SHARED_BACKEND == 'file':
+            _SHARED_BACKENDS[namespace] = FileDataCacherBackend(
+                os.path.join(CFG_CACHEDIR, 'datacacher', namespace), max_entries)
+        elif CFG_DATACACHER_SHARED_BACKEND == 'memcached' and CFG_MEMCACHE_IMPORTABLE:
+            _SHARED_BACKENDS[namespace] = MemcachedDataCacherBackend(CFG_DATACACHER_MEMCACHED_SERVERS)
+        else:
+            _SHARED_BACKENDS[namespace] = None
+    return _SHARED_BACKENDS[namespace]
+
+class DataCacherWarmup:
+    """
+    Builds slow-to-build caches on a background thread, e.g. upon WSGI
+    application start-up, so that the first requests do not pay for
+    all of them.  Clients needing a cache that is still being built
+    can wait for it via wait().  When a shared backend is configured,
+    the warmup attaches even to outdated shared snapshots of the
+    caches, so that they are available immediately, and refreshes
+    them afterwards.  The time-to-ready of each cache is logged to
+    the standard error stream (i.e. to the web server error log).
+    """
+    def __init__(self):
+        """Initialise."""
+        self.jobs = [] # list of (name, function)
+        self.ready = {} # name -> threading.Event
+        self.stale_cachers = []
+        self.thread = None
+
+    def register(self, name, function):
+        """Register FUNCTION building the cache(s) called NAME."""
+        self.jobs.append((name, function))
+        self.ready[name] = threading.Event()
+
+    def start(self):
+        """Start building the registered caches on a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='DataCacherWarmup')
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def _run(self):
+        """Build the registered caches, then refresh the outdated ones."""
+        start_time = time.time()
+        for name, function in self.jobs:
+            job_start_time = time.time()
+            try:
+                try:
+                    function()
+                except Exception, err:
+                    print >> sys.stderr, "DataCacherWarmup: %s failed: %s" % (name, err)
+            finally:
+                self.ready[name].set()
+            print >> sys.stderr, "DataCacherWarmup: %s ready in %.3f s" % \
+                  (name, time.time() - job_start_time)
+        print >> sys.stderr, "DataCacherWarmup: all caches ready in %.3f s" % \
+              (time.time() - start_time)
+        while self.stale_cachers:
+            cacher = self.stale_cachers.pop()
+            try:
+                cacher.recreate_cache_if_needed()
+            except Exception, err:
+                print >> sys.stderr, "DataCacherWarmup: refreshing %s failed: %s" % \
+                      (cacher.__class__.__name__, err)
+
+    def in_warmup_thread_p(self):
+        """Are we running in the warmup thread?"""
+        return self.thread is not None and \
+               threading.currentThread() is self.thread
+
+    def wait(self, name, timeout=None):
+        """Wait until the cache(s) called NAME are built, if they are
+        being warmed up."""
+        event = self.ready.get(name)
+        if event is not None and self.thread is not None and \
+               not self.in_warmup_thread_p():
+            event.wait(timeout)
+
+    def add_stale_cacher(self, cacher):
+        """Remember CACHER, that was loaded from an outdated snapshot,
+        in order to refresh it once all the caches are warm."""
+        self.stale_cachers.append(cacher)
+
+    def log_ready(self, cacher, start_time, how):
+        """Log time-to-ready of CACHER, when warming up."""
+        if self.in_warmup_thread_p():
+            print >> sys.stderr, "DataCacherWarmup: %s ready (%s) in %.3f s" % \
+                  (cacher.__class__.__name__, how, time.time() - start_time)
+
+try:
+    datacacher_warmup.jobs
+except NameError:
+    datacacher_warmup = DataCacherWarmup()
+
+# marker used by DataCacher.refresh_delta() for keys that disappeared:
+DATACACHER_DELETED_KEY = ('__DATACACHER_DELETED_KEY__',)
+
 class DataCacher:
     """
     DataCacher is an abstract cacher system, for caching informations
@@ -38,11 +303,26 @@ class DataCacher:
     The .timestamp and .cache objects are exposed to clients.  Most
     use cases use a dict internal structure for .cache, but some use
     lists.
+
+    When the cache is outdated, it is rebuilt into a new object that
+    replaces the old one only once it is complete, so that the old
+    cache keeps serving meanwhile, and only one thread rebuilds it.
+    Cachers that are able to tell which keys changed since a given
+    time can implement refresh_delta() in order to reload only those
+    keys instead of rebuilding the whole cache.
+
+    If a shared name is given and a shared backend is configured via
+    CFG_DATACACHER_SHARED_BACKEND, the cache is shared among the
+    processes: a process attaches to an up-to-date cache built by
+    another one instead of calling the cache filler itself.  (Clients
+    altering the cache on the fly should therefore not be shared.)
     """
-    def __init__(self, cache_filler, timestamp_verifier):
+    def __init__(self, cache_filler, timestamp_verifier, shared_name=None):
         """ @param cache_filler: a function that fills the cache dictionary.
             @param timestamp_verifier: a function that returns a timestamp for
                    checking if something has changed after cache creation.
+            @param shared_name: the name under which the cache is shared
+                   among processes, or None for a private cache.
         """
         self.timestamp = 0 # WARNING: may be exposed to clients
         self.cache = {} # WARNING: may be exposed to clients; lazy
@@ -53,6 +333,8 @@ class DataCacher:
         if not callable(timestamp_verifier):
             raise InvenioDataCacherError, "timestamp_verifier is not callable"
         self.timestamp_verifier = timestamp_verifier
+        self.shared_name = shared_name
+        self.refresh_lock = threading.Lock()
         self.is_ok_p = True
         self.create_cache()
 
@@ -64,21 +346,91 @@ class DataCacher:
         """
         Create and populate cache by calling cache filler.  Called on
         startup and used later during runtime as needed by clients.
+        The new cache replaces the old one only once it is complete.
+        """
+        start_time = time.time()
+        backend = None
+        if self.shared_name:
+            backend = get_shared_backend()
+        if backend:
+            # attach to the shared cache if it is up-to-date, or even
+            # if it is outdated during warmup, when it gets refreshed
+            # in the background afterwards:
+            shared = backend.get(self.shared_name)
+            if shared is not None:
+                stale = shared[0] < self.timestamp_verifier()
+                if not stale or datacacher_warmup.in_warmup_thread_p():
+                    timestamp, cache = shared
+                    self.complete_cache(cache)
+                    self.cache = cache
+                    self.timestamp = timestamp
+                    if stale:
+                        datacacher_warmup.add_stale_cacher(self)
+                    datacacher_warmup.log_ready(self, start_time, stale and 'stale snapshot' or 'snapshot')
+                    return
+
+        timestamp = time.strftime(CFG_DATACACHER_TIMESTAMP_FORMAT, time.localtime())
+        cache = self.cache_filler()
+        if backend:
+            backend.set(self.shared_name, cache, timestamp)
+        self.complete_cache(cache)
+        self.cache = cache
+        self.timestamp = timestamp
+        datacacher_warmup.log_ready(self, start_time, 'built')
+
+    def complete_cache(self, cache):
+        """
+        Hook to add to a freshly built CACHE some derived data that
+        should not be shared among processes, before it is installed.
+        Does nothing by default.
+        """
+        pass
+
+    def refresh_delta(self, since_timestamp):
+        """
+        Return the changes of the cache since SINCE_TIMESTAMP, as a
+        dictionary of {key: new value} of the changed keys, where the
+        keys that disappeared have DATACACHER_DELETED_KEY as value.
+        Return None if the changes cannot be computed, in which case
+        the whole cache is rebuilt.  Returns None by default; to be
+        overridden by dictionary-based cachers that can do better.
         """
-        # We empty the cache first to force freeing of the variable
-        # this is useful when it is really big like our citations dictionary
-        self.cache = None
+        return None
 
-        self.cache = self.cache_filler()
-        self.timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    def refresh_cache(self):
+        """
+        Bring the cache up-to-date, incrementally via refresh_delta()
+        if possible, or by rebuilding it otherwise.
+        """
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        delta = None
+        if self.cache is not None:
+            delta = self.refresh_delta(self.timestamp)
+        if delta is None:
+            self.create_cache()
+            return
+        cache = dict(self.cache)
+        for key, value in delta.iteritems():
+            if value is DATACACHER_DELETED_KEY:
+                cache.pop(key, None)
+            else:
+                cache[key] = value
+        self.cache = cache
+        self.timestamp = timestamp
 
     def recreate_cache_if_needed(self):
         """
         Recreate cache if needed, by verifying the cache timestamp
-        against the timestamp verifier function.
+        against the timestamp verifier function.  If another thread
+        is already refreshing the cache, keep serving the old one.
         """
         if self.timestamp_verifier() > self.timestamp:
-            self.create_cache()
+            if not self.refresh_lock.acquire(False):
+                return
+            try:
+                self.refresh_cache()
+            finally:
+                self.refresh_lock.release()
 
 class SQLDataCacher(DataCacher):
     """
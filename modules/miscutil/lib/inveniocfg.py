@@ -181,7 +181,8 @@ Please, update your invenio-local.conf file accordingly.""" % (option_name, new_
                        'CFG_OPENID_CONFIGURATIONS',
                        'CFG_OAUTH1_CONFIGURATIONS',
                        'CFG_OAUTH2_CONFIGURATIONS',
-                       'CFG_BIBDOCFILE_ADDITIONAL_KNOWN_MIMETYPES',]:
+                       'CFG_BIBDOCFILE_ADDITIONAL_KNOWN_MIMETYPES',
+                       'CFG_DATACACHER_MEMCACHED_SERVERS',]:
         try:
             option_value = option_value[1:-1]
         except TypeError:
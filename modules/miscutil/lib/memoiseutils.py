@@ -38,3 +38,141 @@ class Memoise:
         if args not in self.memo:
             self.memo[args] = self.function(*args)
         return self.memo[args]
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by a total size budget.
+
+    The size of each stored value is measured by the SIZEOF function
+    (by default every value counts as 1, so that MAX_SIZE is simply
+    the maximum number of entries).  The number of entries may be
+    further limited by MAX_ENTRIES.  When the budget is exceeded, the
+    least recently used entries are evicted.  Hit and miss counters
+    are kept for statistics.
+
+    Usage: cache = LRUCache(1024 * 1024, sizeof=len)
+           cache.set('foo', 'bar')
+           cache.get('foo') # -> 'bar'
+    """
+
+    # positions of fields in the linked list nodes:
+    _PREV, _NEXT, _KEY, _VALUE, _SIZE = 0, 1, 2, 3, 4
+
+    def __init__(self, max_size, sizeof=None, max_entries=None):
+        """Initialise.
+        @param max_size: total size budget of the cache
+        @param sizeof: function returning the size of a value
+        @param max_entries: maximum number of entries (None for no limit)
+        """
+        self.max_size = max_size
+        self.max_entries = max_entries
+        if sizeof is None:
+            sizeof = lambda value: 1
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clear()
+
+    def clear(self):
+        """Remove all entries from the cache, keeping the statistics."""
+        self.size = 0
+        self._nodes = {}
+        # circular doubly linked list, most recently used first:
+        self._root = [None, None, None, None, 0]
+        self._root[self._PREV] = self._root
+        self._root[self._NEXT] = self._root
+
+    def _unlink(self, node):
+        """Remove NODE from the linked list."""
+        node[self._PREV][self._NEXT] = node[self._NEXT]
+        node[self._NEXT][self._PREV] = node[self._PREV]
+
+    def _link_first(self, node):
+        """Insert NODE at the head of the linked list."""
+        first = self._root[self._NEXT]
+        node[self._PREV] = self._root
+        node[self._NEXT] = first
+        first[self._PREV] = node
+        self._root[self._NEXT] = node
+
+    def get(self, key, default=None):
+        """Return value stored under KEY, or DEFAULT if there is none."""
+        node = self._nodes.get(key)
+        if node is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._unlink(node)
+        self._link_first(node)
+        return node[self._VALUE]
+
+    def set(self, key, value):
+        """Store VALUE under KEY, evicting old entries if needed.
+        Values bigger than the whole budget are not stored at all."""
+        self.delete(key)
+        size = self.sizeof(value)
+        if size > self.max_size or self.max_entries == 0:
+            return
+        while self.size + size > self.max_size or \
+                  (self.max_entries is not None and \
+                   len(self._nodes) >= self.max_entries):
+            last = self._root[self._PREV]
+            self.delete(last[self._KEY])
+            self.evictions += 1
+        node = [None, None, key, value, size]
+        self._link_first(node)
+        self._nodes[key] = node
+        self.size += size
+
+    def delete(self, key):
+        """Remove KEY from the cache, if present."""
+        node = self._nodes.pop(key, None)
+        if node is not None:
+            self._unlink(node)
+            self.size -= node[self._SIZE]
+
+    def invalidate(self, predicate):
+        """Remove all entries whose key satisfies PREDICATE."""
+        for key in [key for key in self._nodes if predicate(key)]:
+            self.delete(key)
+
+    def keys(self):
+        """Return list of keys, most recently used first."""
+        out = []
+        node = self._root[self._NEXT]
+        while node is not self._root:
+            out.append(node[self._KEY])
+            node = node[self._NEXT]
+        return out
+
+    def items(self):
+        """Return list of (key, value) pairs, most recently used first.
+        Does not count as cache usage."""
+        out = []
+        node = self._root[self._NEXT]
+        while node is not self._root:
+            out.append((node[self._KEY], node[self._VALUE]))
+            node = node[self._NEXT]
+        return out
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get_stats(self):
+        """Return dictionary with usage statistics of the cache."""
+        lookups = self.hits + self.misses
+        hit_rate = 0.0
+        if lookups:
+            hit_rate = float(self.hits) / lookups
+        return {'entries': len(self._nodes),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': hit_rate}
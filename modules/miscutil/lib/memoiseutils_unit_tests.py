@@ -24,7 +24,7 @@ Unit tests for the memoise facility.
 import unittest
 from invenio.testutils import make_test_suite, run_test_suite
 
-from invenio.memoiseutils import Memoise
+from invenio.memoiseutils import Memoise, LRUCache
 
 
 class MemoiseTest(unittest.TestCase):
@@ -36,7 +36,61 @@ class MemoiseTest(unittest.TestCase):
         fib_memoised = Memoise(fib)
         self.assertEqual(fib(17), fib_memoised(17))
 
-TEST_SUITE = make_test_suite(MemoiseTest, )
+
+class LRUCacheTest(unittest.TestCase):
+    """Unit test cases for LRUCache."""
+
+    def test_lru_cache_get_set(self):
+        """memoiseutils - LRU cache get and set"""
+        cache = LRUCache(10)
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """memoiseutils - LRU cache evicts least recently used entry"""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(['c', 'a'], cache.keys())
+        self.assertEqual(1, cache.evictions)
+
+    def test_lru_cache_size_budget(self):
+        """memoiseutils - LRU cache respects size budget"""
+        cache = LRUCache(10, sizeof=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.set('c', 'xxxx')
+        self.assertEqual(8, cache.size)
+        self.assertEqual(False, 'a' in cache)
+        cache.set('d', 'x' * 11)
+        self.assertEqual(False, 'd' in cache)
+
+    def test_lru_cache_max_entries(self):
+        """memoiseutils - LRU cache respects maximum number of entries"""
+        cache = LRUCache(100, sizeof=len, max_entries=2)
+        cache.set('a', 'x')
+        cache.set('b', 'x')
+        cache.set('c', 'x')
+        self.assertEqual(['c', 'b'], cache.keys())
+        cache = LRUCache(100, max_entries=0)
+        cache.set('a', 'x')
+        self.assertEqual(0, len(cache))
+
+    def test_lru_cache_invalidate(self):
+        """memoiseutils - LRU cache invalidation by key predicate"""
+        cache = LRUCache(10)
+        cache.set(('idxWORD01F', 'ellis'), 1)
+        cache.set(('idxWORD02F', 'ellis'), 2)
+        cache.invalidate(lambda key: key[0] == 'idxWORD01F')
+        self.assertEqual([('idxWORD02F', 'ellis')], cache.keys())
+        self.assertEqual(1, cache.size)
+
+TEST_SUITE = make_test_suite(MemoiseTest, LRUCacheTest, )
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+from invenio.dbquery import run_sql
+from invenio.intbitset import intbitset
+
+depends_on = ['invenio_release_1_1_0']
+
+def _get_index_tables():
+    """Return names of all existing idxWORD, idxPAIR and idxPHRASE
+    forward tables."""
+    tables = []
+    for (index_id,) in run_sql("SELECT id FROM idxINDEX"):
+        for table_type in ('WORD', 'PAIR', 'PHRASE'):
+            table = "idx%s%02dF" % (table_type, index_id)
+            if run_sql("SHOW TABLES LIKE %s", (table,)):
+                tables.append(table)
+    return tables
+
+def info():
+    return "Introduces df column with number of hits of index terms"
+
+def do_upgrade():
+    """ Implement your upgrades here  """
+    for table in _get_index_tables():
+        if not run_sql("SHOW COLUMNS FROM %s LIKE 'df'" % table):
+            run_sql("ALTER TABLE %s ADD COLUMN df mediumint(9) unsigned default NULL AFTER hitlist" % table)
+        # compute the number of hits of the already indexed terms:
+        last_id = 0
+        while True:
+            res = run_sql("SELECT id, hitlist FROM %s WHERE id>%%s AND df IS NULL ORDER BY id LIMIT 1000" % table,
+                          (last_id,))
+            if not res:
+                break
+            for term_id, hitlist in res:
+                run_sql("UPDATE %s SET df=%%s WHERE id=%%s" % table,
+                        (len(intbitset(hitlist)), term_id))
+            last_id = res[-1][0]
+
+def estimate():
+    """  Estimate running time of upgrade in seconds (optional). """
+    count_terms = 0
+    for table in _get_index_tables():
+        count_terms += run_sql("SELECT COUNT(*) FROM %s" % table)[0][0]
+    return 1 + count_terms / 5000
+
+def pre_upgrade():
+    """  Run pre-upgrade checks (optional). """
+    pass
+
+
+def post_upgrade():
+    """  Run post-upgrade checks (optional). """
+    pass
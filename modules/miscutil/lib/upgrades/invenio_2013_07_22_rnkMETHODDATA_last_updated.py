@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+from invenio.dbquery import run_sql
+
+depends_on = ['invenio_release_1_1_0']
+
+def info():
+    return "Introduces rnkMETHODDATA last_updated column"
+
+def do_upgrade():
+    """ Implement your upgrades here  """
+    if not run_sql("SHOW COLUMNS FROM rnkMETHODDATA LIKE 'last_updated'"):
+        run_sql("""ALTER TABLE rnkMETHODDATA ADD COLUMN last_updated datetime
+                   NOT NULL default '0000-00-00' AFTER relevance_data""")
+    # the existing data are as recent as their rank method:
+    run_sql("""UPDATE rnkMETHODDATA, rnkMETHOD SET rnkMETHODDATA.last_updated=rnkMETHOD.last_updated
+               WHERE rnkMETHODDATA.id_rnkMETHOD=rnkMETHOD.id""")
+
+def estimate():
+    """  Estimate running time of upgrade in seconds (optional). """
+    return 1
+
+def pre_upgrade():
+    """  Run pre-upgrade checks (optional). """
+    pass
+
+
+def post_upgrade():
+    """  Run post-upgrade checks (optional). """
+    pass
@@ -200,6 +200,7 @@ TRUNCATE bibrec_bib97x;
 TRUNCATE bibrec_bib98x;
 TRUNCATE bibrec_bib99x;
 TRUNCATE bibfmt;
+TRUNCATE bibfmtELEMENTCACHE;
 TRUNCATE idxWORD01F;
 TRUNCATE idxWORD02F;
 TRUNCATE idxWORD03F;
@@ -316,6 +317,7 @@ TRUNCATE idxPHRASE18R;
 TRUNCATE idxPHRASE19R;
 TRUNCATE rnkMETHODDATA;
 TRUNCATE rnkCITATIONDATA;
+TRUNCATE rnkCITATIONLOG;
 TRUNCATE rnkCITATIONDATAEXT;
 TRUNCATE rnkAUTHORDATA;
 TRUNCATE rnkRECORDSCACHE;
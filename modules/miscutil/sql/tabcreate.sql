@@ -1739,6 +1739,14 @@ CREATE TABLE IF NOT EXISTS bibfmt (
   KEY last_updated (last_updated)
 ) ENGINE=MyISAM;
 
+CREATE TABLE IF NOT EXISTS bibfmtELEMENTCACHE (
+  id_bibrec int(8) unsigned NOT NULL default '0',
+  cache_key char(32) NOT NULL default '',
+  version char(32) NOT NULL default '',
+  value longblob,
+  PRIMARY KEY  (id_bibrec, cache_key)
+) ENGINE=MyISAM;
+
 -- tables for index files:
 
 CREATE TABLE IF NOT EXISTS idxINDEX (
@@ -1774,6 +1782,7 @@ CREATE TABLE IF NOT EXISTS idxWORD01F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1789,6 +1798,7 @@ CREATE TABLE IF NOT EXISTS idxWORD02F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1804,6 +1814,7 @@ CREATE TABLE IF NOT EXISTS idxWORD03F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1819,6 +1830,7 @@ CREATE TABLE IF NOT EXISTS idxWORD04F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1834,6 +1846,7 @@ CREATE TABLE IF NOT EXISTS idxWORD05F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1849,6 +1862,7 @@ CREATE TABLE IF NOT EXISTS idxWORD06F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1864,6 +1878,7 @@ CREATE TABLE IF NOT EXISTS idxWORD07F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1879,6 +1894,7 @@ CREATE TABLE IF NOT EXISTS idxWORD08F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1894,6 +1910,7 @@ CREATE TABLE IF NOT EXISTS idxWORD09F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1909,6 +1926,7 @@ CREATE TABLE IF NOT EXISTS idxWORD10F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1924,6 +1942,7 @@ CREATE TABLE IF NOT EXISTS idxWORD11F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1939,6 +1958,7 @@ CREATE TABLE IF NOT EXISTS idxWORD12F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1954,6 +1974,7 @@ CREATE TABLE IF NOT EXISTS idxWORD13F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1969,6 +1990,7 @@ CREATE TABLE IF NOT EXISTS idxWORD14F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1984,6 +2006,7 @@ CREATE TABLE IF NOT EXISTS idxWORD15F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -1999,6 +2022,7 @@ CREATE TABLE IF NOT EXISTS idxWORD16F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2014,6 +2038,7 @@ CREATE TABLE IF NOT EXISTS idxWORD17F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2029,6 +2054,7 @@ CREATE TABLE IF NOT EXISTS idxWORD18F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2044,6 +2070,7 @@ CREATE TABLE IF NOT EXISTS idxWORD19F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(50) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2059,6 +2086,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR01F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2074,6 +2102,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR02F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2089,6 +2118,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR03F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2104,6 +2134,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR04F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2119,6 +2150,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR05F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2134,6 +2166,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR06F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2149,6 +2182,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR07F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2164,6 +2198,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR08F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2179,6 +2214,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR09F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2194,6 +2230,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR10F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2209,6 +2246,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR11F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2224,6 +2262,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR12F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2239,6 +2278,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR13F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2254,6 +2294,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR14F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2269,6 +2310,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR15F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2284,6 +2326,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR16F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2299,6 +2342,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR17F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2314,6 +2358,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR18F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2329,6 +2374,7 @@ CREATE TABLE IF NOT EXISTS idxPAIR19F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term varchar(100) default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   UNIQUE KEY term (term)
 ) ENGINE=MyISAM;
@@ -2344,6 +2390,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE01F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2359,6 +2406,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE02F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2374,6 +2422,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE03F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2389,6 +2438,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE04F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2404,6 +2454,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE05F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2419,6 +2470,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE06F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2434,6 +2486,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE07F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2449,6 +2502,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE08F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2464,6 +2518,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE09F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2479,6 +2534,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE10F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2494,6 +2550,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE11F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2509,6 +2566,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE12F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2524,6 +2582,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE13F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2539,6 +2598,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE14F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2554,6 +2614,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE15F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2569,6 +2630,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE16F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2584,6 +2646,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE17F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2599,6 +2662,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE18F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2614,6 +2678,7 @@ CREATE TABLE IF NOT EXISTS idxPHRASE19F (
   id mediumint(9) unsigned NOT NULL auto_increment,
   term text default NULL,
   hitlist longblob,
+  df mediumint(9) unsigned default NULL,
   PRIMARY KEY  (id),
   KEY term (term(50))
 ) ENGINE=MyISAM;
@@ -2646,6 +2711,7 @@ CREATE TABLE IF NOT EXISTS rnkMETHODNAME (
 CREATE TABLE IF NOT EXISTS rnkMETHODDATA (
   id_rnkMETHOD mediumint(9) unsigned NOT NULL,
   relevance_data longblob,
+  last_updated datetime NOT NULL default '0000-00-00',
   PRIMARY KEY  (id_rnkMETHOD)
 ) ENGINE=MyISAM;
 
@@ -2710,6 +2776,20 @@ CREATE TABLE IF NOT EXISTS rnkCITATIONDATA (
   UNIQUE KEY object_name (object_name)
 ) ENGINE=MyISAM;
 
+-- a log of the changes of the citation dictionaries since they were
+-- last stored in rnkCITATIONDATA. object_value is the new list of
+-- recids associated to id_bibrec, or NULL if there is none anymore.
+
+CREATE TABLE IF NOT EXISTS rnkCITATIONLOG (
+  id int(15) unsigned NOT NULL auto_increment,
+  object_name varchar(255) NOT NULL,
+  id_bibrec mediumint(8) unsigned NOT NULL,
+  object_value longblob,
+  action_date datetime NOT NULL default '0000-00-00',
+  PRIMARY KEY id (id),
+  KEY object_name (object_name)
+) ENGINE=MyISAM;
+
 -- a table for missing citations. This should be scanned by a program
 -- occasionally to check if some publication has been cited more than
 -- 50 times (or such), and alert cataloguers to create record for that
@@ -219,6 +219,7 @@ DROP TABLE IF EXISTS bibrec_bib97x;
 DROP TABLE IF EXISTS bibrec_bib98x;
 DROP TABLE IF EXISTS bibrec_bib99x;
 DROP TABLE IF EXISTS bibfmt;
+DROP TABLE IF EXISTS bibfmtELEMENTCACHE;
 DROP TABLE IF EXISTS idxINDEX;
 DROP TABLE IF EXISTS idxINDEXNAME;
 DROP TABLE IF EXISTS idxINDEX_field;
@@ -344,6 +345,7 @@ DROP TABLE IF EXISTS rnkWORD01R;
 DROP TABLE IF EXISTS rnkPAGEVIEWS;
 DROP TABLE IF EXISTS rnkDOWNLOADS;
 DROP TABLE IF EXISTS rnkCITATIONDATA;
+DROP TABLE IF EXISTS rnkCITATIONLOG;
 DROP TABLE IF EXISTS rnkCITATIONDATAEXT;
 DROP TABLE IF EXISTS rnkCITATIONDATAERR;
 DROP TABLE IF EXISTS rnkAUTHORDATA;
@@ -37,7 +37,12 @@ import urllib
 import urlparse
 import zlib
 import sys
+import itertools
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
 try:
     ## import optional module:
     import numpy
@@ -61,6 +66,10 @@ from invenio.config import \
      CFG_WEBSEARCH_FIELDS_CONVERT, \
      CFG_WEBSEARCH_NB_RECORDS_TO_SORT, \
      CFG_WEBSEARCH_SEARCH_CACHE_SIZE, \
+     CFG_WEBSEARCH_SEARCH_CACHE_MAX_BYTES, \
+     CFG_WEBSEARCH_HITLIST_CACHE_SIZE, \
+     CFG_WEBSEARCH_SEARCH_UNIT_NBHITS_CACHE_SIZE, \
+     CFG_WEBSEARCH_TERM_DICTIONARY, \
      CFG_WEBSEARCH_USE_MATHJAX_FOR_FORMATS, \
      CFG_WEBSEARCH_USE_ALEPH_SYSNOS, \
      CFG_WEBSEARCH_DEF_RECORDS_IN_GROUPS, \
@@ -99,11 +108,15 @@ from invenio.bibindex_engine_tokenizer import wash_author_name, author_name_requ
      BibIndexPairTokenizer
 from invenio.bibindex_engine_washer import wash_index_term, lower_index_term, wash_author_name
 from invenio.bibindexadminlib import get_idx_indexer
-from invenio.bibformat import format_record, format_records, get_output_format_content_type, create_excel
+from invenio.bibformat import format_record, format_records, get_output_format_content_type, create_excel, \
+     get_prefetched_records_data
 from invenio.bibformat_config import CFG_BIBFORMAT_USE_OLD_BIBFORMAT
 from invenio.bibrank_downloads_grapher import create_download_history_graph_and_box
 from invenio.bibknowledge import get_kbr_values
-from invenio.data_cacher import DataCacher
+from invenio.data_cacher import DataCacher, DATACACHER_DELETED_KEY, \
+     get_shared_backend
+from invenio.memoiseutils import LRUCache
+from invenio.search_engine_term_dictionary import FrontCodedTermList, fold_term
 from invenio.websearch_external_collections import print_external_results_overview, perform_external_collection_search
 from invenio.access_control_admin import acc_get_action_id
 from invenio.access_control_config import VIEWRESTRCOLL, \
@@ -197,6 +210,14 @@ EM_REPOSITORY={"body" : "B",
                "rt_portalbox" : "Prt"};
 
 class RestrictedCollectionDataCacher(DataCacher):
+    """
+    Caches the list of the names of the restricted collections.
+
+    There is no refresh_delta(): the authorization rows have no
+    modification time telling which collections changed, so that any
+    delta would run the very query of the cache filler, which returns
+    a handful of names anyway.
+    """
     def __init__(self):
         def cache_filler():
             ret = []
@@ -214,7 +235,8 @@ class RestrictedCollectionDataCacher(DataCacher):
         def timestamp_verifier():
             return max(get_table_update_time('accROLE_accACTION_accARGUMENT'), get_table_update_time('accARGUMENT'))
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            shared_name='restricted_collections')
 
 def collection_restricted_p(collection, recreate_cache_if_needed=True):
     if recreate_cache_if_needed:
@@ -428,8 +450,13 @@ class CollectionRecListDataCacher(DataCacher):
     """
     Provides cache for collection reclist hitsets.  This class is not
     to be used directly; use function get_collection_reclist() instead.
+
+    When the collection table changes, only the reclists that really
+    changed are dropped from the cache (to be reloaded lazily), which
+    is detected via the checksums of the loaded reclists.
     """
     def __init__(self):
+        self.reclist_checksums = {} # checksums of the loaded reclists
         def cache_filler():
             ret = {}
             try:
@@ -446,6 +473,32 @@ class CollectionRecListDataCacher(DataCacher):
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
+    def refresh_delta(self, since_timestamp):
+        """
+        Return the collections that were added or removed since
+        SINCE_TIMESTAMP and the ones whose reclist changed, so that
+        their reclists are reloaded lazily.
+        """
+        try:
+            res = run_sql("SELECT name, MD5(reclist) FROM collection")
+        except Exception:
+            # database problems, rebuild the whole cache later
+            return None
+        delta = {}
+        names = {}
+        for name, checksum in res:
+            names[name] = 1
+            if name not in self.cache:
+                delta[name] = None
+            elif self.cache[name] is not None and \
+                     self.reclist_checksums.get(name) != checksum:
+                delta[name] = None
+        for name in self.cache:
+            if name not in names:
+                delta[name] = DATACACHER_DELETED_KEY
+                self.reclist_checksums.pop(name, None)
+        return delta
+
 try:
     if not collection_reclist_cache.is_ok_p:
         raise Exception
@@ -462,14 +515,16 @@ def get_collection_reclist(coll, recreate_cache_if_needed=True):
         # collection's reclist not in the cache yet, so calculate it
         # and fill the cache:
         reclist = intbitset()
-        query = "SELECT nbrecs,reclist FROM collection WHERE name=%s"
+        query = "SELECT nbrecs,reclist,MD5(reclist) FROM collection WHERE name=%s"
         res = run_sql(query, (coll, ), 1)
         if res:
             try:
                 reclist = intbitset(res[0][1])
             except:
                 pass
+            collection_reclist_cache.reclist_checksums[coll] = res[0][2]
         collection_reclist_cache.cache[coll] = reclist
+        search_results_cache.update_collection_reclist(coll, reclist)
     # finally, return reclist:
     return collection_reclist_cache.cache[coll]
 
@@ -498,19 +553,74 @@ def get_available_output_formats(visible_only=False):
                        })
     return formats
 
-class SearchResultsCache(DataCacher):
+class SearchResultsCache(LRUCache):
     """
     Provides temporary lazy cache for Search Results.
     Useful when users click on `next page'.
+
+    The cache keys are tuples (p, f, colls_to_search, wl) and the
+    values are the hitsets found in any collection.  The cache holds
+    at most CFG_WEBSEARCH_SEARCH_CACHE_SIZE queries, whose hitsets
+    take at most CFG_WEBSEARCH_SEARCH_CACHE_MAX_BYTES bytes in
+    memory; the least recently used queries are evicted first.
+    Queries searching in a collection are invalidated whenever the
+    reclist of the collection changes, e.g. after a webcoll run.
+
+    If a shared backend is configured (CFG_DATACACHER_SHARED_BACKEND),
+    the results are also shared with the other processes, so that a
+    query run by one of them is not run again by another one.  The
+    shared results are valid until the collection table is updated.
     """
     def __init__(self):
-        def cache_filler():
-            return {}
-        def timestamp_verifier():
-            return '1970-01-01 00:00:00' # lazy cache is always okay;
-                                         # its filling is governed by
-                                         # CFG_WEBSEARCH_SEARCH_CACHE_SIZE
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        LRUCache.__init__(self, CFG_WEBSEARCH_SEARCH_CACHE_MAX_BYTES or sys.maxint,
+                          sizeof=get_hitset_allocated_size,
+                          max_entries=CFG_WEBSEARCH_SEARCH_CACHE_SIZE)
+        self.collection_reclists = {}
+        self.shared_backend = get_shared_backend('search_results',
+                                                 CFG_WEBSEARCH_SEARCH_CACHE_SIZE)
+        self.shared_hits = 0
+        self.is_ok_p = True
+
+    def get_shared_name(self, key):
+        """Return name under which results of query KEY are shared."""
+        return 'search_results_' + md5(repr(key)).hexdigest()
+
+    def get(self, key, default=None):
+        """Return results of query KEY, looking into the shared cache
+        if they are not cached locally."""
+        value = LRUCache.get(self, key)
+        if value is None and self.shared_backend and CFG_WEBSEARCH_SEARCH_CACHE_SIZE:
+            shared = self.shared_backend.get(self.get_shared_name(key))
+            if shared is not None and shared[0] >= collection_reclist_cache.timestamp:
+                value = intbitset(shared[1])
+                LRUCache.set(self, key, value)
+                self.shared_hits += 1
+        if value is None:
+            return default
+        return value
+
+    def set(self, key, value):
+        """Store results VALUE of query KEY, sharing them if possible."""
+        LRUCache.set(self, key, value)
+        if self.shared_backend:
+            self.shared_backend.set(self.get_shared_name(key), value.fastdump(),
+                                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+
+    def invalidate_collection(self, coll):
+        """Remove all cached queries that searched in collection COLL."""
+        self.invalidate(lambda key: coll in key[2])
+
+    def update_collection_reclist(self, coll, reclist):
+        """Remember RECLIST of collection COLL and invalidate cached
+        queries that searched in COLL if its reclist has changed."""
+        old_reclist = self.collection_reclists.get(coll)
+        if old_reclist is not None and old_reclist != reclist:
+            self.invalidate_collection(coll)
+        self.collection_reclists[coll] = reclist
+
+def get_hitset_allocated_size(hitset):
+    """Return number of bytes allocated for the bitset of HITSET."""
+    return hitset.get_allocated() * hitset.get_wordbytsize()
 
 try:
     if not search_results_cache.is_ok_p:
@@ -518,6 +628,83 @@ try:
 except Exception:
     search_results_cache = SearchResultsCache()
 
+def get_hitset_memory_size(value):
+    """Return number of bytes taken by the hitset stored in the hitlist
+    cache entry VALUE, that is a tuple (last_updated, hitset)."""
+    return get_hitset_allocated_size(value[1])
+
+try:
+    hitlist_cache.max_size
+except Exception:
+    hitlist_cache = LRUCache(CFG_WEBSEARCH_HITLIST_CACHE_SIZE, sizeof=get_hitset_memory_size)
+
+try:
+    search_unit_nbhits_cache.max_size
+except Exception:
+    search_unit_nbhits_cache = LRUCache(CFG_WEBSEARCH_SEARCH_UNIT_NBHITS_CACHE_SIZE)
+
+class IndexTermDictionaryDataCacher(DataCacher):
+    """
+    Provides the sorted list of the terms of the word index table
+    TABLE, folded like the collation of the table does.  This class is
+    not to be used directly; use function get_index_term_dictionary()
+    instead.
+    """
+    def __init__(self, table):
+        def cache_filler():
+            terms = {}
+            for (term,) in run_sql("SELECT term FROM %s" % table): # kwalitee: disable=sql
+                terms[fold_term(term)] = 1
+            terms = terms.keys()
+            terms.sort()
+            return FrontCodedTermList(terms)
+
+        def timestamp_verifier():
+            return get_table_update_time(table)
+
+        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+
+try:
+    index_term_dictionaries.keys
+except Exception:
+    index_term_dictionaries = {}
+
+def get_index_term_dictionary(table):
+    """Return the up-to-date FrontCodedTermList of the folded terms of
+    the word index table TABLE, loading it on first use."""
+    try:
+        term_dictionary = index_term_dictionaries[table]
+        term_dictionary.recreate_cache_if_needed()
+    except KeyError:
+        term_dictionary = IndexTermDictionaryDataCacher(table)
+        index_term_dictionaries[table] = term_dictionary
+    return term_dictionary.cache
+
+def get_index_last_updated(index_id):
+    """Return last updated time of index INDEX_ID."""
+    res = run_sql("SELECT last_updated FROM idxINDEX WHERE id=%s", (index_id,))
+    if res:
+        return res[0][0]
+    return None
+
+def get_cached_hitset(key, last_updated):
+    """
+    Return hitset stored under KEY in the hitlist cache, or None if it
+    is not cached or if the index was updated since, i.e. if the index
+    LAST_UPDATED time differs from the cached one.  KEY is a tuple of
+    the form (index table, washed term(s), match type, wildcard
+    limit).  The returned hitset is a copy, so the caller may modify
+    it freely.
+    """
+    value = hitlist_cache.get(key)
+    if value is None:
+        return None
+    if value[0] != last_updated:
+        # the index was updated, so drop all its cached terms:
+        hitlist_cache.invalidate(lambda cached_key: cached_key[0] == key[0])
+        return None
+    return intbitset(value[1])
+
 class CollectionI18nNameDataCacher(DataCacher):
     """
     Provides cache for I18N collection names.  This class is not to be
@@ -541,7 +728,8 @@ class CollectionI18nNameDataCacher(DataCacher):
         def timestamp_verifier():
             return get_table_update_time('collectionname')
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            shared_name='collection_i18nnames')
 
 try:
     if not collection_i18nname_cache.is_ok_p:
@@ -598,7 +786,8 @@ class FieldI18nNameDataCacher(DataCacher):
         def timestamp_verifier():
             return get_table_update_time('fieldname')
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            shared_name='field_i18nnames')
 
 try:
     if not field_i18nname_cache.is_ok_p:
@@ -1797,7 +1986,8 @@ class CollectionAllChildrenDataCacher(DataCacher):
         def timestamp_verifier():
             return max(get_table_update_time('collection'), get_table_update_time('collection_collection'))
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            shared_name='collection_allchildren')
 
 try:
     if not collection_allchildren_cache.is_ok_p:
@@ -1931,6 +2121,79 @@ def browse_in_bibwords(req, p, f, ln=CFG_SITE_LANG):
     ))
     return
 
+def get_search_unit_type_rank(p, f, m):
+    """Return the expected selectivity rank of the basic search unit
+       (p,f,m) judging from its search type only, from 0 (one record
+       expected) to 4 (many records expected)."""
+    if f == 'recid':
+        return 0
+    if f in ('refersto', 'citedby', 'fulltext') or m == 'r' or \
+       p.startswith('%') or '*' in p or '->' in p:
+        return 4
+    if m == 'a':
+        return 1
+    if f and f != 'anyfield':
+        return 2
+    return 3
+
+def estimate_search_unit_nbhits(p, f, m):
+    """Return the number of hits the basic search unit (p,f,m) gave
+       recently, or the number of hits of its word in the word index,
+       or None if it is not known."""
+    nbhits = search_unit_nbhits_cache.get((p, f, m))
+    if nbhits is not None:
+        return nbhits
+    if m != 'w' or f in ('journal', 'authorcount', 'fulltext') or \
+       CFG_WEBSEARCH_SYNONYM_KBRS.has_key(f) or \
+       '*' in p or '%' in p or '->' in p:
+        return None
+    index_id = get_index_id_from_field(f or 'anyfield')
+    if not index_id:
+        return None
+    word = re_word.sub('', p)
+    stemming_language = get_index_stemming_language(index_id)
+    if stemming_language:
+        word = stem(lower_index_term(word), stemming_language)
+    word = wash_index_term(word)
+    if not word:
+        return None
+    # a word not found may still match after being washed differently
+    # by the search, so do not trust zero:
+    return get_index_term_nbhits("idxWORD%02dF" % index_id, word) or None
+
+def create_basic_search_units_plan(basic_search_units):
+    """Return a tuple (plan, plan_nbhits, short_circuit_p) describing
+       in which order the basic search units are to be evaluated.
+
+       'plan' is the list of indexes into 'basic_search_units'.  If
+       all the units are joined by AND or AND NOT operators, the order
+       of evaluation does not matter, so the units expected to give
+       the fewest hits come first and the AND NOT units come last, and
+       'short_circuit_p' is True, meaning that the evaluation can stop
+       as soon as the running intersection becomes empty.  If any OR
+       operator is present, the units are kept in the order the user
+       typed them.
+
+       'plan_nbhits' is the list of the estimated number of hits of
+       the units, None meaning unknown.
+    """
+    plan_nbhits = [estimate_search_unit_nbhits(bsu_p, bsu_f, bsu_m)
+                   for bsu_o, bsu_p, bsu_f, bsu_m in basic_search_units]
+    plan = range(len(basic_search_units))
+    for bsu_o, bsu_p, bsu_f, bsu_m in basic_search_units:
+        if bsu_o not in ('+', '-'):
+            return (plan, plan_nbhits, False)
+    def plan_sort_key(idx_unit):
+        """Order AND NOT units last, then the units with the fewest
+        known hits, then the units with unknown number of hits by their
+        search type; keep the user order otherwise."""
+        bsu_o, bsu_p, bsu_f, bsu_m = basic_search_units[idx_unit]
+        nbhits = plan_nbhits[idx_unit]
+        return (bsu_o == '-', nbhits is None, nbhits,
+                get_search_unit_type_rank(bsu_p, bsu_f, bsu_m), idx_unit)
+    plan.sort(key=plan_sort_key)
+    return (plan, plan_nbhits, True)
+
 def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, ln=CFG_SITE_LANG, display_nearest_terms_box=True, wl=0):
     """Search for complex pattern 'p' within field 'f' according to
        matching type 'm'.  Return hitset of recIDs.
@@ -1982,7 +2245,20 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
     # search stage 2: do search for each search unit and verify hit presence:
     if verbose and of.startswith("h"):
         t1 = os.times()[4]
-    basic_search_units_hitsets = []
+    plan, plan_nbhits, short_circuit_p = create_basic_search_units_plan(basic_search_units)
+    if verbose and of.startswith("h"):
+        write_warning("Search stage 2: query plan is: %s" % \
+                      cgi.escape(", ".join(["%s%s (%s hits expected)" % \
+                                            (basic_search_units[idx_unit][0],
+                                             repr(basic_search_units[idx_unit][1:]),
+                                             plan_nbhits[idx_unit] is None and "unknown" or plan_nbhits[idx_unit])
+                                            for idx_unit in plan])), req=req)
+        if short_circuit_p:
+            write_warning("Search stage 2: query plan will stop as soon as no record matches.", req=req)
+    basic_search_units_hitsets = [None] * len(basic_search_units)
+    # running intersection of the units evaluated so far, used to stop
+    # evaluating AND chains early:
+    plan_hitset = None
     #prepare hiddenfield-related..
     myhiddens = CFG_BIBFORMAT_HIDDEN_TAGS
     can_see_hidden = False
@@ -2006,7 +2282,11 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
                           {'x_range_from_year': '2008',
                            'x_range_to_year': '2012'}, req=req)
 
-    for idx_unit in xrange(len(basic_search_units)):
+    for idx_unit in plan:
+        if plan_hitset is not None and not plan_hitset:
+            if verbose and of.startswith("h"):
+                write_warning("Search stage 2: no record matches, skipping the remaining units.", req=req)
+            break
         bsu_o, bsu_p, bsu_f, bsu_m = basic_search_units[idx_unit]
         if bsu_f and len(bsu_f) < 2:
             if of.startswith("h"):
@@ -2040,6 +2320,7 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
                     display_nearest_terms_box = False #..and stop spying, too.
         if verbose >= 9 and of.startswith("h"):
             write_warning("Search stage 1: pattern %s gave hitlist %s" % (cgi.escape(bsu_p), basic_search_unit_hitset), req=req)
+        search_unit_nbhits_cache.set((bsu_p, bsu_f, bsu_m), len(basic_search_unit_hitset))
         if len(basic_search_unit_hitset) > 0 or \
            ap<1 or \
            bsu_o=="|" or \
@@ -2049,7 +2330,7 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
             # pattern treatment is switched off, or the search unit
             # was joined by an OR operator to preceding/following
             # units so we do not require that it exists
-            basic_search_units_hitsets.append(basic_search_unit_hitset)
+            basic_search_units_hitsets[idx_unit] = basic_search_unit_hitset
         else:
             # stage 2-2: no hits found for this search unit, try to replace non-alphanumeric chars inside pattern:
             if re.search(r'[^a-zA-Z0-9\s\:]', bsu_p) and bsu_f != 'refersto' and bsu_f != 'citedby':
@@ -2067,7 +2348,7 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
                                       {'x_query1': "<em>" + cgi.escape(bsu_p) + "</em>",
                                        'x_query2': "<em>" + cgi.escape(bsu_pn) + "</em>"}, req=req)
                     basic_search_units[idx_unit][1] = bsu_pn
-                    basic_search_units_hitsets.append(basic_search_unit_hitset)
+                    basic_search_units_hitsets[idx_unit] = basic_search_unit_hitset
                 else:
                     # stage 2-3: no hits found either, propose nearest indexed terms:
                     if of.startswith('h') and display_nearest_terms_box:
@@ -2086,11 +2367,20 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
                         else:
                             write_warning(create_nearest_terms_box(req.argd, bsu_p, bsu_f, bsu_m, ln=ln), req=req)
                 return hitset_empty
+        if short_circuit_p and bsu_o == '+':
+            if plan_hitset is None:
+                plan_hitset = intbitset(basic_search_units_hitsets[idx_unit])
+            else:
+                plan_hitset.intersection_update(basic_search_units_hitsets[idx_unit])
     if verbose and of.startswith("h"):
         t2 = os.times()[4]
-        for idx_unit in range(0, len(basic_search_units)):
-            write_warning("Search stage 2: basic search unit %s gave %d hits." %
-                          (basic_search_units[idx_unit][1:], len(basic_search_units_hitsets[idx_unit])), req=req)
+        for idx_unit in plan:
+            if basic_search_units_hitsets[idx_unit] is None:
+                write_warning("Search stage 2: basic search unit %s was skipped." %
+                              (basic_search_units[idx_unit][1:],), req=req)
+            else:
+                write_warning("Search stage 2: basic search unit %s gave %d hits." %
+                              (basic_search_units[idx_unit][1:], len(basic_search_units_hitsets[idx_unit])), req=req)
         write_warning("Search stage 2: execution took %.2f seconds." % (t2 - t1), req=req)
     # search stage 3: apply boolean query for each search unit:
     if verbose and of.startswith("h"):
@@ -2098,9 +2388,13 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
     # let the initial set be the complete universe:
     hitset_in_any_collection = intbitset(trailing_bits=1)
     hitset_in_any_collection.discard(0)
-    for idx_unit in xrange(len(basic_search_units)):
+    for idx_unit in plan:
         this_unit_operation = basic_search_units[idx_unit][0]
         this_unit_hitset = basic_search_units_hitsets[idx_unit]
+        if this_unit_hitset is None:
+            # skipped by the query plan since no record matches:
+            hitset_in_any_collection = intbitset()
+            break
         if this_unit_operation == '+':
             hitset_in_any_collection.intersection_update(this_unit_hitset)
         elif this_unit_operation == '-':
@@ -2116,6 +2410,12 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
             nearestterms = []
             for idx_unit in range(0, len(basic_search_units)):
                 bsu_o, bsu_p, bsu_f, bsu_m = basic_search_units[idx_unit]
+                if basic_search_units_hitsets[idx_unit] is None:
+                    # skipped by the query plan, so search for it now:
+                    try:
+                        basic_search_units_hitsets[idx_unit] = search_unit(bsu_p, bsu_f, bsu_m, wl)
+                    except InvenioWebSearchWildcardLimitError, excp:
+                        basic_search_units_hitsets[idx_unit] = excp.res
                 if bsu_p.startswith("%") and bsu_p.endswith("%"):
                     bsu_p = "'" + bsu_p[1:-1] + "'"
                 bsu_nbhits = len(basic_search_units_hitsets[idx_unit])
@@ -2329,11 +2629,93 @@ def get_idxpair_field_ids():
     return [index_dict[field] for field in index_dict if field in CFG_WEBSEARCH_IDXPAIRS_FIELDS]
 
 
-def search_unit_in_bibwords(word, f, m=None, decompress=zlib.decompress, wl=0):
-    """Searches for 'word' inside bibwordsX table for field 'f' and returns hitset of recIDs."""
+def search_terms_in_term_dictionary(table, query_addons, query_params, wl=0):
+    """Expand the 'term LIKE %s' or 'term BETWEEN %s AND %s' condition
+    QUERY_ADDONS with QUERY_PARAMS using the in-memory term dictionary
+    of word index table TABLE, and return the list of (term, hitlist)
+    of the matching terms, fetched by batches.  When WL is greater
+    than 0, at most WL terms are looked at, and
+    InvenioDbQueryWildcardLimitError is raised if the limit was
+    reached, like run_sql_with_limit() does."""
+    # the index tables compare terms without case nor accents, and the
+    # dictionary holds folded terms, so fold the query too; the folded
+    # terms then match all their variants in the IN queries below:
+    query_params = [fold_term(param) for param in query_params]
+    term_dictionary = get_index_term_dictionary(table)
+    if query_addons == "LIKE %s":
+        terms = term_dictionary.iter_like(query_params[0])
+    else:
+        terms = term_dictionary.iter_range(query_params[0], query_params[1])
+    if wl > 0:
+        terms = itertools.islice(terms, wl)
+    terms = list(terms)
+    res = []
+    for start in xrange(0, len(terms), 1000):
+        terms_batch = terms[start:start + 1000]
+        res.extend(run_sql("SELECT term,hitlist FROM %s WHERE term IN (%s)" % \
+                           (table, ','.join(['%s'] * len(terms_batch))),
+                           tuple(terms_batch))) # kwalitee: disable=sql
+    if wl > 0 and len(terms) == wl:
+        raise InvenioDbQueryWildcardLimitError(res)
+    return res
+
+def search_unit_in_index_table(table, index_id, query_addons, query_params, use_query_limit=False, wl=0):
+    """Searches for terms matching 'term QUERY_ADDONS' condition with
+    QUERY_PARAMS inside index table TABLE of index INDEX_ID and returns
+    the union of their hitsets.  Uses the hitlist cache, if enabled.
+    When USE_QUERY_LIMIT is set, the number of matching terms is
+    limited to WL and InvenioWebSearchWildcardLimitError is raised if
+    the limit was reached."""
+    if not use_query_limit:
+        wl = 0
+    cache_key = (table, query_params, query_addons, wl)
+    if CFG_WEBSEARCH_HITLIST_CACHE_SIZE:
+        last_updated = get_index_last_updated(index_id)
+        set = get_cached_hitset(cache_key, last_updated)
+        if set is not None:
+            return set
     set = intbitset() # will hold output result set
     set_used = 0 # not-yet-used flag, to be able to circumvent set operations
     limit_reached = 0 # flag for knowing if the query limit has been reached
+    # perform search:
+    if CFG_WEBSEARCH_TERM_DICTIONARY and table.startswith('idxWORD') and \
+       query_addons in ("LIKE %s", "BETWEEN %s AND %s") and \
+       not [param for param in query_params if type(param) is not str]:
+        try:
+            res = search_terms_in_term_dictionary(table, query_addons, query_params, wl)
+        except InvenioDbQueryWildcardLimitError, excp:
+            res = excp.res
+            limit_reached = 1 # set the limit reached flag to true
+    elif use_query_limit:
+        try:
+            res = run_sql_with_limit("SELECT term,hitlist FROM %s WHERE term %s" % (table, query_addons),
+                                     query_params, wildcard_limit=wl) # kwalitee: disable=sql
+        except InvenioDbQueryWildcardLimitError, excp:
+            res = excp.res
+            limit_reached = 1 # set the limit reached flag to true
+    else:
+        res = run_sql("SELECT term,hitlist FROM %s WHERE term %s" % (table, query_addons), query_params) # kwalitee: disable=sql
+    # fill the result set:
+    for word, hitlist in res:
+        hitset_term = intbitset(hitlist)
+        # add the results:
+        if set_used:
+            set.union_update(hitset_term)
+        else:
+            set = hitset_term
+            set_used = 1
+    #check to see if the query limit was reached
+    if limit_reached:
+        #raise an exception, so we can print a nice message to the user
+        raise InvenioWebSearchWildcardLimitError(set)
+    if CFG_WEBSEARCH_HITLIST_CACHE_SIZE:
+        hitlist_cache.set(cache_key, (last_updated, intbitset(set)))
+    # okay, return result set:
+    return set
+
+def search_unit_in_bibwords(word, f, m=None, decompress=zlib.decompress, wl=0):
+    """Searches for 'word' inside bibwordsX table for field 'f' and returns hitset of recIDs."""
+    use_query_limit = False # flag for knowing if to limit the query results or not
 
     # if no field is specified, search in the global index.
     f = f or 'anyfield'
@@ -2368,12 +2750,9 @@ def search_unit_in_bibwords(word, f, m=None, decompress=zlib.decompress, wl=0):
                 word1_washed = int(word1_washed)
             except ValueError:
                 pass
-        try:
-            res = run_sql_with_limit("SELECT term,hitlist FROM %s WHERE term BETWEEN %%s AND %%s" % bibwordsX,
-                          (word0_washed, word1_washed), wildcard_limit = wl)
-        except InvenioDbQueryWildcardLimitError, excp:
-            res = excp.res
-            limit_reached = 1 # set the limit reached flag to true
+        query_addons = "BETWEEN %s AND %s"
+        query_params = (word0_washed, word1_washed)
+        use_query_limit = True
     else:
         if f == 'journal':
             pass # FIXME: quick hack for the journal index
@@ -2386,32 +2765,16 @@ def search_unit_in_bibwords(word, f, m=None, decompress=zlib.decompress, wl=0):
             if f == 'journal':
                 # FIXME: quick hack for the journal index
                 # FIXME: we can run a sanity check here for all indexes
-                res = ()
-            else:
-                try:
-                    res = run_sql_with_limit("SELECT term,hitlist FROM %s WHERE term LIKE %%s" % bibwordsX,
-                                  (wash_index_term(word),), wildcard_limit = wl)
-                except InvenioDbQueryWildcardLimitError, excp:
-                    res = excp.res
-                    limit_reached = 1 # set the limit reached flag to true
-        else:
-            res = run_sql("SELECT term,hitlist FROM %s WHERE term=%%s" % bibwordsX,
-                          (wash_index_term(word),))
-    # fill the result set:
-    for word, hitlist in res:
-        hitset_bibwrd = intbitset(hitlist)
-        # add the results:
-        if set_used:
-            set.union_update(hitset_bibwrd)
+                return intbitset()
+            query_addons = "LIKE %s"
+            query_params = (wash_index_term(word),)
+            use_query_limit = True
         else:
-            set = hitset_bibwrd
-            set_used = 1
-    #check to see if the query limit was reached
-    if limit_reached:
-        #raise an exception, so we can print a nice message to the user
-        raise InvenioWebSearchWildcardLimitError(set)
+            query_addons = "= %s"
+            query_params = (wash_index_term(word),)
     # okay, return result set:
-    return set
+    return search_unit_in_index_table(bibwordsX, index_id, query_addons,
+                                      query_params, use_query_limit, wl)
 
 def search_unit_in_idxpairs(p, f, type, wl=0):
     """Searches for pair 'p' inside idxPAIR table for field 'f' and
@@ -2498,13 +2861,15 @@ def search_unit_in_idxpairs(p, f, type, wl=0):
             except InvenioDbQueryWildcardLimitError, excp:
                 res = excp.res
                 limit_reached = 1 # set the limit reached flag to true
+            hitsets_idxpairs = [intbitset(hitlist) for pair, hitlist in res]
         else:
-            res = run_sql("SELECT term, hitlist FROM %s WHERE term %s" \
-                      % (idxpair_table_washed, query_addons), query_params) #kwalitee:disable=sql
-        if not res:
+            # exact pair lookup, which can be served from the hitlist cache:
+            hitset_idxpairs = search_unit_in_index_table(idxpair_table_washed, index_id,
+                                                         query_addons, query_params)
+            hitsets_idxpairs = hitset_idxpairs and [hitset_idxpairs] or []
+        if not hitsets_idxpairs:
             return intbitset()
-        for pair, hitlist in res:
-            hitset_idxpairs = intbitset(hitlist)
+        for hitset_idxpairs in hitsets_idxpairs:
             if first_results:
                 result_set = hitset_idxpairs
                 first_results = 0
@@ -2539,18 +2904,15 @@ def search_unit_in_idxphrases(p, f, type, wl=0):
     # call word search method in some cases:
     if f == 'authorcount':
         return search_unit_in_bibwords(p, f, wl=wl)
-    set = intbitset() # will hold output result set
-    set_used = 0 # not-yet-used flag, to be able to circumvent set operations
-    limit_reached = 0 # flag for knowing if the query limit has been reached
     use_query_limit = False # flag for knowing if to limit the query results or not
     # deduce in which idxPHRASE table we will search:
-    idxphraseX = "idxPHRASE%02dF" % get_index_id_from_field("anyfield")
     if f:
         index_id = get_index_id_from_field(f)
-        if index_id:
-            idxphraseX = "idxPHRASE%02dF" % index_id
-        else:
+        if not index_id:
             return intbitset() # phrase index f does not exist
+    else:
+        index_id = get_index_id_from_field("anyfield")
+    idxphraseX = "idxPHRASE%02dF" % index_id
     # detect query type (exact phrase, partial phrase, regexp):
     if type == 'r':
         query_addons = "REGEXP %s"
@@ -2578,31 +2940,9 @@ def search_unit_in_idxphrases(p, f, type, wl=0):
         for query_param in query_params:
             query_params_washed += (wash_author_name(query_param),)
         query_params = query_params_washed
-    # perform search:
-    if use_query_limit:
-        try:
-            res = run_sql_with_limit("SELECT term,hitlist FROM %s WHERE term %s" % (idxphraseX, query_addons),
-                      query_params, wildcard_limit=wl)
-        except InvenioDbQueryWildcardLimitError, excp:
-            res = excp.res
-            limit_reached = 1 # set the limit reached flag to true
-    else:
-        res = run_sql("SELECT term,hitlist FROM %s WHERE term %s" % (idxphraseX, query_addons), query_params)
-    # fill the result set:
-    for word, hitlist in res:
-        hitset_bibphrase = intbitset(hitlist)
-        # add the results:
-        if set_used:
-            set.union_update(hitset_bibphrase)
-        else:
-            set = hitset_bibphrase
-            set_used = 1
-    #check to see if the query limit was reached
-    if limit_reached:
-        #raise an exception, so we can print a nice message to the user
-        raise InvenioWebSearchWildcardLimitError(set)
     # okay, return result set:
-    return set
+    return search_unit_in_index_table(idxphraseX, index_id, query_addons,
+                                      query_params, use_query_limit, wl)
 
 def search_unit_in_bibxxx(p, f, type, wl=0):
     """Searches for pattern 'p' inside bibxxx tables for field 'f' and returns hitset of recIDs found.
@@ -3286,6 +3626,21 @@ def get_nbhits_in_bibrec(term, f):
                   (term + '%',))
     return res[0][0]
 
+def get_index_term_nbhits(table, term):
+    """Return number of hits for term 'term' inside index table 'table'
+       (such as idxWORD01F), as stored by BibIndex in its `df' column.
+       The hitlists are decompressed only for terms whose number of
+       hits was not stored yet."""
+    out = 0
+    res = run_sql("SELECT df FROM %s WHERE term=%%s" % table, (term,))
+    for row in res:
+        if row[0] is None:
+            res = run_sql("SELECT hitlist FROM %s WHERE term=%%s" % table,
+                          (term,))
+            return sum([len(intbitset(hitlist)) for (hitlist,) in res])
+        out += row[0]
+    return out
+
 def get_nbhits_in_bibwords(word, f):
     """Return number of hits for word 'word' inside words index for field 'f'."""
     out = 0
@@ -3298,10 +3653,7 @@ def get_nbhits_in_bibwords(word, f):
         else:
             return 0
     if word:
-        res = run_sql("SELECT hitlist FROM %s WHERE term=%%s" % bibwordsX,
-                      (word,))
-        for hitlist in res:
-            out += len(intbitset(hitlist[0]))
+        out = get_index_term_nbhits(bibwordsX, word)
     return out
 
 def get_nbhits_in_idxphrases(word, f):
@@ -3316,10 +3668,7 @@ def get_nbhits_in_idxphrases(word, f):
         else:
             return 0
     if word:
-        res = run_sql("SELECT hitlist FROM %s WHERE term=%%s" % idxphraseX,
-                      (word,))
-        for hitlist in res:
-            out += len(intbitset(hitlist[0]))
+        out = get_index_term_nbhits(idxphraseX, word)
     return out
 
 def get_nbhits_in_bibxxx(p, f, in_hitset=None):
@@ -3546,6 +3895,45 @@ def record_exists(recID):
             out = 1 # exists fine
     return out
 
+def records_exist(recIDs):
+    """Return dictionary {recID: status} telling for every record of
+       RECIDS whether it exists, with the same status as record_exists(),
+       using two queries whatever the number of records.
+    """
+    out = {}
+    valid_recIDs = []
+    for recID in recIDs:
+        out[recID] = 0
+        try:
+            valid_recIDs.append(int(recID))
+        except ValueError:
+            pass
+    if not valid_recIDs:
+        return out
+    recids_sql = ','.join(['%s'] * len(valid_recIDs))
+    existing = intbitset(run_sql("SELECT id FROM bibrec WHERE id IN (%s)" % recids_sql,
+                                 tuple(valid_recIDs)))
+    if not existing:
+        return out
+    deleted_values = ['DELETED']
+    if CFG_CERN_SITE:
+        deleted_values.append('DUMMY')
+    deleted = intbitset(run_sql("""SELECT bibx.id_bibrec FROM bib98x AS bx, bibrec_bib98x AS bibx
+                                    WHERE bibx.id_bibrec IN (%s) AND bx.id=bibx.id_bibxxx
+                                      AND bx.tag LIKE %%s AND bx.value IN (%s)""" % \
+                                (recids_sql, ','.join(['%s'] * len(deleted_values))),
+                                tuple(valid_recIDs) + ('980__%',) + tuple(deleted_values)))
+    for recID in recIDs:
+        try:
+            intrecID = int(recID)
+        except ValueError:
+            continue
+        if intrecID in deleted:
+            out[recID] = -1 # exists, but marked as deleted
+        elif intrecID in existing:
+            out[recID] = 1 # exists fine
+    return out
+
 def record_empty(recID):
     """
     Is this record empty, e.g. has only 001, waiting for integration?
@@ -3866,7 +4254,18 @@ def rank_records(req, rank_method_code, rank_limit_relevance, hitset_global, pat
                 if verbose > 0:
                     comment = 'find_citations retlist %s' % [[solution_recs[i], solution_scores[i]] for i in range(len(solution_recs))]
                 return (solution_recs, solution_scores, '(', ')', comment)
-    return rank_records_bibrank(rank_method_code, rank_limit_relevance, hitset_global, pattern, verbose, field, rg, jrec)
+    ranked_result_amount = None
+    if rg and of.startswith('h') and \
+           (not req or isinstance(req, cStringIO.OutputType) or \
+            len(hitset_global) >= CFG_WEBSEARCH_PREV_NEXT_HIT_LIMIT):
+        # only the displayed records, plus the next page, need to be
+        # sorted; paging deeper ranks again anyway.  This is not the
+        # case when the list of hits is stored in the session for the
+        # previous/next links of the detailed record pages (see
+        # prs_print_records()), since it has to be fully sorted then:
+        dummy, irec_max = get_interval_for_records_to_sort(len(hitset_global), jrec, rg)
+        ranked_result_amount = irec_max + abs(rg)
+    return rank_records_bibrank(rank_method_code, rank_limit_relevance, hitset_global, pattern, verbose, field, rg, jrec, ranked_result_amount)
 
 
 def sort_records(req, recIDs, sort_field='', sort_order='d', sort_pattern='', verbose=0, of='hb', ln=CFG_SITE_LANG, rg=None, jrec=None):
@@ -4227,9 +4626,12 @@ def print_records(req, recIDs, jrec=1, rg=CFG_WEBSEARCH_DEF_RECORDS_IN_GROUPS, f
             # we are doing HTML output:
             if format == 'hp' or format.startswith("hb_") or format.startswith("hd_"):
                 # portfolio and on-the-fly formats:
+                prefetched = get_prefetched_records_data([recIDs[irec] for irec in range(irec_max, irec_min, -1)],
+                                                         format, ln)
                 for irec in range(irec_max, irec_min, -1):
                     req.write(print_record(recIDs[irec], format, ot, ln, search_pattern=search_pattern,
-                                           user_info=user_info, verbose=verbose, sf=sf, so=so, sp=sp, rm=rm))
+                                           user_info=user_info, verbose=verbose, sf=sf, so=so, sp=sp, rm=rm,
+                                           prefetched=prefetched.get(recIDs[irec])))
             elif format.startswith("hb"):
                 # HTML brief format:
                 display_add_to_basket = True
@@ -4244,6 +4646,9 @@ def print_records(req, recIDs, jrec=1, rg=CFG_WEBSEARCH_DEF_RECORDS_IN_GROUPS, f
                     display_add_to_basket = False
                 req.write(websearch_templates.tmpl_record_format_htmlbrief_header(
                     ln = ln))
+                # fetch the data of all the records to print at once:
+                prefetched = get_prefetched_records_data([recIDs[irec] for irec in range(irec_max, irec_min, -1)],
+                                                         format, ln)
                 for irec in range(irec_max, irec_min, -1):
                     row_number = jrec+irec_max-irec
                     recid = recIDs[irec]
@@ -4252,7 +4657,8 @@ def print_records(req, recIDs, jrec=1, rg=CFG_WEBSEARCH_DEF_RECORDS_IN_GROUPS, f
                     else:
                         relevance = ''
                     record = print_record(recIDs[irec], format, ot, ln, search_pattern=search_pattern,
-                                                  user_info=user_info, verbose=verbose, sf=sf, so=so, sp=sp, rm=rm)
+                                                  user_info=user_info, verbose=verbose, sf=sf, so=so, sp=sp, rm=rm,
+                                                  prefetched=prefetched.get(recid))
 
                     req.write(websearch_templates.tmpl_record_format_htmlbrief_body(
                         ln = ln,
@@ -4539,7 +4945,8 @@ def get_record(recid):
     return create_record(print_record(recid, 'xm'))[0]
 
 def print_record(recID, format='hb', ot='', ln=CFG_SITE_LANG, decompress=zlib.decompress,
-                 search_pattern=None, user_info=None, verbose=0, sf='', so='d', sp='', rm=''):
+                 search_pattern=None, user_info=None, verbose=0, sf='', so='d', sp='', rm='',
+                 prefetched=None):
     """
     Prints record 'recID' formatted according to 'format'.
 
@@ -4547,6 +4954,10 @@ def print_record(recID, format='hb', ot='', ln=CFG_SITE_LANG, decompress=zlib.de
     only for proper linking purposes: e.g. when a certain ranking
     method or a certain sort field was selected, keep it selected in
     any dynamic search links that may be printed.
+
+    'prefetched' is the data of the record fetched beforehand, along
+    with the ones of the other records to print, by
+    bibformat.get_prefetched_records_data().
     """
     if format == 'recstruct':
         return get_record(recID)
@@ -4568,7 +4979,10 @@ def print_record(recID, format='hb', ot='', ln=CFG_SITE_LANG, decompress=zlib.de
     out = ""
 
     # sanity check:
-    record_exist_p = record_exists(recID)
+    if prefetched is not None:
+        record_exist_p = prefetched['exists']
+    else:
+        record_exist_p = record_exists(recID)
     if record_exist_p == 0: # doesn't exist
         return out
 
@@ -4596,7 +5010,8 @@ def print_record(recID, format='hb', ot='', ln=CFG_SITE_LANG, decompress=zlib.de
                 out += ' ' + _("The record %d replaces it." % merged_recid)
         else:
             out += call_bibformat(recID, format, ln, search_pattern=search_pattern,
-                                  user_info=user_info, verbose=verbose)
+                                  user_info=user_info, verbose=verbose,
+                                  prefetched=prefetched)
 
             # at the end of HTML brief mode, print the "Detailed record" functionality:
             if format.lower().startswith('hb') and \
@@ -4909,11 +5324,15 @@ def print_record(recID, format='hb', ot='', ln=CFG_SITE_LANG, decompress=zlib.de
 
     return out
 
-def call_bibformat(recID, format="HD", ln=CFG_SITE_LANG, search_pattern=None, user_info=None, verbose=0):
+def call_bibformat(recID, format="HD", ln=CFG_SITE_LANG, search_pattern=None, user_info=None, verbose=0,
+                   prefetched=None):
     """
     Calls BibFormat and returns formatted record.
 
     BibFormat will decide by itself if old or new BibFormat must be used.
+
+    'prefetched' is the data of the record fetched beforehand by
+    bibformat.get_prefetched_records_data(), if any.
     """
 
     from invenio.bibformat_utils import get_pdf_snippets
@@ -4934,7 +5353,8 @@ def call_bibformat(recID, format="HD", ln=CFG_SITE_LANG, search_pattern=None, us
                          ln=ln,
                          search_pattern=keywords,
                          user_info=user_info,
-                         verbose=verbose)
+                         verbose=verbose,
+                         prefetched=prefetched)
 
     if CFG_WEBSEARCH_FULLTEXT_SNIPPETS and user_info and \
            'fulltext' in user_info['uri'].lower():
@@ -5719,9 +6139,10 @@ def prs_simple_search(results_in_any_collection, kwargs=None, req=None, of=None,
                     only_hosted_colls_actual_or_potential_results_p=None, query_representation_in_cache=None,
                     ap=None, hosted_colls_actual_or_potential_results_p=None, wl=None, em=None,
                     **dummy):
-    if search_results_cache.cache.has_key(query_representation_in_cache):
-        # query is not in the cache already, so reuse it:
-        results_in_any_collection.union_update(search_results_cache.cache[query_representation_in_cache])
+    cached_results = search_results_cache.get(query_representation_in_cache)
+    if cached_results is not None:
+        # query is in the cache already, so reuse it:
+        results_in_any_collection.union_update(cached_results)
         if verbose and of.startswith("h"):
             write_warning("Search stage 0: query found in cache, reusing cached results.", req=req)
     else:
@@ -5765,12 +6186,10 @@ def prs_intersect_results_with_collrecs(results_final, results_in_any_collection
 
 
 def prs_store_results_in_cache(query_representation_in_cache, results_in_any_collection, req=None, verbose=None, of=None, **dummy):
-    if CFG_WEBSEARCH_SEARCH_CACHE_SIZE and not search_results_cache.cache.has_key(query_representation_in_cache):
-        if len(search_results_cache.cache) > CFG_WEBSEARCH_SEARCH_CACHE_SIZE:
-            search_results_cache.clear()
-        search_results_cache.cache[query_representation_in_cache] = results_in_any_collection
+    if CFG_WEBSEARCH_SEARCH_CACHE_SIZE and query_representation_in_cache not in search_results_cache:
+        search_results_cache.set(query_representation_in_cache, results_in_any_collection)
         if verbose and of.startswith("h"):
-            write_warning(req, "Search stage 3: storing query results in cache.", req=req)
+            write_warning("Search stage 3: storing query results in cache.", req=req)
 
 
 def prs_apply_search_limits(results_final, kwargs=None, req=None, of=None, cc=None, ln=None, _=None,
@@ -6090,7 +6509,8 @@ def prs_search_common(kwargs=None, req=None, of=None, cc=None, ln=None, uid=None
                     dt=None, jrec=None, ec=None, action=None, colls_to_search=None, wash_colls_debug=None,
                     verbose=None, wl=None, em=None, **dummy):
 
-    query_representation_in_cache = repr((p, f, colls_to_search, wl))
+    query_representation_in_cache = (p, f, tuple(colls_to_search), wl)
+    kwargs['query_representation_in_cache'] = query_representation_in_cache
     page_start(req, of, cc, aas, ln, uid, p=create_page_title_search_pattern_info(p, p1, p2, p3), em=em)
 
     if of.startswith("h") and verbose and wash_colls_debug:
@@ -6127,7 +6547,7 @@ def prs_search_common(kwargs=None, req=None, of=None, cc=None, ln=None, uid=None
         return None
 
     # store this search query results into search results cache if needed:
-    prs_store_results_in_cache(query_representation_in_cache, results_in_any_collection, **kwargs)
+    prs_store_results_in_cache(results_in_any_collection=results_in_any_collection, **kwargs)
 
     # search stage 4 and 5: intersection with collection universe and sorting/limiting
     try:
@@ -6272,6 +6692,7 @@ def perform_request_cache(req, action="show"):
     # clear cache if requested:
     if action == "clear":
         search_results_cache.clear()
+        hitlist_cache.clear()
     req.write(out)
     # show collection reclist cache:
     out = "<h3>Collection reclist cache</h3>"
@@ -6284,15 +6705,35 @@ def perform_request_cache(req, action="show"):
             out += "%s (%d)<br />" % (coll, len(collection_reclist_cache.cache[coll]))
     out += "</blockquote>"
     req.write(out)
+    # show hitlist cache:
+    out = "<h3>Hitlist cache</h3>"
+    if CFG_WEBSEARCH_HITLIST_CACHE_SIZE:
+        stats = hitlist_cache.get_stats()
+        out += "- hitlist cache usage: %d terms cached, %d bytes (max. %d)" % \
+               (stats['entries'], stats['size'], stats['max_size'])
+        out += "<br />- hitlist cache hits: %d, misses: %d, hit rate: %.1f%%" % \
+               (stats['hits'], stats['misses'], 100 * stats['hit_rate'])
+        out += "<br />- hitlist cache evictions: %d" % stats['evictions']
+    else:
+        out += "- hitlist cache is disabled (see CFG_WEBSEARCH_HITLIST_CACHE_SIZE)"
+    req.write(out)
     # show search results cache:
     out = "<h3>Search Cache</h3>"
-    out += "- search cache usage: %d queries cached (max. ~%d)" % \
-           (len(search_results_cache.cache), CFG_WEBSEARCH_SEARCH_CACHE_SIZE)
-    if len(search_results_cache.cache):
+    stats = search_results_cache.get_stats()
+    out += "- search cache usage: %d queries cached (max. %d), %d bytes" % \
+           (stats['entries'], CFG_WEBSEARCH_SEARCH_CACHE_SIZE, stats['size'])
+    if CFG_WEBSEARCH_SEARCH_CACHE_MAX_BYTES:
+        out += " (max. %d)" % CFG_WEBSEARCH_SEARCH_CACHE_MAX_BYTES
+    out += "<br />- search cache hits: %d, misses: %d, hit rate: %.1f%%" % \
+           (stats['hits'], stats['misses'], 100 * stats['hit_rate'])
+    out += "<br />- search cache evictions: %d" % stats['evictions']
+    if search_results_cache.shared_backend:
+        out += "<br />- search cache hits from other processes: %d" % search_results_cache.shared_hits
+    if len(search_results_cache):
         out += "<br />- search cache contents:"
         out += "<blockquote>"
-        for query, hitset in search_results_cache.cache.items():
-            out += "<br />%s ... %s" % (query, hitset)
+        for query, hitset in search_results_cache.items():
+            out += "<br />%s ... %s" % (cgi.escape(repr(query)), hitset)
         out += """<p><a href="%s/search/cache?action=clear">clear search results cache</a>""" % CFG_SITE_URL
         out += "</blockquote>"
     req.write(out)
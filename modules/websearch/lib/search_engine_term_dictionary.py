@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Invenio search engine in-memory term dictionary.
+
+Keeps the sorted terms of a word index in a compact front-coded form,
+so that truncated (`ellis*') and span (`2000->2010') queries can be
+expanded to the list of matching terms without scanning the index
+table in the database.
+
+The index tables compare terms with the utf8_general_ci collation of
+MySQL, which ignores case and accents, so that e.g. `muller*' matches
+`müller' too.  The dictionary therefore holds the terms folded like
+the collation does (see fold_term()), and is to be queried with folded
+patterns.  Since a folded term is equal to the original terms for the
+collation, it can be used as such to read their hitlists.
+"""
+
+import re
+import struct
+import unicodedata
+from bisect import bisect_right
+
+CFG_TERM_DICTIONARY_BLOCK_SIZE = 16
+
+def get_common_prefix_length(term1, term2):
+    """Return the length of the longest common prefix of TERM1 and TERM2."""
+    max_length = min(len(term1), len(term2))
+    length = 0
+    while length < max_length and term1[length] == term2[length]:
+        length += 1
+    return length
+
+def fold_term(term):
+    """Return UTF-8 TERM folded like the utf8_general_ci collation of
+    MySQL does when comparing strings, i.e. without accents and in
+    upper case, so that the folded terms sort and match like the terms
+    of the index tables.  Terms that are not valid UTF-8 are returned
+    as such."""
+    try:
+        term.decode('ascii')
+        return term.upper()
+    except UnicodeDecodeError:
+        pass
+    try:
+        term = term.decode('utf-8')
+    except UnicodeDecodeError:
+        return term
+    term = u''.join([char for char in unicodedata.normalize('NFD', term)
+                     if not unicodedata.combining(char)])
+    return term.upper().encode('utf-8')
+
+def create_like_regexp(pattern):
+    """Return compiled regular expression matching the same strings
+    as the SQL LIKE PATTERN, where `%' stands for any string and `_'
+    for any character."""
+    regexp = ''
+    for char in pattern:
+        if char == '%':
+            regexp += '.*'
+        elif char == '_':
+            regexp += '.'
+        else:
+            regexp += re.escape(char)
+    return re.compile(regexp + '$', re.S | re.U)
+
+class FrontCodedTermList:
+    """
+    Sorted list of terms stored in front-coded blocks.
+
+    The first term of every block is kept as such in a list that is
+    bisected to find where to start reading.  The other terms of the
+    block are packed into a single string, each of them as the length
+    of the prefix it shares with the previous term and the rest of
+    its characters.  Terms are compared as byte strings; for the
+    comparisons of the index tables, give terms folded by fold_term().
+
+    Usage: terms = FrontCodedTermList(['ELLIS', 'ELLISON', 'HIGGS'])
+           list(terms.iter_like('ELL%')) # -> ['ELLIS', 'ELLISON']
+    """
+
+    def __init__(self, terms, block_size=CFG_TERM_DICTIONARY_BLOCK_SIZE):
+        """Initialise.
+        @param terms: sorted list of unique terms
+        @param block_size: number of terms per block
+        """
+        self.nb_terms = len(terms)
+        self.block_heads = []
+        self.blocks = []
+        for start in xrange(0, self.nb_terms, block_size):
+            block = terms[start:start + block_size]
+            self.block_heads.append(block[0])
+            encoded_terms = []
+            previous_term = block[0]
+            for term in block[1:]:
+                prefix_length = get_common_prefix_length(previous_term, term)
+                suffix = term[prefix_length:]
+                encoded_terms.append(struct.pack('>HH', prefix_length, len(suffix)) + suffix)
+                previous_term = term
+            self.blocks.append(''.join(encoded_terms))
+
+    def __len__(self):
+        return self.nb_terms
+
+    def __iter__(self):
+        for idx_block in xrange(len(self.blocks)):
+            for term in self._iter_block(idx_block):
+                yield term
+
+    def _iter_block(self, idx_block):
+        """Yield the terms of the block IDX_BLOCK."""
+        term = self.block_heads[idx_block]
+        yield term
+        block = self.blocks[idx_block]
+        position = 0
+        while position < len(block):
+            prefix_length, suffix_length = struct.unpack('>HH', block[position:position + 4])
+            position += 4
+            term = term[:prefix_length] + block[position:position + suffix_length]
+            position += suffix_length
+            yield term
+
+    def iter_range(self, low, high=None):
+        """Yield in order the terms T such that LOW <= T <= HIGH, or
+        such that LOW <= T if HIGH is None."""
+        idx_block = max(bisect_right(self.block_heads, low) - 1, 0)
+        while idx_block < len(self.blocks):
+            for term in self._iter_block(idx_block):
+                if term < low:
+                    continue
+                if high is not None and term > high:
+                    return
+                yield term
+            idx_block += 1
+
+    def iter_prefix(self, prefix):
+        """Yield in order the terms starting by PREFIX."""
+        for term in self.iter_range(prefix):
+            if not term.startswith(prefix):
+                return
+            yield term
+
+    def iter_like(self, pattern):
+        """Yield in order the terms matching the SQL LIKE PATTERN."""
+        prefix = re.split('[%_]', pattern, 1)[0]
+        if prefix == pattern:
+            # no wildcard, so look for exact term:
+            for term in self.iter_range(pattern, pattern):
+                yield term
+            return
+        if '_' in pattern:
+            # `_' stands for a character, not for a byte:
+            regexp = create_like_regexp(pattern.decode('utf-8', 'replace'))
+            for term in self.iter_prefix(prefix):
+                if regexp.match(term.decode('utf-8', 'replace')):
+                    yield term
+        else:
+            regexp = create_like_regexp(pattern)
+            for term in self.iter_prefix(prefix):
+                if regexp.match(term):
+                    yield term
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2013 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the search engine term dictionary."""
+
+import unittest
+
+from invenio.search_engine_term_dictionary import FrontCodedTermList, fold_term
+from invenio.testutils import make_test_suite, run_test_suite
+
+TERMS = ['1999', '2000', '2005', '2010', '2011',
+         'ellis', 'ellison', 'elliston', 'ellsworth',
+         'higgs', 'muller', 'm\xc3\xbcller', 'z']
+
+class TestFrontCodedTermList(unittest.TestCase):
+    """Test of the front-coded term list."""
+
+    def setUp(self):
+        """Create term lists with several block sizes."""
+        self.term_lists = [FrontCodedTermList(TERMS, block_size)
+                           for block_size in (1, 2, 3, 16)]
+
+    def test_iteration(self):
+        """term dictionary - iteration over all terms"""
+        for term_list in self.term_lists:
+            self.assertEqual(list(term_list), TERMS)
+            self.assertEqual(len(term_list), len(TERMS))
+
+    def test_range(self):
+        """term dictionary - range of terms"""
+        for term_list in self.term_lists:
+            self.assertEqual(list(term_list.iter_range('2000', '2010')),
+                             ['2000', '2005', '2010'])
+            self.assertEqual(list(term_list.iter_range('2001', '2009')),
+                             ['2005'])
+            self.assertEqual(list(term_list.iter_range('muller')),
+                             ['muller', 'm\xc3\xbcller', 'z'])
+            self.assertEqual(list(term_list.iter_range('zz')), [])
+
+    def test_prefix(self):
+        """term dictionary - terms starting by prefix"""
+        for term_list in self.term_lists:
+            self.assertEqual(list(term_list.iter_prefix('ellis')),
+                             ['ellis', 'ellison', 'elliston'])
+            self.assertEqual(list(term_list.iter_prefix('m\xc3')),
+                             ['m\xc3\xbcller'])
+            self.assertEqual(list(term_list.iter_prefix('x')), [])
+
+    def test_like(self):
+        """term dictionary - terms matching SQL LIKE pattern"""
+        for term_list in self.term_lists:
+            self.assertEqual(list(term_list.iter_like('ell%')),
+                             ['ellis', 'ellison', 'elliston', 'ellsworth'])
+            self.assertEqual(list(term_list.iter_like('elli%on')),
+                             ['ellison', 'elliston'])
+            self.assertEqual(list(term_list.iter_like('201_')),
+                             ['2010', '2011'])
+            self.assertEqual(list(term_list.iter_like('%s')),
+                             ['ellis', 'higgs'])
+            self.assertEqual(list(term_list.iter_like('higgs')),
+                             ['higgs'])
+            self.assertEqual(list(term_list.iter_like('higg')), [])
+
+    def test_fold_term(self):
+        """term dictionary - folding of terms like the collation"""
+        self.assertEqual(fold_term('Ellis'), 'ELLIS')
+        self.assertEqual(fold_term('M\xc3\xbcller'), 'MULLER')
+        self.assertEqual(fold_term('\xc3\xa9l\xc3\xa8ve'), 'ELEVE')
+        self.assertEqual(fold_term('\xff'), '\xff')
+
+    def test_folded_terms(self):
+        """term dictionary - non-ASCII mixed-case terms matching folded queries"""
+        folded_terms = {}
+        for term in TERMS + ['Ellis', 'M\xc3\xbcLLER', 'm\xc3\xbcllerova']:
+            folded_terms[fold_term(term)] = 1
+        folded_terms = folded_terms.keys()
+        folded_terms.sort()
+        for block_size in (1, 2, 16):
+            term_list = FrontCodedTermList(folded_terms, block_size)
+            self.assertEqual(list(term_list.iter_like(fold_term('muller%'))),
+                             ['MULLER', 'MULLEROVA'])
+            self.assertEqual(list(term_list.iter_like(fold_term('M\xc3\xbcll_r'))),
+                             ['MULLER'])
+            self.assertEqual(list(term_list.iter_like(fold_term('Ellis'))),
+                             ['ELLIS'])
+            self.assertEqual(list(term_list.iter_range(fold_term('m\xc3\xbcller'),
+                                                       fold_term('MULLEROVA'))),
+                             ['MULLER', 'MULLEROVA'])
+
+    def test_like_character(self):
+        """term dictionary - `_' matching a non-ASCII character"""
+        term_list = FrontCodedTermList(['\xe4\xb8\x80\xe4\xba\x8c', 'ab'])
+        self.assertEqual(list(term_list.iter_like('\xe4\xb8\x80_')),
+                         ['\xe4\xb8\x80\xe4\xba\x8c'])
+
+    def test_empty(self):
+        """term dictionary - empty term list"""
+        term_list = FrontCodedTermList([])
+        self.assertEqual(list(term_list), [])
+        self.assertEqual(list(term_list.iter_like('a%')), [])
+
+TEST_SUITE = make_test_suite(TestFrontCodedTermList)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
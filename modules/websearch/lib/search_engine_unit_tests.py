@@ -264,8 +264,51 @@ class TestQueryParser(unittest.TestCase):
         self._check('title:"s = 630"', None, None,
                     [['+', 's = 630', 'title', 'a']])
 
+class TestQueryPlanner(unittest.TestCase):
+    """Test of the evaluation order of basic search units."""
+
+    def setUp(self):
+        """Forget the number of hits of previously searched units."""
+        search_engine.search_unit_nbhits_cache.clear()
+
+    def test_and_chain_ordered_by_search_type(self):
+        "search engine - query plan of AND chain ordered by search type"
+        units = [['+', 'higg*', '', 'w'],
+                 ['+', '%higgs%', 'title', 'a'],
+                 ['+', 'Ellis, J', 'author', 'a']]
+        self.assertEqual(search_engine.create_basic_search_units_plan(units),
+                         ([2, 0, 1], [None, None, None], True))
+
+    def test_and_chain_ordered_by_known_nbhits(self):
+        "search engine - query plan of AND chain ordered by known number of hits"
+        if not search_engine.search_unit_nbhits_cache.max_size:
+            return
+        search_engine.search_unit_nbhits_cache.set(('ellis', '', 'w'), 5)
+        search_engine.search_unit_nbhits_cache.set(('2012', 'year', 'w'), 500)
+        units = [['+', '2012', 'year', 'w'],
+                 ['+', 'higg*', 'title', 'w'],
+                 ['+', 'ellis', '', 'w']]
+        self.assertEqual(search_engine.create_basic_search_units_plan(units),
+                         ([2, 0, 1], [500, None, 5], True))
+
+    def test_and_not_units_evaluated_last(self):
+        "search engine - query plan evaluates AND NOT units last"
+        units = [['-', 'Ellis, J', 'author', 'a'],
+                 ['+', 'higg*', '', 'w']]
+        self.assertEqual(search_engine.create_basic_search_units_plan(units)[0],
+                         [1, 0])
+
+    def test_or_chain_kept_in_user_order(self):
+        "search engine - query plan keeps OR chain in user order"
+        units = [['+', 'higg*', '', 'w'],
+                 ['|', 'Ellis, J', 'author', 'a'],
+                 ['+', '2012->2013', 'year', 'w']]
+        self.assertEqual(search_engine.create_basic_search_units_plan(units),
+                         ([0, 1, 2], [None, None, None], False))
+
 TEST_SUITE = make_test_suite(TestWashQueryParameters,
                              TestQueryParser,
+                             TestQueryPlanner,
                              TestMiscUtilityFunctions)
 
 
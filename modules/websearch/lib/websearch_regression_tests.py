@@ -51,8 +51,9 @@ from invenio.search_engine import perform_request_search, \
     guess_primary_collection_of_a_record, guess_collection_of_a_record, \
     collection_restricted_p, get_permitted_restricted_collections, \
     search_pattern, search_unit, search_unit_in_bibrec, \
-    wash_colls, record_public_p
+    wash_colls, record_public_p, search_results_cache
 from invenio import search_engine_summarizer
+from invenio import search_engine
 from invenio.search_engine_utils import get_fieldvalues
 from invenio.intbitset import intbitset
 from invenio.search_engine import intersect_results_with_collrecs
@@ -1174,6 +1175,26 @@ class WebSearchSearchEnginePythonAPITest(unittest.TestCase):
         self.assertEqual([1, 2, 3, 4, 5, 6, 7, 8, 9],
                          perform_request_search(recid=1, recidb=10))
 
+    def test_search_engine_python_api_results_cache(self):
+        """websearch - search engine Python API storing and reusing cached results"""
+        # the cache is disabled by default, so enable it for the test:
+        old_cache_size = search_engine.CFG_WEBSEARCH_SEARCH_CACHE_SIZE
+        old_max_entries = search_results_cache.max_entries
+        search_engine.CFG_WEBSEARCH_SEARCH_CACHE_SIZE = 10
+        search_results_cache.max_entries = 10
+        search_results_cache.clear()
+        try:
+            self.assertEqual([8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 47],
+                             perform_request_search(p='ellis'))
+            self.assertEqual(1, len([query for query in search_results_cache.keys()
+                                     if query[0] == 'ellis']))
+            self.assertEqual([8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 47],
+                             perform_request_search(p='ellis'))
+        finally:
+            search_engine.CFG_WEBSEARCH_SEARCH_CACHE_SIZE = old_cache_size
+            search_results_cache.max_entries = old_max_entries
+            search_results_cache.clear()
+
     def test_search_engine_python_api_ranked_by_citation(self):
         """websearch - search engine Python API for citation ranking"""
         self.assertEqual([82, 83, 87, 89],
@@ -85,6 +85,9 @@ CFG_MAX_ATIME_RM_WEBSUBMIT_CKEDITOR_FILE = 28
 # After how many days to remove obsolete temporary files related to BibEdit
 # cache
 CFG_MAX_ATIME_BIBEDIT_TMP = 3
+# After how many days to remove search results shared among processes
+# via the file data cacher backend
+CFG_MAX_ATIME_RM_SEARCH_RESULTS_CACHE = 1
 
 def gc_exec_command(command):
     """ Exec the command logging in appropriate way its output."""
@@ -254,6 +257,14 @@ def clean_cache():
     write_message("""%s webjournal cache file pruned out of %s.""" % (count, len(filenames)))
     write_message("""CLEANING OF OLD CACHED WEBJOURNAL FILES FINISHED""")
 
+    write_message("""CLEANING OF OLD SHARED SEARCH RESULTS STARTED""")
+    vstr = task_get_option('verbose') > 1 and '-v' or ''
+    gc_exec_command('find %s -name "search_results_*"'
+        ' -atime +%s -exec rm %s -f {} \;' \
+            % (CFG_CACHEDIR + '/datacacher/', CFG_MAX_ATIME_RM_SEARCH_RESULTS_CACHE,
+               vstr))
+    write_message("""CLEANING OF OLD SHARED SEARCH RESULTS FINISHED""")
+
 
 def clean_bibxxx():
     """